@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Compare fitbit.analytics with loops over the (datetime, value) tuples on
+years of random 1 minute data: daily totals, hourly maximums, a rolling
+hourly mean and the totals of a dashboard from a RollupIndex
+
+    python benchmarks/bench_analytics.py [--years 3]
+
+numpy is used when it is installed.
+"""
+from __future__ import print_function
+
+import datetime
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fitbit import analytics
+from fitbit.series import IntradaySeries
+
+START = datetime.datetime(2012, 1, 1)
+
+
+def run(name, function):
+    started = time.time()
+    function()
+    print("%-40s %9.1f ms" % (name, (time.time() - started) * 1000))
+
+
+def loop_daily(pairs):
+    totals = {}
+    for timestamp, value in pairs:
+        day = timestamp.date()
+        totals[day] = totals.get(day, 0) + value
+    return sorted(totals.items())
+
+
+def loop_hourly_max(pairs):
+    maximums = {}
+    for timestamp, value in pairs:
+        hour = timestamp.replace(minute=0, second=0)
+        maximums[hour] = max(maximums.get(hour, value), value)
+    return sorted(maximums.items())
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--years", type="int", default=3, help="Number of years of data")
+    options, _ = parser.parse_args()
+
+    rnd = random.Random(0)
+    series = IntradaySeries(START, analytics.ONE_MINUTE,
+                            [rnd.randint(0, 150) for _ in range(options.years * 365 * 1440)])
+    pairs = list(series)
+    first, last = START.date(), series.end.date() - datetime.timedelta(days=1)
+    print("%d values, numpy %s" % (len(series), "installed" if analytics._numpy() else "not installed"))
+
+    run("loop daily totals", lambda: loop_daily(pairs))
+    run("analytics.daily", lambda: analytics.daily(series))
+    run("loop hourly maximums", lambda: loop_hourly_max(pairs))
+    run("analytics.hourly max", lambda: analytics.hourly(series, how="max"))
+    run("analytics.rolling 1 hour mean", lambda: analytics.rolling(series, analytics.ONE_HOUR))
+
+    index = analytics.RollupIndex()
+    run("RollupIndex.add", lambda: [index.add(series[i:i + 1440]) for i in range(0, len(series), 1440)])
+    run("RollupIndex first query", lambda: index.total(series.start, series.end))
+    run("RollupIndex daily, all days", lambda: index.daily(first, last))
+    run("RollupIndex 1000 range totals", lambda: [index.total(START + datetime.timedelta(hours=i),
+                                                             START + datetime.timedelta(hours=i + 24 * 7))
+                                                  for i in range(1000)])
+    today = series[len(series) - 1440:]
+    run("RollupIndex update today then query", lambda: (index.add(today), index.total(series.start, series.end)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Compare the per-day CSV directories of examples/dump.py with fitbit.archive
+on a year of synthetic steps and sleep data: write, reload and disk usage
+
+    python benchmarks/bench_archive.py [--days 365]
+"""
+from __future__ import print_function
+
+import datetime
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fitbit.archive import SeriesArchive, convert_csv_dump
+from fitbit.client import Client
+from fitbit.replay import SyntheticOpener
+from fitbit.timestamps import parse_datetime
+
+START = datetime.date(2014, 1, 1)
+
+
+def write_csv(directory, data):
+    for (metric, date), values in data:
+        day_directory = "%s/%i/%s" % (directory, date.year, date)
+        if not os.path.isdir(day_directory):
+            os.makedirs(day_directory)
+        with open("%s/%s.csv" % (day_directory, metric), "w") as f:
+            f.write("\n".join(["%s,%s" % (str(ts), v) for ts, v in values]))
+
+
+def read_csv(directory, data):
+    for (metric, date), _ in data:
+        with open("%s/%i/%s/%s.csv" % (directory, date.year, date, metric)) as f:
+            [(parse_datetime(ts), int(v)) for ts, v in (line.rsplit(",", 1) for line in f)]
+
+
+def disk_usage(directory):
+    files = size = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(root, filename))
+    return files, size
+
+
+def run(name, function):
+    started = time.time()
+    function()
+    print("%-35s %8.0f ms" % (name, (time.time() - started) * 1000))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--days", type="int", default=365, help="Number of days of data")
+    options, _ = parser.parse_args()
+
+    client = Client(1, SyntheticOpener())
+    days = [START + datetime.timedelta(days=i) for i in range(options.days)]
+    data = [(("steps", date), list(client.intraday_steps(date))) for date in days] + \
+           [(("sleep", date), list(client.intraday_sleep(date))) for date in days]
+
+    directory = tempfile.mkdtemp()
+    try:
+        csv_directory = os.path.join(directory, "csv")
+        run("csv write", lambda: write_csv(csv_directory, data))
+        run("csv read", lambda: read_csv(csv_directory, data))
+        for compress in (True, False):
+            archive_directory = os.path.join(directory, "archive-%s" % ("zlib" if compress else "raw"))
+            archive = SeriesArchive(archive_directory, compress=compress)
+            label = "archive %s" % ("zlib" if compress else "raw")
+            run("%s write" % label, lambda: [archive.write("me", metric, date, values)
+                                             for (metric, date), values in data])
+            reader = SeriesArchive(archive_directory)
+            run("%s read" % label, lambda: [reader.read("me", metric, date) for (metric, date), _ in data])
+            run("%s read arrays" % label, lambda: [reader.arrays("me", metric, date) for (metric, date), _ in data])
+            reader.close()
+        converted = SeriesArchive(os.path.join(directory, "converted"))
+        run("convert_csv_dump", lambda: convert_csv_dump(csv_directory, converted, "me"))
+        for name in sorted(os.listdir(directory)):
+            files, size = disk_usage(os.path.join(directory, name))
+            print("%-35s %8d files %8d KiB" % (name, files, size // 1024))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Run the Client calls over years of synthetic fixtures, without network
+
+    python benchmarks/bench_client.py [--years 2] [--fixtures DIR]
+
+The fixtures are recorded from fitbit.replay.SyntheticOpener (in a
+temporary directory unless --fixtures is given, where they are kept and
+reused), then each workload replays them with fitbit.replay.ReplayOpener.
+The throughput is measured first; the workload then runs again under
+tracemalloc for the peak memory and the memory still allocated once its
+results are dropped.
+"""
+from __future__ import print_function
+
+import datetime
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fitbit.client import Client
+from fitbit.replay import RecordingOpener, ReplayOpener, SyntheticOpener
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+END = datetime.date(2014, 12, 31)
+
+
+def workloads(client, days):
+    """[(name, function returning the number of values decoded), ...]"""
+    def intraday(method):
+        return lambda: sum(len(list(method(day))) for day in days)
+
+    def intraday_compact(method):
+        return lambda: sum(len(method(day, compact=True)) for day in days)
+
+    def activity_logs():
+        return sum(len(list(client.activity_logs(day))) for day in days)
+
+    def activity_log_data_all():
+        return sum(len(client.activity_log_data_all(day, log[0]))
+                   for day in days for log in client.activity_logs(day))
+
+    def intraday_range():
+        return sum(len(series) for _, series in client.intraday_range("steps", days[0], days[-1], compact=True))
+
+    return [("intraday_steps", intraday(client.intraday_steps)),
+            ("intraday_steps compact", intraday_compact(client.intraday_steps)),
+            ("intraday_calories_burned", intraday(client.intraday_calories_burned)),
+            ("intraday_floor_climbed", intraday(client.intraday_floor_climbed)),
+            ("intraday_sleep", intraday(client.intraday_sleep)),
+            ("intraday_sleep compact", intraday_compact(client.intraday_sleep)),
+            ("activity_logs", activity_logs),
+            ("activity_log_data_all", activity_log_data_all),
+            ("intraday_range steps compact", intraday_range)]
+
+
+def measure(function):
+    started = time.time()
+    values = function()
+    elapsed = time.time() - started
+    peak = retained = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+        del result
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    return values, elapsed, peak, retained
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--years", type="int", default=2, help="Number of years of data")
+    parser.add_option("--fixtures", help="Directory of the fixtures, recorded if missing")
+    options, _ = parser.parse_args()
+
+    days = [END - datetime.timedelta(days=i) for i in range(365 * options.years)][::-1]
+    directory = options.fixtures or tempfile.mkdtemp()
+    try:
+        if not os.path.isdir(directory) or not os.listdir(directory):
+            recorder = RecordingOpener(SyntheticOpener(), directory)
+            client = Client(1, recorder)
+            for _, function in workloads(client, days):
+                function()
+            print("recorded %d responses in %s" % (recorder.recorded, directory))
+
+        opener = ReplayOpener(directory)
+        client = Client(1, opener)
+        print("%-30s %9s %12s %12s %10s %12s" % ("", "requests", "values/s", "requests/s", "peak KiB", "retained KiB"))
+        for name, function in workloads(client, days):
+            replayed = opener.replayed
+            values, elapsed, peak, retained = measure(function)
+            requests = opener.replayed - replayed
+            if tracemalloc is not None:
+                requests //= 2
+            print("%-30s %9d %12.0f %12.0f %10s %12s" % (
+                name, requests, values / elapsed, requests / elapsed,
+                "-" if peak is None else peak // 1024, "-" if retained is None else retained // 1024))
+    finally:
+        if not options.fixtures:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""Compare the decoding of a month of 5 minute getNewGraphData points:
+stdlib json with (datetime, value) tuples against Client.json_decoder with
+compact arrays (fitbit.decoders.datapoint_days)
+
+    python benchmarks/bench_decoders.py
+"""
+from __future__ import print_function
+
+import datetime
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fitbit.client import FIVE_MINUTES, Client
+from fitbit.decoders import JSON_BACKENDS, JSONDecoder, json_backend
+
+START = datetime.datetime(2014, 5, 1)
+DAYS = 31
+POINTS = [{"dateTime": (START + FIVE_MINUTES * i).strftime("%Y-%m-%d %H:%M:%S"), "value": str(i % 97)}
+          for i in range(288 * DAYS)]
+BODY = json.dumps({"graph": {"dataSets": {"activity": {"dataPoints": POINTS}}}}).encode("utf8")
+FIRST, LAST = START.date(), START.date() + datetime.timedelta(days=DAYS - 1)
+
+
+def run(name, function, repeat=5):
+    best = min(timeit.repeat(function, number=1, repeat=repeat))
+    print("%-45s %8.1f ms" % (name, best * 1000))
+
+
+def main():
+    run("stdlib json, tuples", lambda: Client._decode_range(json.loads(BODY), FIRST, LAST))
+    run("stdlib json, arrays", lambda: Client._decode_range(json.loads(BODY), FIRST, LAST, compact=True))
+    for backend in JSON_BACKENDS:
+        try:
+            json_backend(backend)
+        except ValueError:
+            print("%s not installed, skipped" % backend)
+            continue
+        decode = JSONDecoder(backend)
+        run("%s, parse only" % backend, lambda: decode(BODY))
+        run("%s, arrays" % backend, lambda: Client._decode_range(decode(BODY), FIRST, LAST, compact=True))
+
+if __name__ == "__main__":
+    main()
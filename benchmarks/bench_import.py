@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Time "import fitbit" in fresh interpreters and check that it stays lazy
+
+    python benchmarks/bench_import.py [--runs 20]
+
+The import must not configure logging, create files, nor load the HTTP
+stack or the XML parser; the script exits with an error if it does.
+"""
+from __future__ import print_function
+
+import optparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules that "import fitbit" must not load
+HEAVY_MODULES = ("urllib.request", "urllib2", "http.client", "httplib", "http.cookiejar", "cookielib",
+                 "xml.etree.ElementTree", "email.utils", "sqlite3", "ssl")
+
+CHECK = """
+import logging, sys
+import fitbit
+heavy = [name for name in %r if name in sys.modules]
+assert not heavy, "import fitbit loaded " + ", ".join(heavy)
+assert not logging.getLogger().handlers, "import fitbit configured logging"
+""" % (HEAVY_MODULES,)
+
+
+def run(code, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.check_call([sys.executable, "-c", code], cwd=cwd, env=env)
+
+
+def best_time(code, cwd, runs):
+    times = []
+    for _ in range(runs):
+        started = time.time()
+        run(code, cwd)
+        times.append(time.time() - started)
+    return min(times)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--runs", type="int", default=20, help="Number of interpreters started per measure")
+    options, _ = parser.parse_args()
+
+    cwd = tempfile.mkdtemp()
+    try:
+        run(CHECK, cwd)
+    except subprocess.CalledProcessError:
+        sys.exit("import fitbit is not side-effect free")
+    if os.listdir(cwd):
+        sys.exit("import fitbit created %s" % ", ".join(os.listdir(cwd)))
+
+    baseline = best_time("pass", cwd, options.runs)
+    for statement in ("import fitbit", "import fitbit.client", "from fitbit import Client; Client.login"):
+        elapsed = best_time(statement, cwd, options.runs)
+        print("%-45s %7.1f ms" % (statement, (elapsed - baseline) * 1000))
+
+
+if __name__ == "__main__":
+    main()
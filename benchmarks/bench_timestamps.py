@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""Compare the timestamp decoding of fitbit.timestamps with strptime (and
+dateutil when it is installed) on a day of minute data points
+
+    python benchmarks/bench_timestamps.py
+"""
+from __future__ import print_function
+
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fitbit.timestamps import TimeOfDayDecoder, parse_datetime
+
+START = datetime.datetime(2014, 5, 16)
+MINUTES = [START + datetime.timedelta(minutes=i) for i in range(1440)]
+ISO = [t.strftime("%Y-%m-%dT%H:%M:%S") for t in MINUTES]
+ISO_TZ = [t.strftime("%Y-%m-%dT%H:%M:%S.000-07:00") for t in MINUTES]
+TIMES = [t.strftime("%I:%M%p") for t in MINUTES]
+
+
+def run(name, function, values, repeat=5):
+    best = min(timeit.repeat(lambda: [function(value) for value in values], number=1, repeat=repeat))
+    print("%-40s %10.0f values/s" % (name, len(values) / best))
+
+
+def main():
+    run("strptime iso", lambda value: datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S"), ISO)
+    run("parse_datetime iso", parse_datetime, ISO)
+    run("parse_datetime iso with offset", lambda value: parse_datetime(value, keep_tz=True), ISO_TZ)
+    try:
+        import dateutil.parser
+    except ImportError:
+        print("dateutil not installed, skipped")
+    else:
+        run("dateutil iso with offset", dateutil.parser.parse, ISO_TZ)
+    run("strptime time of day", lambda value: datetime.datetime.strptime(value, "%I:%M%p").time(), TIMES)
+    run("TimeOfDayDecoder, first night", lambda value: TimeOfDayDecoder()(value), TIMES)
+    run("TimeOfDayDecoder, next nights", TimeOfDayDecoder(), TIMES)
+
+if __name__ == "__main__":
+    main()
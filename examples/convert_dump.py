@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Convert the CSV files written by dump.py (one directory per day) into a
+fitbit.archive.SeriesArchive:
+
+$ python convert_dump.py <dump directory> <archive directory> -e <email>
+
+With --all, every sub-directory of the dump directory is converted as the
+account named after it, as written by dump.py --all. The CSV files are left
+untouched.
+"""
+from __future__ import print_function
+
+import os
+import sys
+from optparse import OptionParser
+
+sys.path.append(os.getcwd())
+
+import fitbit
+from fitbit.archive import convert_csv_dump
+
+parser = OptionParser(usage="%prog [options] <dump directory> <archive directory>")
+parser.add_option("-e", "--email", dest="email", help="Account the dump belongs to.")
+parser.add_option("-a", "--all", action="store_true", dest="all", help="Convert every account sub-directory of the dump directory.")
+parser.add_option("--raw", action="store_true", dest="raw", help="Do not compress the archive, so that its values can be memory-mapped.")
+(options, args) = parser.parse_args()
+
+if len(args) != 2 or not (options.all or options.email):
+    parser.error("Give the dump and archive directories, and --email or --all")
+
+if __name__ == '__main__':
+    dump_directory, archive_directory = args
+    archive = fitbit.SeriesArchive(archive_directory, compress=not options.raw)
+    if options.all:
+        accounts = [(name, os.path.join(dump_directory, name)) for name in sorted(os.listdir(dump_directory))
+                    if os.path.isdir(os.path.join(dump_directory, name))]
+    else:
+        accounts = [(options.email, dump_directory)]
+    for account, directory in accounts:
+        print("Converting", account, "...")
+        skipped = []
+        print("  %d days" % convert_csv_dump(directory, archive, account, skipped))
+        for path, error in skipped:
+            print("  skipped %s: %s" % (path, error))
@@ -10,11 +10,14 @@ email2:[password2]
 
 Run with the following parameters:
 $ python dump.py <email> <password - optional> <directory>
+
+With --all, every account of ~/.fitbit is downloaded, each in a sub-directory
+named after its email. With --sessions, the logged in sessions are kept in a
+directory and the next runs only log in again when a session expired.
 """
 import datetime
 import os
 import sys
-import time
 import getpass
 from optparse import OptionParser
 
@@ -26,113 +29,144 @@ account_file="~/.fitbit"
 parser.add_option("-e", "--email", dest="email", help="Account email. Default to "+account_file+" account if only one is set.")
 parser.add_option("-p", "--pwd", dest="password", help="Account password. Can be saved in "+account_file+" as email:[pwd]")
 parser.add_option("-d", "--dir", dest="dir", help="Path to save your data.", default="data")
-parser.add_option("-c", "--continue",action="store_true", dest="continue_dumping_old", help="Continue sync even before last previously downloaded data.")
+parser.add_option("-c", "--continue",action="store_true", dest="continue_dumping_old", help="Also sync the missing days before the last previously downloaded data.")
 parser.add_option("-f", "--force",action="store_true", dest="force", help="Force re-downloading of each days.")
 parser.add_option("-s", "--start-date", dest="start_date", help="Minimal date to check. Default is 2010-01-01 .", default="2010-01-01")
-parser.add_option("-m", "--max-empty-days", dest="nEmptyDayMax",default=10, help="Number of no-data days after which we stop. Default is 10.")
+parser.add_option("-m", "--max-empty-days", dest="nEmptyDayMax", type="int", help="Ignored, kept for the existing scripts: the days without steps are skipped, however many there are.")
+parser.add_option("-w", "--workers", dest="workers", type="int", default=4, help="Number of concurrent requests. Default is 4.")
+parser.add_option("--cache", dest="cache", help="Directory where to cache the server responses, so that re-running skips the days that can no longer change.")
+parser.add_option("-r", "--rate", dest="rate", type="float", default=1.0, help="Maximum number of requests per second. Default is 1.")
+parser.add_option("-a", "--all", action="store_true", dest="all", help="Download every account of "+account_file+", each in a sub-directory of the data directory.")
+parser.add_option("--sessions", dest="sessions", help="Directory where to keep the logged in sessions, so that the next runs do not log in again.")
+parser.add_option("--archive", action="store_true", dest="archive", help="Save the data in a fitbit.archive.SeriesArchive in the data directory instead of one CSV file per day and metric.")
+parser.add_option("--max-rate", dest="max_rate", type="float", help="Let the rate grow up to this number of requests per second, slowing down when the server throttles.")
 (options, args) = parser.parse_args()
 
-ACCOUNTS_FILE=os.path.expanduser(account_file)
-if not options.email or not options.password:
-    if os.path.isfile(ACCOUNTS_FILE):
-        fp = open(ACCOUNTS_FILE, "r")
-        accounts=[line.split(":") for line in fp.readlines()]
-    else:
-        accounts=[]
+if options.nEmptyDayMax is not None:
+    print >>sys.stderr, "Warning: --max-empty-days is ignored, the days without steps are skipped"
 
-if not options.email:
-    if len(accounts)==1: 
-        options.email = accounts[0][0].strip()
-    else:
-        print "No account set. Please read the help by running:\n      ",sys.argv[0]," --help"
-        exit(0)
-
-print "Downloading data for account : ", options.email
-if not options.password:
-    options.password = [account[1] for account in accounts if account[0] == options.email][0].strip()
-    if options.password:
+ACCOUNTS_FILE=os.path.expanduser(account_file)
+if os.path.isfile(ACCOUNTS_FILE):
+    fp = open(ACCOUNTS_FILE, "r")
+    accounts=[[part.strip() for part in line.split(":", 1)] for line in fp.readlines() if line.strip()]
+else:
+    accounts=[]
+passwords = dict((account[0], account[1] if len(account) > 1 else "") for account in accounts)
+
+if options.all:
+    emails = [account[0] for account in accounts]
+elif options.email:
+    emails = [options.email]
+elif len(accounts)==1:
+    emails = [accounts[0][0]]
+else:
+    print "No account set. Please read the help by running:\n      ",sys.argv[0]," --help"
+    exit(0)
+
+for email in emails:
+    print "Downloading data for account : ", email
+    if options.password and email == emails[0]:
+        passwords[email] = options.password
+    elif passwords.get(email):
         print "  Using password from config file"
     else:
-        password = getpass.getpass("Enter your password:")
+        passwords[email] = getpass.getpass("Enter the password of %s:" % email)
 
 print "  Saving in : ", options.dir
+
+def account_dir(account):
+    return os.path.join(options.dir, account) if options.all else options.dir
+
 def dump_to_str(data):
     return "\n".join(["%s,%s" % (str(ts), v) for ts, v in data])
 
-def dump_to_file(data_type, date, data):
-    directory = "%s/%i/%s" % (options.dir, date.year, date)
+# With --archive, the data is appended to one compressed file per account, metric and year
+archive = fitbit.SeriesArchive(os.path.join(options.dir, "archive")) if options.archive else None
+
+def dump_to_file(account, data_type, date, data):
+    if archive is not None:
+        archive.write(account, data_type, date, data)
+        return
+    directory = "%s/%i/%s" % (account_dir(account), date.year, date)
     if not os.path.isdir(directory):
         os.makedirs(directory)
     with open("%s/%s.csv" % (directory, data_type), "w") as f:
         f.write(dump_to_str(data))
-    time.sleep(1)
-
-def previously_dumped(date):
-    return os.path.isdir("%s/%i/%s" % (options.dir, date.year, date))
-
-def dump_day(c, date):
-    steps = c.intraday_steps(date)
-    # Assume that if no steps were recorded then there is no data
-    if sum([s[1] for s in steps]) == 0:
-        return False
-
-    dump_to_file("steps", date, steps)
-    #dump_to_file("calories", date, c.intraday_calories_burned(date))
-    #dump_to_file("floor", date, c.intraday_floor_climbed(date))
-    #dump_to_file("active_score", date, c.intraday_active_score(date))
-    dump_to_file("sleep", date, c.intraday_sleep(date))
-    detailed=["CaloriesBurned","Steps","Floors","Pace"]
-    data=c._get_day_details(detailed,date)
-    for datatype in detailed:
-        dump_to_file(datatype, date, data[datatype])
-    return True
+
+# The day details and the files they are saved in
+DETAILED={"calories": "CaloriesBurned", "steps": "Steps", "floors": "Floors", "pace": "Pace"}
+
+def has_steps(account, date):
+    if archive is not None:
+        return archive.has(account, "steps", date)
+    return os.path.isfile("%s/%i/%s/steps.csv" % (account_dir(account), date.year, date))
+
+def dump_day_data(account, metric, date, data):
+    if metric == "steps":
+        # Assume that if no steps were recorded then there is no data
+        if sum([s[1] for s in data]) == 0:
+            return
+    elif not has_steps(account, date):
+        return
+    print "Syncing ", account, date, metric
+    if metric == "details":
+        for name, datatype in DETAILED.items():
+            dump_to_file(account, datatype, date, data[name])
+    else:
+        dump_to_file(account, metric, date, data)
+
+def details_fetcher(account):
+    def fetch_details(c, dates):
+        # The details need an annotation to be created then deleted: skip the days without data.
+        # The days are fetched together, each POST deleting an annotation and creating the next one
+        with_steps = [date for date in dates if has_steps(account, date)]
+        skipped = set(dates) - set(with_steps)
+        for date in dates:
+            if date in skipped:
+                yield date, None
+        for date, details in c.day_details(with_steps, list(DETAILED)):
+            yield date, details
+    return fetch_details
 
 if __name__ == '__main__':
     #import logging
     #logging.basicConfig(level=logging.DEBUG)
-    client = fitbit.Client.login(options.email, options.password)
-
-    sync_date = datetime.date.today()
-
-    # Look for the most recent data on server
-    while (datetime.date.today() - sync_date).days < 365:
-        r = dump_day(client, sync_date)
-        if r:
-            break
-        sync_date -= datetime.timedelta(days=1)
-    print "Most recent fitbit data on server : ", sync_date
-
-    if (datetime.date.today() - sync_date).days > 365:
-        print "No data found for last year, exiting."
-        sys.exit(1)
-
-    # Sync of new days
-    date=sync_date - datetime.timedelta(days=1)
-    nEmptyDay = 0
-    while not previously_dumped(date):
-        print "Syncing ", date
-        r = dump_day(client, date)
-        date -= datetime.timedelta(days=1)
-        if not r:
-            nEmptyDay+=1
-            if nEmptyDay>options.nEmptyDayMax:
-                print "More than ",options.nEmptyDayMax, " days without steps, exiting."
-                break
+    if options.sessions:
+        sessions = fitbit.SessionManager(options.sessions, passwords)
+    else:
+        sessions = None
+    # One request budget shared by every worker and account, instead of sleeping after each file
+    fetcher = fitbit.Fetcher(workers=options.workers,
+                             rate_limiter=fitbit.RateLimiter(options.rate, max_rate=options.max_rate))
+    # The days already downloaded, and whether the download was made after the end
+    # of the day, are kept in a state file: only the missing or incomplete days are
+    # downloaded and an interrupted sync resumes where it stopped.
+    state = fitbit.SyncState(os.path.join(options.dir, "sync_state.json"))
+
+    for email in emails:
+        if sessions is not None:
+            client = sessions.client(email)
         else:
-            nEmptyDay = 0
-
-    # Always redump the last dumped day because we may have dumped it before the day was finished.
-    print "Syncing ", date, " again (it was last sync, so probably before the day was finished)"
-    dump_day(client, date)
-    if options.continue_dumping_old:
-        end_date=date
-        date=min(end_date,sync_date)
+            client = fitbit.Client.login(email, passwords[email])
+        client.rate_limiter = fetcher.rate_limiter
+        if options.cache:
+            client.cache = fitbit.ResponseCache(options.cache)
+        # The identical requests of the metrics and workers are only sent once
+        client.memo = fitbit.RequestMemo()
+
+        # The steps are downloaded first: the sleep and details of the days without
+        # steps are not downloaded
+        engine = fitbit.SyncEngine(client, state, dump_day_data, metrics=["steps", "sleep"],
+                                        range_fetchers={"details": details_fetcher(email)}, account=email,
+                                        fetcher=fetcher, skip_empty=True)
+        #engine.metrics += ["calories_burned", "floor_climbed", "active_score"]
+
         start_date = datetime.datetime.strptime(options.start_date,'%Y-%m-%d').date()
-        while date > start_date:
-	    if options.force or not previously_dumped(date):
-	        r = dump_day(client, date)
-                print "Syncing ", date, ", data : ",r 
-            else:
-                print "Already synced : ", date
-            date -= datetime.timedelta(days=1) 
-    print "Done."
+        last_synced = state.high_water(email, "steps")
+        if last_synced and not options.continue_dumping_old and not options.force:
+            start_date = last_synced
+        print "Syncing ", email, " from ", start_date
+        fetched = engine.run(start_date, datetime.date.today(), force=options.force)
+        print "Done: ", fetched
+        if sessions is not None:
+            sessions.save(email)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Synchronise every account of ~/.fitbit (email:password lines, see dump.py)
+into a fitbit.archive.SeriesArchive with worker processes sharing a
+fitbit.fleet.WorkQueue:
+
+$ python fleet_sync.py -d <directory> -n 8
+
+The queue, the sessions and the archive are kept in the directory. Each run
+queues the days since the last ones synchronised (the last two days again,
+as they can still change), then runs the jobs. With --no-add, only the jobs
+already queued are run: other hosts sharing the directory can do so to help.
+"""
+from __future__ import print_function
+
+import datetime
+import os
+import sys
+from optparse import OptionParser
+
+sys.path.append(os.getcwd())
+
+import fitbit
+from fitbit.fleet import FleetRunner, WorkQueue
+
+parser = OptionParser()
+parser.add_option("-d", "--dir", dest="dir", help="Directory of the queue, sessions and archive.", default="data")
+parser.add_option("-n", "--processes", dest="processes", type="int", default=4, help="Number of worker processes. Default is 4.")
+parser.add_option("-r", "--rate", dest="rate", type="float", default=1.0, help="Maximum number of requests per second and account. Default is 1.")
+parser.add_option("-s", "--start-date", dest="start_date", help="First day to synchronise. Default is 2010-01-01 .", default="2010-01-01")
+parser.add_option("-m", "--metric", dest="metrics", action="append", help="Metric to synchronise, can be repeated. Default is steps.")
+parser.add_option("--no-add", action="store_true", dest="no_add", help="Do not queue new jobs, only run the queued ones.")
+(options, args) = parser.parse_args()
+
+ACCOUNTS_FILE = os.path.expanduser("~/.fitbit")
+MUTABLE_DAYS = 2
+
+
+def read_credentials():
+    if not os.path.isfile(ACCOUNTS_FILE):
+        return {}
+    with open(ACCOUNTS_FILE) as f:
+        accounts = [[part.strip() for part in line.split(":", 1)] for line in f if line.strip()]
+    return dict((account[0], account[1] if len(account) > 1 else "") for account in accounts)
+
+
+class Clients(object):
+    """Client factory of the workers: one SessionManager per process"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sessions = None
+
+    def __call__(self, email):
+        if self.sessions is None:
+            self.sessions = fitbit.SessionManager(os.path.join(self.directory, "sessions"), read_credentials())
+        client = self.sessions.client(email)
+        self.sessions.save(email)
+        return client
+
+
+class ArchiveSink(object):
+    """Sink factory of the workers: one SeriesArchive per process"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self):
+        return fitbit.SeriesArchive(os.path.join(self.directory, "archive")).sink()
+
+
+if __name__ == '__main__':
+    if not os.path.isdir(options.dir):
+        os.makedirs(options.dir)
+    path = os.path.join(options.dir, "queue.sqlite")
+    if not options.no_add:
+        start = datetime.datetime.strptime(options.start_date, "%Y-%m-%d").date()
+        today = datetime.date.today()
+        queue = WorkQueue(path)
+        for email in sorted(read_credentials()):
+            for metric in options.metrics or ["steps"]:
+                last = queue.last_done(email, metric)
+                first = max(start, last - datetime.timedelta(days=MUTABLE_DAYS - 1)) if last else start
+                print("Queued %d jobs for %s %s from %s" % (
+                    queue.add(email, metric, first, today, requeue=True), email, metric, first))
+        queue.close()
+    runner = FleetRunner(path, Clients(options.dir), ArchiveSink(options.dir),
+                         processes=options.processes, rate=options.rate)
+    counts = runner.run()
+    print("%(done)d jobs done, %(failed)d failed, %(pending)d pending" % counts)
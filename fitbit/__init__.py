@@ -1,3 +1,45 @@
-from fitbit.client import Client
+import importlib
+import sys
 
-__all__ = ["Client"]
\ No newline at end of file
+# The public names and their modules: on Python 3.7+ the modules are only
+# imported when one of their names is first used
+_EXPORTS = {
+    "Client": "fitbit.client",
+    "Fetcher": "fitbit.fetch",
+    "FetchJob": "fitbit.fetch",
+    "FleetRunner": "fitbit.fleet",
+    "IntradaySeries": "fitbit.series",
+    "Metrics": "fitbit.metrics",
+    "RateLimiter": "fitbit.fetch",
+    "RequestMemo": "fitbit.cache",
+    "ResponseCache": "fitbit.cache",
+    "RetryPolicy": "fitbit.retry",
+    "RollupIndex": "fitbit.analytics",
+    "SeriesArchive": "fitbit.archive",
+    "SessionManager": "fitbit.session",
+    "SQLiteStorage": "fitbit.storage",
+    "SyncEngine": "fitbit.sync",
+    "SyncState": "fitbit.sync",
+    "WorkQueue": "fitbit.fleet",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def _load(name):
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name not in _EXPORTS:
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+        return _load(name)
+
+    def __dir__():
+        return sorted(set(globals()) | set(__all__))
+else:
+    for _name in __all__:
+        _load(_name)
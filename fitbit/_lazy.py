@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Modules imported on first use, to keep "import fitbit" fast
+
+    urllib_request = LazyModule("urllib.request", "urllib2")
+    urllib_request.Request(url)  # imports urllib.request (or urllib2) now
+"""
+import importlib
+import threading
+
+_lock = threading.Lock()
+
+
+class LazyModule(object):
+    """The first of the named modules that can be imported (e.g. the Python 3
+    and 2 names of a module), imported on the first attribute access
+    """
+
+    def __init__(self, *names):
+        self._names = names
+        self._module = None
+
+    def _load(self):
+        with _lock:
+            if self._module is None:
+                for name in self._names[:-1]:
+                    try:
+                        self._module = importlib.import_module(name)
+                        break
+                    except ImportError:
+                        pass
+                else:
+                    self._module = importlib.import_module(self._names[-1])
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._module or self._load(), attribute)
+
+    def __repr__(self):
+        return "<lazy module %s>" % (self._module.__name__ if self._module else "|".join(self._names))
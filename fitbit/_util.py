@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the modules of the package"""
+import calendar
+import datetime
+import re
+import time
+from array import array
+
+# Elapsed time, for the durations measured and the timeouts
+_clock = getattr(time, "perf_counter", time.time)
+
+# Typecode of the 64 bit integer arrays: "q" is missing from Python 2 arrays,
+# where "l" is 64 bit on most platforms
+_INT64 = "q" if hasattr(array, "frombytes") else "l"
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+try:
+    from itertools import accumulate
+except ImportError:
+    def accumulate(iterable):
+        total = 0
+        for value in iterable:
+            total += value
+            yield total
+
+
+def _epoch(timestamp):
+    # Seconds since the epoch of a naive datetime (or of the midnight of a date)
+    return calendar.timegm(timestamp.timetuple())
+
+
+def _date(text):
+    # The datetime.date of a "YYYY-MM-DD" string
+    return datetime.date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+
+
+def _name(text):
+    # A file name made of text, e.g. an account email
+    return re.sub(r"[^A-Za-z0-9@._-]", "_", text)
+
+
+def _flush(sink):
+    # A sink with a flush() method (e.g. fitbit.storage.StorageSink) commits
+    # what it received before the caller records it as done
+    flush = getattr(sink, "flush", None)
+    if flush is not None:
+        flush()
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""asyncio variant of fitbit.Client (Python 3.6+)
+
+    import fitbit.aio
+
+    client = await fitbit.aio.AsyncClient.login(user, password)
+    data = await client.intraday_steps(datetime.date(2010, 2, 21))
+    await client.close()
+
+Requests go through a pluggable transport: any object with a
+``request(method, url, data=None)`` coroutine returning an AsyncResponse
+and a ``close()`` coroutine, and optionally a connection_errors tuple of
+the exception classes of its connection failures (retried as by Client).
+AiohttpTransport is used when aiohttp is installed, otherwise
+ExecutorTransport runs the blocking urllib opener in the event loop's
+executor.
+"""
+import asyncio
+import logging
+
+import http.cookiejar as cookielib
+from urllib.error import HTTPError
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from fitbit.batch import ServiceBatch
+from fitbit.client import Client, USER_AGENT, ACTIVITY_RECORD_GRAPHS, _ClientBase
+from fitbit.decoders import JSONDecoder, daily_totals
+from fitbit.details import (DELETE_ATTEMPTS, DayDetails, _create_annotation_call, _delete_annotation_call,
+                            _not_deleted, _undeleted)
+from fitbit.graphxml import parse_graph_values
+from fitbit.ranges import DataDays, IntradayRange, date_span
+from fitbit.retry import RetryPolicy, SessionExpired, connection_errors, retry_after
+from fitbit.series import SeriesFrame
+from fitbit.transport import DecompressionHandler
+
+_log = logging.getLogger("fitbit")
+
+
+class AsyncResponse(object):
+    """What a transport returns: the status, final url (after redirects) and body bytes"""
+
+    def __init__(self, status, url, body, headers=None):
+        self.status = status
+        self.url = url
+        self.body = body
+        self.headers = headers if headers is not None else {}
+
+
+class AiohttpTransport(object):
+    """Transport over an aiohttp ClientSession (created in the running loop if not given)"""
+
+    def __init__(self, session=None, limit=100):
+        import aiohttp
+        if session is None:
+            session = aiohttp.ClientSession(
+                headers={"User-Agent": USER_AGENT},
+                connector=aiohttp.TCPConnector(limit=limit))
+        self.session = session
+        self.connection_errors = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+    async def request(self, method, url, data=None):
+        async with self.session.request(method, url, data=data) as response:
+            return AsyncResponse(response.status, str(response.url), await response.read(), response.headers)
+
+    async def close(self):
+        await self.session.close()
+
+
+class ExecutorTransport(object):
+    """Transport running a urllib opener in an executor, for when aiohttp is not installed
+    This still uses a thread per in-flight request.
+    """
+
+    def __init__(self, opener=None, executor=None):
+        if opener is None:
+            opener = build_opener(HTTPCookieProcessor(cookielib.CookieJar()), DecompressionHandler())
+            opener.addheaders = [("User-agent", USER_AGENT)]
+        self.opener = opener
+        self.executor = executor
+        self.connection_errors = connection_errors()
+
+    async def request(self, method, url, data=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self._open, method, url, data)
+
+    def _open(self, method, url, data):
+        request = Request(url, data)
+        request.get_method = lambda: method
+        try:
+            response = self.opener.open(request)
+        except HTTPError as httperror:
+            response = httperror
+        try:
+            return AsyncResponse(response.getcode(), response.geturl(), response.read(), response.info())
+        finally:
+            response.close()
+
+    async def close(self):
+        pass
+
+
+def default_transport():
+    try:
+        return AiohttpTransport()
+    except ImportError:
+        return ExecutorTransport()
+
+
+class AsyncIntradayRange(IntradayRange):
+    """IntradayRange iterated with ``async for``, see AsyncClient.intraday_range"""
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        loop = asyncio.get_event_loop()
+        self.requests = 0
+        self.elapsed = 0.0
+        for date_from, date_to in self.plan():
+            started = loop.time()
+            if self.metric == "sleep":
+                days = [(date_from, await self.client.intraday_sleep(date_from, compact=self.compact))]
+            else:
+                graph_type = self.client._intraday_graph_type(self.metric)
+                days = await self.client._graphdata_range_request(graph_type, date_from, date_to, self.compact)
+            self.requests += 1
+            self.elapsed += loop.time() - started
+            for day in days:
+                yield day
+
+
+class AsyncServiceBatch(ServiceBatch):
+    """ServiceBatch of an AsyncClient, sent with ``await batch.send()`` or ``async with``"""
+
+    async def send(self):
+        posts = self.plan()
+        for post in posts:
+            self._received(post, await self.client._api2request_all([call.as_tuple() for call in post]))
+        self.requests += len(posts)
+        return len(posts)
+
+    def __enter__(self):
+        raise TypeError("use async with to send an AsyncServiceBatch")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.send()
+
+
+class AsyncDayDetails(DayDetails):
+    """DayDetails iterated with ``async for``, see AsyncClient.day_details"""
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        loop = asyncio.get_event_loop()
+        graph_types = dict(ACTIVITY_RECORD_GRAPHS)
+        self.requests = 0
+        self.elapsed = 0.0
+        self.days = 0
+        # Ids of the annotations created and not deleted yet, see DayDetails.__iter__
+        annotations = []
+        failed = False
+        try:
+            for date in self.dates:
+                started = loop.time()
+                batch = self.client.batch()
+                deleted = [batch.add(*_delete_annotation_call(annotation)) for annotation in annotations]
+                created = batch.add(*_create_annotation_call(date))
+                self.requests += await batch.send()
+                annotations = _undeleted(annotations, deleted)
+                result = created.result()
+                if result is None:
+                    raise ValueError("could not create an annotation on %s: %s" % (date, created.status))
+                annotation = result["id"]
+                annotations.append(annotation)
+                graphs = await asyncio.gather(*[
+                    self.client._activity_log_data(result["date"], annotation, graph_types[name])
+                    for name in self.details])
+                self.requests += len(graphs)
+                self.days += 1
+                self.elapsed += loop.time() - started
+                yield date, dict(zip(self.details, graphs))
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if annotations:
+                await self._delete_async(annotations, failed)
+
+    async def _delete_async(self, annotations, failed):
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        policy = self.client.retry_policy
+        for attempt in range(DELETE_ATTEMPTS):
+            if attempt and policy is not None:
+                await asyncio.sleep(policy.delay(attempt - 1))
+            batch = self.client.batch()
+            deleted = [batch.add(*_delete_annotation_call(annotation)) for annotation in annotations]
+            try:
+                self.requests += await batch.send()
+            except Exception:
+                _log.warning("could not delete the annotations %s", annotations, exc_info=True)
+                continue
+            annotations = _undeleted(annotations, deleted)
+            if not annotations:
+                break
+        self.elapsed += loop.time() - started
+        _not_deleted(annotations, failed)
+
+
+class AsyncClient(_ClientBase):
+    """Coroutine version of fitbit.Client, see the Client docstrings for the formats
+    The request parameters and the decoding of the responses are shared with Client.
+    The ranges and day details are iterated with ``async for``, the batches sent with
+    ``async with``. The session is not renewed: an expired one raises SessionExpired.
+    """
+
+    def __init__(self, user_id, transport, url_base="http://www.fitbit.com", csrfToken=''):
+        self.user_id = user_id
+        self.transport = transport
+        self.csrfToken = csrfToken
+        self.url_base = url_base
+        self.ajaxapi_batch_size = 10
+        self.retry_policy = RetryPolicy()
+        self.json_decoder = JSONDecoder()
+
+    async def close(self):
+        await self.transport.close()
+
+    async def intraday_calories_burned(self, date, compact=False):
+        return await self._graphdata_intraday_request("intradayCaloriesBurned", date, compact)
+
+    async def intraday_active_score(self, date, compact=False):
+        return await self._graphdata_intraday_request("intradayActiveScore", date, compact)
+
+    async def intraday_distance(self, date, compact=False):
+        return await self._graphdata_intraday_request("intradayActiveScore", date, compact)
+
+    async def intraday_floor_climbed(self, date, compact=False):
+        return await self._graphdata_intraday_request("intradayFloors", date, compact)
+
+    async def intraday_steps(self, date, compact=False):
+        return await self._graphdata_intraday_request("intradaySteps", date, compact)
+
+    async def intraday_sleep(self, date, sleep_id=None, compact=False):
+        params = self._graphdata_intraday_params("intradaySleep", date, data_version=2112, arg=sleep_id)
+        values = parse_graph_values([await self._request_bytes("/graph/getGraphData", params)])
+        return Client._decode_sleep(values, date, compact)
+
+    async def intraday(self, metric, date, compact=False):
+        if metric == "sleep":
+            return await self.intraday_sleep(date, compact=compact)
+        return await self._graphdata_intraday_request(self._intraday_graph_type(metric), date, compact)
+
+    def intraday_range(self, metric, start, end, days_per_request=31, compact=False):
+        """Returns an AsyncIntradayRange to iterate with ``async for``"""
+        return AsyncIntradayRange(self, metric, start, end, days_per_request, compact)
+
+    async def days_with_data(self, start, end, metric="steps", days_per_request=366):
+        """See Client.days_with_data, the spans of days are requested concurrently"""
+        graph_type = self._daily_graph_type(metric)
+        totals = dict((day, 0) for day in date_span(start, end))
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        spans = IntradayRange(self, metric, start, end, days_per_request).plan()
+        responses = await asyncio.gather(*[
+            self._request_json("/graph/getNewGraphData",
+                               self._graphdata_new_params(graph_type, date_to, dateFrom=str(date_from)))
+            for date_from, date_to in spans])
+        for json_data in responses:
+            for day, total in daily_totals(json_data).items():
+                if day in totals:
+                    totals[day] = total
+        return DataDays(totals, len(spans), loop.time() - started)
+
+    async def activity_logs(self, date):
+        json_data = await self._api2request(*self._activity_logs_call(date))
+        return self._decode_activity_logs(json_data, date)
+
+    async def activity_logs_range(self, start, end, page_size=100):
+        logs = dict((day, []) for day in date_span(start, end))
+        offset = 0
+        while True:
+            json_data = await self._api2request(*self._activity_logs_call(start, end, offset, page_size))
+            if not self._add_activity_logs(logs, json_data, start, page_size):
+                return logs
+            offset += page_size
+
+    def batch(self, batch_size=None):
+        """Returns an AsyncServiceBatch to send with ``async with`` or ``await batch.send()``"""
+        return AsyncServiceBatch(self, batch_size)
+
+    async def activity_log_data_calories(self, date, id):
+        return await self._activity_log_data(date, id, 'activityRecordCaloriesBurned')
+
+    async def activity_log_data_steps(self, date, id):
+        return await self._activity_log_data(date, id, 'activityRecordSteps')
+
+    async def activity_log_data_floors(self, date, id):
+        return await self._activity_log_data(date, id, 'activityRecordFloors')
+
+    async def activity_log_data_pace(self, date, id):
+        return await self._activity_log_data(date, id, 'activityRecordPace')
+
+    async def activity_log_data_all(self, date, id):
+        return list(await self.activity_log_frame(date, id))
+
+    async def activity_log_frame(self, date, id, columns=None):
+        # The series are independent: request them concurrently
+        if columns is None:
+            columns = [name for name, _ in ACTIVITY_RECORD_GRAPHS]
+        graph_types = dict(ACTIVITY_RECORD_GRAPHS)
+        series = await asyncio.gather(*[self._activity_log_data(date, id, graph_types[name]) for name in columns])
+        return SeriesFrame.align(zip(columns, series))
+
+    def day_details(self, dates, details=None):
+        """Returns an AsyncDayDetails to iterate with ``async for``"""
+        if details is None:
+            details = [name for name, _ in ACTIVITY_RECORD_GRAPHS]
+        return AsyncDayDetails(self, dates, details)
+
+    async def _graphdata_intraday_request(self, graph_type, date, compact=False):
+        params = self._graphdata_intraday_params(graph_type, date)
+        values = parse_graph_values([await self._request_bytes("/graph/getGraphData", params)])
+        return Client._decode_intraday(values, date, compact)
+
+    async def _graphdata_range_request(self, graph_type, date_from, date_to, compact=False):
+        params = self._graphdata_new_params(graph_type, date_to, dateFrom=str(date_from))
+        json_data = await self._request_json("/graph/getNewGraphData", params)
+        return Client._decode_range(json_data, date_from, date_to, compact)
+
+    async def _activity_log_data(self, date, id, chart_type):
+        json_data = await self._request_json("/graph/getNewGraphData", self._newgraph_params(chart_type, date, id))
+        return Client._decode_activity_log_data(json_data)
+
+    async def _api2request(self, id, name=None, method=None, args=None):
+        json_data = await self._request_json('/ajaxapi', self._api2request_data(id, name, method, args), "POST")
+        return Client._decode_api2response(json_data)
+
+    async def _api2request_all(self, calls):
+        return await self._request_json('/ajaxapi', self._api2request_data(calls), "POST")
+
+    async def _request_json(self, path, parameters, method="GET"):
+        return self.json_decoder(await self._request_raw(path, parameters, method))
+
+    async def _request_raw(self, path, parameters, method="GET"):
+        data = (await self._request_bytes(path, parameters, method)).strip()
+        _log.debug("response: %s", data)
+        return data
+
+    async def _request_bytes(self, path, parameters, method="GET"):
+        if method == "POST":
+            url = "%s%s" % (self.url_base, path)
+            data = self._post_data(parameters)
+        else:
+            url = self._request_url(path, parameters)
+            data = None
+        errors = getattr(self.transport, "connection_errors", None) or connection_errors()
+        # Retried as by Client._open, without logging in again
+        attempt = 0
+        while True:
+            _log.debug("requesting (%s): %s", method, url)
+            status = headers = None
+            try:
+                response = await self.transport.request(method, url, data)
+            except errors as connection_error:
+                error = connection_error
+            else:
+                if response.status < 400:
+                    # An expired session is redirected to the login page, see Client._open
+                    if Client._session_expired(response.url):
+                        raise SessionExpired("%s was redirected to the login page" % path)
+                    return response.body
+                status, headers = response.status, response.headers
+                error = HTTPError(url, status, "HTTP Error %d" % status, headers, None)
+            policy = self.retry_policy
+            if policy is None or attempt >= policy.retries or not policy.retryable(status, method, error):
+                raise error
+            delay = policy.delay(attempt, retry_after(headers))
+            _log.info("retrying %s in %.1fs after: %s", path, delay, error)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    async def login(email, password, base_url="https://www.fitbit.com", transport=None):
+        """Coroutine version of Client.login, returns an AsyncClient"""
+        if transport is None:
+            transport = default_transport()
+        # See Client.login: the login page needs the cookie of the home page
+        await transport.request("GET", base_url)
+        login_page = await transport.request("GET", base_url + "/login")
+        data = Client._login_form(login_page.body.decode("utf8"), email, password)
+
+        logged_in = await transport.request("POST", base_url + "/login", data)
+        if not Client._logged_in(logged_in.url):
+            await transport.close()
+            raise ValueError("Incorrect username or password.")
+        user_id, csrfToken = Client._parse_home_page(logged_in.body.decode("utf8"))
+        return AsyncClient(user_id, transport, base_url, csrfToken)
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""Aggregations of intraday series: resampling, daily and hourly totals,
+rolling statistics, sleep efficiency and precomputed rollups
+
+    steps = client.intraday_range("steps", start, end, compact=True)
+    daily(steps)                       # [(datetime.date, total), ...]
+    hourly(steps, how="max")           # IntradaySeries of the hourly maximums
+    rolling(steps, datetime.timedelta(hours=1))
+    sleep_stats(client.intraday_sleep(date, compact=True)).efficiency
+
+The functions take an IntradaySeries, a [(datetime.datetime, value), ...]
+list or the [(datetime.date, data), ...] days of intraday_range, and work
+on the arrays of values: with numpy when it is installed, otherwise with
+sums of slices of the arrays. RollupIndex keeps running totals of a metric
+up to date as days are added, so that the total of any range costs two
+lookups.
+"""
+import collections
+import datetime
+import math
+import operator
+from array import array
+from itertools import chain, islice, repeat
+
+from fitbit._util import _INT64, accumulate
+from fitbit.series import IntradaySeries, _seconds
+
+ONE_MINUTE = datetime.timedelta(minutes=1)
+ONE_HOUR = datetime.timedelta(hours=1)
+ONE_DAY = datetime.timedelta(days=1)
+
+AGGREGATIONS = ("sum", "mean", "min", "max")
+
+SleepStats = collections.namedtuple("SleepStats", "start end asleep awake very_awake efficiency")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _from_numpy(typecode, values):
+    # Copy a numpy array into an array of typecode
+    numpy = _numpy()
+    result = array(typecode)
+    data = numpy.ascontiguousarray(values, dtype=numpy.dtype(typecode)).tobytes()
+    if hasattr(result, "frombytes"):
+        result.frombytes(data)
+    else:
+        result.fromstring(data)
+    return result
+
+
+def _midnight(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _steps(delta, interval):
+    # Number of intervals in delta, which must be a whole number
+    steps = _seconds(delta) / _seconds(interval)
+    if steps != int(steps):
+        raise ValueError("%s is not a multiple of %s" % (delta, interval))
+    return int(steps)
+
+
+def as_series(data, interval=None, fill=0):
+    """Return data as a single IntradaySeries
+    data is an IntradaySeries, a [(datetime.datetime, value), ...] list or the
+    [(datetime.date, data), ...] days of intraday_range. The missing points,
+    including the gaps between days, are set to fill.
+    """
+    if isinstance(data, IntradaySeries):
+        return data
+    data = list(data)
+    if not data:
+        raise ValueError("no data")
+    if isinstance(data[0][0], datetime.datetime):
+        return IntradaySeries.from_pairs(data, interval, fill=fill)
+    days = [day if isinstance(day, IntradaySeries) else list(day) for _, day in data]
+    return _join([as_series(day, interval, fill) for day in days if len(day)], fill)
+
+
+def _join(series, fill):
+    if not series:
+        raise ValueError("no data")
+    series = sorted(series, key=lambda s: s.start)
+    first = series[0]
+    values = array(first.values.typecode, first.values)
+    for s in series[1:]:
+        if s.interval != first.interval:
+            raise ValueError("cannot join series every %s and %s" % (first.interval, s.interval))
+        gap = _steps(s.start - first.start, first.interval) - len(values)
+        if gap < 0:
+            raise ValueError("series starting at %s overlaps the previous one" % s.start)
+        values.extend(array(values.typecode, [fill]) * gap)
+        values.extend(s.values)
+    return IntradaySeries(first.start, first.interval, values)
+
+
+def _prefix_sums(values):
+    # _prefix_sums(values)[i] is the sum of values[:i]
+    numpy = _numpy()
+    if numpy is not None and values.typecode not in "fd":
+        sums = numpy.zeros(len(values) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.frombuffer(values, dtype=values.typecode), out=sums[1:])
+        return _from_numpy(_INT64, sums)
+    return array("d" if values.typecode in "fd" else _INT64, accumulate(chain([0], values)))
+
+
+def _reduce(values, bounds, how):
+    # Aggregate values[bounds[i]:bounds[i + 1]] for each i; no range is empty
+    if how not in AGGREGATIONS:
+        raise ValueError("Unknown aggregation: %s (one of %s)" % (how, ", ".join(AGGREGATIONS)))
+    starts, ends = bounds[:-1], bounds[1:]
+    if how in ("sum", "mean"):
+        numpy = _numpy()
+        if numpy is not None:
+            sums = _prefix_sums(values)
+            totals = numpy.frombuffer(sums, dtype=sums.typecode)
+            starts, ends = numpy.array(starts), numpy.array(ends)
+            result = totals[ends] - totals[starts]
+            if how == "mean":
+                return _from_numpy("d", result / (ends - starts).astype(float))
+            return _from_numpy(sums.typecode, result)
+        if how == "mean":
+            return array("d", [float(sum(values[start:end])) / (end - start) for start, end in zip(starts, ends)])
+        return array(_INT64 if values.typecode not in "fd" else "d",
+                     [sum(values[start:end]) for start, end in zip(starts, ends)])
+    numpy = _numpy()
+    if numpy is not None and len(starts):
+        reduce = numpy.maximum.reduceat if how == "max" else numpy.minimum.reduceat
+        return _from_numpy(values.typecode, reduce(numpy.frombuffer(values, dtype=values.typecode), starts))
+    reduce = max if how == "max" else min
+    return array(values.typecode, [reduce(values[start:end]) for start, end in zip(starts, ends)])
+
+
+def resample(data, interval, how="sum", fill=0):
+    """Aggregate data (see as_series) over buckets of interval, a multiple of its own interval
+    The buckets are aligned on midnight: the first and last ones may be partial.
+    how is one of AGGREGATIONS; the means are floats.
+    """
+    series = as_series(data, fill=fill)
+    ratio = _steps(interval, series.interval)
+    if ratio < 1:
+        raise ValueError("cannot resample a series every %s every %s" % (series.interval, interval))
+    lead = _steps(series.start - _midnight(series.start), series.interval) % ratio
+    start = series.start - series.interval * lead
+    if not len(series):
+        return IntradaySeries(start, interval, array("d" if how == "mean" else series.values.typecode))
+    bounds = [0] + list(range(ratio - lead, len(series), ratio)) + [len(series)]
+    return IntradaySeries(start, interval, _reduce(series.values, bounds, how))
+
+
+def daily(data, how="sum", fill=0):
+    """Return the [(datetime.date, value), ...] of each day of data, see resample"""
+    return [(timestamp.date(), value) for timestamp, value in resample(data, ONE_DAY, how, fill)]
+
+
+def hourly(data, how="sum", fill=0):
+    """Return the IntradaySeries of the hours of data, see resample"""
+    return resample(data, ONE_HOUR, how, fill)
+
+
+def rolling(data, window, how="mean", fill=0):
+    """Return the IntradaySeries of the sum or mean of the values over the window
+    (a timedelta or a number of points) ending at each point; the first points
+    use the values available
+    """
+    series = as_series(data, fill=fill)
+    if isinstance(window, datetime.timedelta):
+        window = _steps(window, series.interval)
+    if window < 1:
+        raise ValueError("the window must cover one point at least")
+    if how not in ("sum", "mean"):
+        raise ValueError("Unknown rolling aggregation: %s (sum or mean)" % how)
+    sums = _prefix_sums(series.values)
+    count = len(series)
+    numpy = _numpy()
+    if numpy is not None:
+        totals = numpy.frombuffer(sums, dtype=sums.typecode)
+        ends = numpy.arange(1, count + 1)
+        starts = numpy.maximum(ends - window, 0)
+        result = totals[ends] - totals[starts]
+        if how == "mean":
+            return IntradaySeries(series.start, series.interval, _from_numpy("d", result / (ends - starts).astype(float)))
+        return IntradaySeries(series.start, series.interval, _from_numpy(sums.typecode, result))
+    # The window ending at the point i (1-based) starts at max(i - window, 0)
+    starts = chain(repeat(0, min(window, count)), islice(sums, 1, max(count - window + 1, 1)))
+    totals = map(operator.sub, islice(sums, 1, None), starts)
+    if how == "mean":
+        sizes = chain(range(1, min(window, count) + 1), repeat(window))
+        return IntradaySeries(series.start, series.interval, array("d", map(operator.truediv, totals, sizes)))
+    return IntradaySeries(series.start, series.interval, array(sums.typecode, totals))
+
+
+def sleep_stats(data):
+    """Return the SleepStats of a sleep (see Client.intraday_sleep): the time asleep (1),
+    awake (2) and very awake (3), and the efficiency, the ratio of the time asleep to
+    the time in bed (the points without data are left out)
+    """
+    series = as_series(data)
+    asleep, awake, very_awake = [series.values.count(state) for state in (1, 2, 3)]
+    in_bed = asleep + awake + very_awake
+    return SleepStats(series.start, series.end,
+                      series.interval * asleep, series.interval * awake, series.interval * very_awake,
+                      float(asleep) / in_bed if in_bed else None)
+
+
+def sleep_efficiency(data):
+    """Return the efficiency of a sleep, see sleep_stats"""
+    return sleep_stats(data).efficiency
+
+
+class RollupIndex(object):
+    """Running totals of a metric on the grid of interval, kept up to date as data is added
+
+    add() the data (see as_series) as it is fetched, in any order; data
+    added again replaces the previous values. The index keeps the total of
+    the values before each block of BLOCK values: total(), mean() and
+    daily() cost two lookups and two sums of less than a block per range,
+    whatever its length. The totals are only recomputed from the first
+    changed block, on the next query.
+    """
+
+    BLOCK = 256
+
+    def __init__(self, interval=ONE_MINUTE):
+        self.interval = interval
+        self.start = None
+        self.values = array("i")
+        # _totals[k] is the sum of values[:k * BLOCK]
+        self._totals = array(_INT64, [0])
+
+    @classmethod
+    def from_archive(cls, archive, account, metric, start, end, interval=ONE_MINUTE):
+        """Build an index of the days from start to end of a fitbit.archive.SeriesArchive"""
+        index = cls(interval)
+        for ordinal in range(start.toordinal(), end.toordinal() + 1):
+            data = archive.read(account, metric, datetime.date.fromordinal(ordinal))
+            if data:
+                index.add(data)
+        return index
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def end(self):
+        """Time following the last value, None if the index is empty"""
+        return None if self.start is None else self.start + self.interval * len(self.values)
+
+    def add(self, data):
+        series = as_series(data, self.interval)
+        if series.interval != self.interval:
+            raise ValueError("cannot add a series every %s to an index every %s" % (series.interval, self.interval))
+        if not len(series):
+            return
+        if self.start is None:
+            # The index starts at midnight so that the days and hours are aligned
+            self.start = _midnight(series.start)
+        elif series.start < self.start:
+            missing = _steps(self.start - _midnight(series.start), self.interval)
+            self.values = array("i", [0]) * missing + self.values
+            self.start = _midnight(series.start)
+            del self._totals[1:]
+        offset = _steps(series.start - self.start, self.interval)
+        end = offset + len(series)
+        if end > len(self.values):
+            self.values.extend(array("i", [0]) * (end - len(self.values)))
+        self.values[offset:end] = series.values if series.values.typecode == "i" else array("i", series.values)
+        # The totals are valid up to the block of the first changed value
+        del self._totals[offset // self.BLOCK + 1:]
+
+    def _sum_to(self, index):
+        # Sum of values[:index]
+        block = index // self.BLOCK
+        totals = self._totals
+        if block >= len(totals):
+            values, size = self.values, self.BLOCK
+            for k in range(len(totals), len(self.values) // size + 1):
+                totals.append(totals[-1] + sum(values[(k - 1) * size:k * size]))
+        return totals[block] + sum(self.values[block * self.BLOCK:index])
+
+    def _index(self, timestamp):
+        # Index of the first point at or after timestamp, within [0, len(self)]
+        if self.start is None:
+            return 0
+        index = int(math.ceil(_seconds(timestamp - self.start) / _seconds(self.interval)))
+        return min(max(index, 0), len(self.values))
+
+    def total(self, start, end):
+        """Return the sum of the values from start (datetime.datetime) included to end excluded"""
+        first, last = self._index(start), self._index(end)
+        if last <= first:
+            return 0
+        return self._sum_to(last) - self._sum_to(first)
+
+    def mean(self, start, end):
+        """Return the mean of the values from start included to end excluded, None if there are none"""
+        first, last = self._index(start), self._index(end)
+        if last <= first:
+            return None
+        return float(self._sum_to(last) - self._sum_to(first)) / (last - first)
+
+    def daily(self, start, end):
+        """Return the [(datetime.date, total), ...] of the days from start to end, both included"""
+        result = []
+        for ordinal in range(start.toordinal(), end.toordinal() + 1):
+            midnight = datetime.datetime.combine(datetime.date.fromordinal(ordinal), datetime.time())
+            result.append((midnight.date(), self.total(midnight, midnight + ONE_DAY)))
+        return result
+
+    def resample(self, interval, start=None, end=None):
+        """Return the IntradaySeries of the totals over interval (a multiple of the index interval)
+        from start to end (datetime.datetime, the whole index by default); the buckets are aligned on midnight
+        """
+        if self.start is None:
+            raise ValueError("the index is empty")
+        ratio = _steps(interval, self.interval)
+        first = self._index(start) if start is not None else 0
+        last = self._index(end) if end is not None else len(self.values)
+        # The index starts at midnight, so the buckets start at multiples of ratio
+        first -= first % ratio
+        if last <= first:
+            return IntradaySeries(self.start + self.interval * first, interval, array(_INT64))
+        bounds = list(range(0, last - first, ratio)) + [last - first]
+        return IntradaySeries(self.start + self.interval * first, interval,
+                              _reduce(self.values[first:last], bounds, "sum"))
+
+    def __repr__(self):
+        return "<RollupIndex %s every %s, %d values>" % (self.start, self.interval, len(self.values))
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""Columnar archive of intraday data, one file per account, metric and year
+
+    archive = SeriesArchive("~/fitbit_archive")
+    archive.write(account, "steps", date, client.intraday_steps(date, compact=True))
+    archive.read(account, "steps", date)  # [(datetime.datetime, value), ...]
+
+<directory>/<account>/<metric>/<year>.fsa holds one chunk per day, appended
+as the days are written: the timestamps in seconds since the epoch of the
+naive (local) datetime, the first one followed by the deltas as
+little-endian 32 bit integers, then the values, as little-endian 32 bit
+integers, or 64 bit floats for a day with float values. The chunk payload
+is zlib compressed, or left raw with compress=False so that the value
+columns can be memory-mapped (see arrays()).
+
+<year>.idx is the index of the chunks: one fixed size record per written
+day, the last record of a day pointing to its current chunk. Writing a day
+again appends a new chunk; compact() rewrites the year without the
+replaced chunks.
+
+convert_csv_dump() imports the per-day CSV directories of examples/dump.py.
+"""
+import datetime
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from itertools import chain
+
+from fitbit._util import _EPOCH, _INT64, _epoch, _name, accumulate
+from fitbit.series import IntradaySeries, _seconds
+from fitbit.timestamps import parse_datetime
+
+# Chunk header: day ordinal, first timestamp, number of values, payload size, codec, value type
+CHUNK_HEADER = struct.Struct("<IqIIBB2x")
+# Index record: day ordinal, chunk offset, chunk size (header included), number of values
+INDEX_RECORD = struct.Struct("<IQII")
+
+RAW = 0
+ZLIB = 1
+
+# Value types of the chunks and their array typecodes
+INT32 = 0
+FLOAT64 = 1
+_TYPECODES = {INT32: "i", FLOAT64: "d"}
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _to_bytes(values):
+    if not _LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes() if hasattr(values, "tobytes") else values.tostring()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+class SeriesArchive(object):
+    """Archive of the (datetime.datetime, value) samples of each day, see the module docstring"""
+
+    def __init__(self, directory, compress=True):
+        self.directory = os.path.expanduser(directory)
+        self.compress = compress
+        # {(account, metric, year): {ordinal: (offset, size, count)}}
+        self._indexes = {}
+        # {path: mmap} of the files read with arrays()
+        self._maps = {}
+        self._lock = threading.RLock()
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                _close(mapped)
+            self._maps = {}
+
+    def write(self, account, metric, date, data):
+        """Store the samples of a day, an IntradaySeries or a [(datetime, value), ...] list
+        Returns the number of samples written
+        """
+        if isinstance(data, IntradaySeries):
+            first = _epoch(data.start)
+            deltas = array("i", [int(_seconds(data.interval))]) * max(len(data.values) - 1, 0)
+            values = data.values
+        else:
+            data = list(data)
+            first = _epoch(data[0][0] if data else datetime.datetime.combine(date, datetime.time()))
+            deltas = array("i", [(b - a).days * 86400 + (b - a).seconds
+                                 for (a, _), (b, _) in zip(data, data[1:])])
+            values = [value for _, value in data]
+        value_type = FLOAT64 if _has_floats(values) else INT32
+        values = array(_TYPECODES[value_type], values)
+        payload = _to_bytes(deltas) + _to_bytes(values)
+        codec = RAW
+        if self.compress:
+            payload, codec = zlib.compress(payload), ZLIB
+        # Chunks are kept 4 byte aligned for the memory-mapped value columns
+        payload += b"\0" * (-len(payload) % 4)
+        header = CHUNK_HEADER.pack(date.toordinal(), first, len(values), len(payload), codec, value_type)
+        chunk = header + payload
+
+        data_path, index_path = self._paths(account, metric, date.year)
+        with self._lock:
+            index = self._index(account, metric, date.year)
+            directory = os.path.dirname(data_path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(data_path, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(chunk)
+            # The index record is only written once its chunk is
+            with open(index_path, "ab") as f:
+                f.write(INDEX_RECORD.pack(date.toordinal(), offset, len(chunk), len(values)))
+            index[date.toordinal()] = (offset, len(chunk), len(values))
+        return len(values)
+
+    def has(self, account, metric, date):
+        return date.toordinal() in self._index(account, metric, date.year)
+
+    def days(self, account, metric, year):
+        """Return the sorted dates archived in the year"""
+        return [datetime.date.fromordinal(ordinal) for ordinal in sorted(self._index(account, metric, year))]
+
+    def arrays(self, account, metric, date):
+        """Return (timestamps, values) of a day, or None if it is not archived
+        timestamps is an array of seconds since the epoch. The values (ints, or
+        floats for a day written with float values) of a raw chunk are a memoryview
+        of the memory-mapped file on Python 3, an array otherwise.
+        """
+        entry = self._index(account, metric, date.year).get(date.toordinal())
+        if entry is None:
+            return None
+        offset, size, count = entry
+        data_path, _ = self._paths(account, metric, date.year)
+        mapped = self._map(data_path, offset + size)
+        chunk = mapped[offset:offset + size]
+        _, first, count, payload_size, codec, value_type = CHUNK_HEADER.unpack_from(chunk)
+        payload = chunk[CHUNK_HEADER.size:CHUNK_HEADER.size + payload_size]
+        if codec == ZLIB:
+            payload = zlib.decompress(payload)
+        deltas_size = 4 * max(count - 1, 0)
+        deltas = _from_bytes("i", payload[:deltas_size])
+        timestamps = array(_INT64, accumulate(chain([first], deltas)) if count else [])
+        typecode = _TYPECODES[value_type]
+        values_size = array(typecode).itemsize * count
+        if codec == RAW and _LITTLE_ENDIAN and hasattr(memoryview, "cast"):
+            start = offset + CHUNK_HEADER.size + deltas_size
+            values = memoryview(mapped)[start:start + values_size].cast(typecode)
+        else:
+            values = _from_bytes(typecode, payload[deltas_size:deltas_size + values_size])
+        return timestamps, values
+
+    def read(self, account, metric, date):
+        """Return the [(datetime.datetime, value), ...] of a day, or None if it is not archived"""
+        columns = self.arrays(account, metric, date)
+        if columns is None:
+            return None
+        timestamps, values = columns
+        return [(_EPOCH + datetime.timedelta(seconds=timestamp), value)
+                for timestamp, value in zip(timestamps, values)]
+
+    def samples(self, account, metric, start, end):
+        """Return the [(datetime.datetime, value), ...] of the days from start to end, both included"""
+        result = []
+        for ordinal in range(start.toordinal(), end.toordinal() + 1):
+            result.extend(self.read(account, metric, datetime.date.fromordinal(ordinal)) or [])
+        return result
+
+    def compact(self, account, metric, year):
+        """Rewrite the files of the year without the chunks of the days written again"""
+        data_path, index_path = self._paths(account, metric, year)
+        with self._lock:
+            index = self._index(account, metric, year)
+            if not index:
+                return
+            mapped = self._maps.pop(data_path, None)
+            if mapped is not None:
+                _close(mapped)
+            with open(data_path, "rb") as f:
+                chunks = []
+                for ordinal in sorted(index):
+                    offset, size, count = index[ordinal]
+                    f.seek(offset)
+                    chunks.append((ordinal, f.read(size), count))
+            records = []
+            with open(data_path + ".tmp", "wb") as f:
+                for ordinal, chunk, count in chunks:
+                    records.append((ordinal, f.tell(), len(chunk), count))
+                    f.write(chunk)
+            with open(index_path + ".tmp", "wb") as f:
+                f.write(b"".join(INDEX_RECORD.pack(*record) for record in records))
+            # An interruption between the renames leaves a new data file with the
+            # old index, whose offsets may be wrong: the index is rebuilt on load
+            os.rename(data_path + ".tmp", data_path)
+            os.rename(index_path + ".tmp", index_path)
+            self._indexes[(account, metric, year)] = dict((ordinal, (offset, size, count))
+                                                          for ordinal, offset, size, count in records)
+
+    def sink(self):
+        """Return a SyncEngine sink writing the days to this archive"""
+        def write(account, metric, date, data):
+            if data is not None:
+                self.write(account, metric, date, data)
+        return write
+
+    def _paths(self, account, metric, year):
+        directory = os.path.join(self.directory, _name(account), _name(metric))
+        return os.path.join(directory, "%d.fsa" % year), os.path.join(directory, "%d.idx" % year)
+
+    def _index(self, account, metric, year):
+        key = (account, metric, year)
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = self._indexes[key] = self._load_index(*self._paths(account, metric, year))
+        return index
+
+    @staticmethod
+    def _load_index(data_path, index_path):
+        index = {}
+        try:
+            with open(index_path, "rb") as f:
+                records = f.read()
+            data_size = os.path.getsize(data_path)
+        except (IOError, OSError):
+            records, data_size = b"", 0
+        # A record cut short by an interrupted write is ignored
+        for position in range(0, len(records) - INDEX_RECORD.size + 1, INDEX_RECORD.size):
+            ordinal, offset, size, count = INDEX_RECORD.unpack_from(records, position)
+            index[ordinal] = (offset, size, count)
+        if all(offset + size <= data_size for offset, size, _ in index.values()):
+            return index
+        return SeriesArchive._scan(data_path)
+
+    @staticmethod
+    def _scan(data_path):
+        # Rebuild the index from the chunk headers, the last chunk of a day winning
+        index = {}
+        with open(data_path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + CHUNK_HEADER.size <= len(data):
+            ordinal, _, count, payload_size, _, _ = CHUNK_HEADER.unpack_from(data, offset)
+            size = CHUNK_HEADER.size + payload_size
+            if offset + size > len(data):
+                break
+            index[ordinal] = (offset, size, count)
+            offset += size
+        return index
+
+    def _map(self, path, size):
+        with self._lock:
+            mapped = self._maps.get(path)
+            if mapped is None or len(mapped) < size:
+                if mapped is not None:
+                    _close(mapped)
+                with open(path, "rb") as f:
+                    mapped = self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return mapped
+
+
+def _close(mapped):
+    try:
+        mapped.close()
+    except BufferError:
+        # Values returned by arrays() still use it: it is closed once they are released
+        pass
+
+
+def _has_floats(values):
+    if isinstance(values, array):
+        return values.typecode in "fd"
+    return any(isinstance(value, float) for value in values)
+
+
+def convert_csv_dump(directory, archive, account, skipped=None):
+    """Import the <directory>/<year>/<date>/<metric>.csv files written by examples/dump.py
+    The values are stored as ints, or floats for the files with float values (e.g. the pace).
+    The files that cannot be read are skipped, and (path, error) appended to skipped if given.
+    Returns the number of days imported
+    """
+    days = 0
+    for year in sorted(os.listdir(directory)):
+        year_directory = os.path.join(directory, year)
+        if not year.isdigit() or not os.path.isdir(year_directory):
+            continue
+        for day in sorted(os.listdir(year_directory)):
+            day_directory = os.path.join(year_directory, day)
+            try:
+                date = datetime.datetime.strptime(day, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            for filename in sorted(os.listdir(day_directory)):
+                metric, extension = os.path.splitext(filename)
+                if extension != ".csv":
+                    continue
+                path = os.path.join(day_directory, filename)
+                try:
+                    with open(path) as f:
+                        data = [(parse_datetime(timestamp), _csv_value(value))
+                                for timestamp, value in (line.strip().rsplit(",", 1) for line in f if line.strip())]
+                except ValueError as error:
+                    if skipped is not None:
+                        skipped.append((path, str(error)))
+                    continue
+                archive.write(account, metric, date, data)
+            days += 1
+    return days
+
+
+def _csv_value(text):
+    # The CSV files hold ints, except the pace and the older details
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
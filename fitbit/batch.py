@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+
+class BatchCall(object):
+    """A service call queued in a ServiceBatch
+    Once the batch is sent, status holds the status of the call and result()
+    its result, or None if the call failed (like Client._api2request)
+    """
+
+    def __init__(self, id, name, method, args, decode=None):
+        self.id = id
+        self.name = name
+        self.method = method
+        self.args = args
+        self.decode = decode
+        self.status = None
+        self.sent = False
+        self._result = None
+
+    def result(self):
+        if not self.sent:
+            raise ValueError("the batch of %s has not been sent" % self.id)
+        if self.status != 200 or self._result is None:
+            return None
+        return self.decode(self._result) if self.decode else self._result
+
+    def as_tuple(self):
+        return (self.id, self.name, self.method, self.args)
+
+    def __repr__(self):
+        return "<BatchCall %s %s>" % (self.id, self.args)
+
+
+class ServiceBatch(object):
+    """Coalesces /ajaxapi service calls into as few POSTs as possible
+
+        with client.batch() as batch:
+            logs = batch.activity_logs(datetime.date(2014, 5, 16))
+            summary = batch.activity_logs_summary(datetime.date(2014, 5, 16))
+        logs.result(), summary.result()
+
+    A POST carries at most batch_size calls (Client.ajaxapi_batch_size by
+    default). The server keys the results by call id, so calls sharing an id
+    are spread over separate POSTs; give distinct ids to the calls that
+    should travel together. The ids of the calls queued by activity_logs()
+    and activity_logs_summary() include their date, so that the calls of
+    several dates travel together.
+    """
+
+    def __init__(self, client, batch_size=None):
+        self.client = client
+        self.batch_size = batch_size or client.ajaxapi_batch_size
+        self.calls = []
+        self.requests = 0
+
+    def add(self, id, name, method, args, decode=None):
+        """Queue a service call, returns its BatchCall
+        decode, if given, is applied to the result
+        """
+        call = BatchCall(id, name, method, args, decode)
+        self.calls.append(call)
+        return call
+
+    def activity_logs(self, date):
+        """Queue the activity logs of the given date, see Client.activity_logs"""
+        Client = type(self.client)
+        id, name, method, args = Client._activity_logs_call(date)
+        return self.add(_dated_id(id, date), name, method, args,
+                        decode=lambda json_data: Client._decode_activity_logs(json_data, date))
+
+    def activity_logs_summary(self, date):
+        """Queue the activity summary of the given date"""
+        return self.add(_dated_id("GET /api/2/user/activities/logs/summary", date), "user", "getActivitiesLogsSummary",
+                        {"fromDate": str(date), "toDate": str(date), "period": "day", "offset": 0, "limit": 10})
+
+    def plan(self):
+        """Return the lists of calls sent together, one list per POST"""
+        posts = []
+        for call in self.calls:
+            if call.sent:
+                continue
+            for post in posts:
+                if len(post) < self.batch_size and all(c.id != call.id for c in post):
+                    post.append(call)
+                    break
+            else:
+                posts.append([call])
+        return posts
+
+    def send(self):
+        """Send the queued calls, returns the number of POSTs made"""
+        posts = self.plan()
+        for post in posts:
+            self._received(post, self.client._api2request_all([call.as_tuple() for call in post]))
+        self.requests += len(posts)
+        return len(posts)
+
+    @staticmethod
+    def _received(post, json_data):
+        # Set the status and result of the calls of a POST
+        for call in post:
+            response = json_data.get(call.id) or {}
+            call.status = response.get('status')
+            call._result = response.get('result')
+            call.sent = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+
+def _dated_id(id, date):
+    # The call ids are only used to key the results: one per date
+    return "%s %s" % (id, date)
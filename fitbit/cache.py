@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+import collections
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from fitbit._lazy import LazyModule
+
+urllib_parse = LazyModule("urllib.parse", "urllib")
+
+# Parameters that change on every call without changing the response
+IGNORED_PARAMETERS = ("ts", "csrfToken")
+
+# Parameters holding the (last) day a request is about
+DATE_PARAMETERS = ("dateTo", "toDate", "date")
+
+
+class ResponseCache(object):
+    """On-disk cache of raw responses, see Client.cache
+
+    Responses are keyed by method, path and parameters (without the ts cache
+    buster). Days older than mutable_days ago can no longer change: their
+    responses stored since then never expire. The responses about no
+    particular day, or stored while their day was among the last
+    mutable_days (today and yesterday by default), expire after ttl
+    seconds. When the cache grows over max_bytes, the least recently used
+    responses are removed.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl=3600, mutable_days=2):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.mutable_days = mutable_days
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def key(method, path, parameters):
+        parameters = sorted((k, str(v)) for k, v in parameters.items()
+                            if v and k not in IGNORED_PARAMETERS)
+        return "%s %s?%s" % (method, path, urllib_parse.urlencode(parameters))
+
+    def get(self, method, path, parameters):
+        """Return the cached response, or None if missing or expired"""
+        key = self.key(method, path, parameters)
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as f:
+                meta = json.loads(f.readline().decode("utf8"))
+                data = f.read()
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        if meta.get("key") != key or not self._fresh(parameters, meta["stored"]):
+            self.misses += 1
+            return None
+        # The modification time orders the entries for eviction
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, method, path, parameters, data):
+        key = self.key(method, path, parameters)
+        if not isinstance(data, bytes):
+            data = data.encode("utf8")
+        meta = json.dumps({"key": key, "stored": time.time()}).encode("utf8")
+        filename = self._filename(key)
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+        # Write then rename so that readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(meta + b"\n" + data)
+        os.rename(tmp, filename)
+        with self._lock:
+            self._size = self.size() + len(meta) + 1 + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def size(self):
+        """Total size of the cached responses in bytes"""
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def clear(self):
+        for filename, _, _ in self._entries():
+            os.remove(filename)
+        self._size = 0
+
+    def _fresh(self, parameters, stored):
+        return _fresh(parameters, stored, self.ttl, self.mutable_days)
+
+    def _filename(self, key):
+        digest = hashlib.sha1(key.encode("utf8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                filename = os.path.join(root, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                yield filename, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Remove the least recently used entries down to 90% of max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        for filename, entry_size, _ in entries:
+            if size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            size -= entry_size
+        self._size = size
+
+
+class _Flight(object):
+    """A request in progress, waited on by the identical requests"""
+
+    def __init__(self, key):
+        self.key = key
+        self.data = None
+        self.done = threading.Event()
+        self.thread = threading.current_thread()
+
+
+class RequestMemo(object):
+    """In-memory LRU of raw GET responses with single-flight requests, see Client.memo
+
+    Identical requests (by ResponseCache.key) made while one is in progress
+    wait for its response instead of requesting it again; they request it
+    themselves if it failed. Like ResponseCache, the responses stored once
+    their day was older than mutable_days never expire, the others expire
+    after ttl seconds. At most max_entries responses are kept.
+
+    hits counts the responses found in memory, coalesced the requests that
+    waited for an identical one and misses the requests made.
+    """
+
+    def __init__(self, max_entries=256, ttl=300, mutable_days=2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.mutable_days = mutable_days
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # {key: (data, stored)}, least recently used first
+        self._entries = collections.OrderedDict()
+        # {key: _Flight} of the requests in progress
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, method, path, parameters):
+        """Return (data, None) if the response is known, waiting for an identical request
+        in progress if needed; otherwise (None, flight): the caller makes the request
+        then calls finish(flight, data), or finish(flight) if it failed
+        """
+        key = ResponseCache.key(method, path, parameters)
+        waited = False
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._fresh(parameters, entry[1]):
+                    self._entries.pop(key)
+                    self._entries[key] = entry
+                    if waited:
+                        self.coalesced += 1
+                    else:
+                        self.hits += 1
+                    return entry[0], None
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight(key)
+                    self.misses += 1
+                    return None, flight
+                if flight.thread is threading.current_thread():
+                    # Waiting for a request this thread has not finished reading would never end
+                    self.misses += 1
+                    return None, None
+            flight.done.wait()
+            if flight.data is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return flight.data, None
+            # The request failed, or was evicted at once: try again
+            waited = True
+
+    def finish(self, flight, data=None):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if data is not None:
+                self._entries.pop(flight.key, None)
+                self._entries[flight.key] = (data, time.time())
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        flight.data = data
+        flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fresh(self, parameters, stored):
+        return _fresh(parameters, stored, self.ttl, self.mutable_days)
+
+
+def _fresh(parameters, stored, ttl, mutable_days):
+    # A response stored once its day could no longer change never expires;
+    # one stored before (e.g. a partial today) expires after ttl seconds
+    day = _parameters_date(parameters)
+    if day is not None and stored >= _frozen_since(day, mutable_days):
+        return True
+    return time.time() - stored < ttl
+
+
+def _frozen_since(day, mutable_days):
+    # The local time from which the data of the day can no longer change
+    return time.mktime((day + datetime.timedelta(days=mutable_days)).timetuple())
+
+
+def _parameters_date(parameters):
+    for name in DATE_PARAMETERS:
+        value = parameters.get(name)
+        if value:
+            try:
+                return datetime.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+            except ValueError:
+                pass
+    return None
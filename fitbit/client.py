@@ -1,42 +1,209 @@
 # -*- coding: utf-8 -*-
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import XMLParser
-import json
 import datetime, time
-
-import urllib
-try:
-    import urllib2
-except ImportError:
-    import urllib.request
-    import urllib.parse
-    Request = urllib.request.Request
-    build_opener = urllib.request.build_opener
-    HTTPCookieProcessor = urllib.request.HTTPCookieProcessor
-    urlencode = urllib.parse.urlencode
-    HTTPError = urllib.HTTPError
-else:
-    Request = urllib2.Request
-    build_opener = urllib2.build_opener
-    HTTPCookieProcessor = urllib2.HTTPCookieProcessor
-    urlencode = urllib.urlencode
-    HTTPError = urllib2.HTTPError
+import io
+import json
 import logging
 import re
-try:
-    import cookielib
-except ImportError:
-    import http.cookiejar as cookielib
+import threading
+
+from fitbit._lazy import LazyModule
+from fitbit._util import _clock
+from fitbit.batch import ServiceBatch
+from fitbit.decoders import JSONDecoder, daily_totals, data_points, datapoint_days
+from fitbit.details import DayDetails
+from fitbit.graphxml import parse_graph_values
+from fitbit.ranges import DataDays, IntradayRange, date_span
+from fitbit.retry import (EXPIRED_STATUSES, THROTTLE_STATUSES, RetryPolicy, SessionExpired,
+                          connection_errors, retry_after)
+from fitbit.fetch import run_parallel
+from fitbit.metrics import RequestEvent
+from fitbit.series import IntradaySeries, SeriesFrame
+from fitbit.timestamps import TimeOfDayDecoder, parse_datetime
+
+# The HTTP stack is only imported when first used
+urllib_request = LazyModule("urllib.request", "urllib2")
+urllib_parse = LazyModule("urllib.parse", "urllib")
+cookielib = LazyModule("http.cookiejar", "cookielib")
 
-#import dateutil.parser
-import json
-
-logging.basicConfig(filename='example.log', filemode='w', level=logging.DEBUG)
 _log = logging.getLogger("fitbit")
+_log.addHandler(logging.NullHandler())
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36"
+
+# Graph types of the 5 minute intraday calls, keyed by the metric names
+# accepted by Client.intraday() and Client.intraday_range()
+INTRADAY_GRAPH_TYPES = {
+    "calories_burned": "intradayCaloriesBurned",
+    "active_score": "intradayActiveScore",
+    "distance": "intradayActiveScore",
+    "floor_climbed": "intradayFloors",
+    "steps": "intradaySteps",
+}
+
+# Graph types of the daily totals of the metrics of INTRADAY_GRAPH_TYPES,
+# a value per day, see Client.days_with_data()
+DAILY_GRAPH_TYPES = {
+    "calories_burned": "caloriesBurned",
+    "active_score": "activeScore",
+    "distance": "distanceFromSteps",
+    "floor_climbed": "floorsClimbed",
+    "steps": "stepsTaken",
+}
+
+# Columns of Client.activity_log_frame() and their graph types
+ACTIVITY_RECORD_GRAPHS = [
+    ("calories", "activityRecordCaloriesBurned"),
+    ("steps", "activityRecordSteps"),
+    ("floors", "activityRecordFloors"),
+    ("pace", "activityRecordPace"),
+]
+
+ONE_MINUTE = datetime.timedelta(minutes=1)
+FIVE_MINUTES = datetime.timedelta(minutes=5)
+# Offsets of the 288 values of a 5 minute intraday graph, computed once
+_DAY_OFFSETS = [datetime.timedelta(minutes=m) for m in range(0, 288*5, 5)]
+
+def _graph_datapoints(json_data):
+    """Return the [(datetime.datetime, value), ...] points of a getNewGraphData response"""
+    return [(parse_datetime(d['dateTime']), int(float(d['value']))) for d in data_points(json_data)]
+
+class _ClientBase(object):
+    """The request parameters and the methods shared by Client and fitbit.aio.AsyncClient
+    A subclass has the user_id, csrfToken and url_base attributes and an intraday_range() method
+    """
+
+    def intraday_calories_burned_range(self, start, end, **kwargs):
+        return self.intraday_range("calories_burned", start, end, **kwargs)
+
+    def intraday_active_score_range(self, start, end, **kwargs):
+        return self.intraday_range("active_score", start, end, **kwargs)
+
+    def intraday_floor_climbed_range(self, start, end, **kwargs):
+        return self.intraday_range("floor_climbed", start, end, **kwargs)
+
+    def intraday_steps_range(self, start, end, **kwargs):
+        return self.intraday_range("steps", start, end, **kwargs)
+
+    def intraday_sleep_range(self, start, end, **kwargs):
+        return self.intraday_range("sleep", start, end, **kwargs)
+
+    def _post_data(self, form):
+        # The body of a POST: the form and the csrf token of the session
+        form = dict(form)
+        form['csrfToken'] = self.csrfToken
+        return urllib_parse.urlencode(form).encode("utf8")
+
+    def _request_url(self, path, parameters):
+        # Throw out parameters where the value is not None
+        parameters = dict([(k,v) for k,v in parameters.items() if v])
+        query_str = urllib_parse.urlencode(parameters)
+        return "%s%s?%s" % (self.url_base, path, query_str)
+
+    def _graphdata_intraday_params(self, graph_type, date, data_version=2108, **kwargs):
+        params = dict(
+            userId=self.user_id,
+            type=graph_type,
+            version="amchart",
+            dataVersion=data_version,
+            chart_Type="column2d",
+            period="1d",
+            dateTo=str(date)
+        )
+        
+        if kwargs:
+            params.update(kwargs)
+
+        return params
+
+    def _graphdata_new_params(self, graph_type, date, **kwargs):
+        params = dict(
+            userId=self.user_id,
+            type=graph_type,
+            apiFormat="json",
+            dateTo=str(date),
+            dateFrom=str(date),
+            ts=time.time()*1000
+        )
+
+        if kwargs:
+            params.update(kwargs)
+
+        return params
+
+    @staticmethod
+    def _intraday_graph_type(metric):
+        try:
+            return INTRADAY_GRAPH_TYPES[metric]
+        except KeyError:
+            raise ValueError("Unknown intraday metric: %s" % metric)
+
+    @staticmethod
+    def _daily_graph_type(metric):
+        try:
+            return DAILY_GRAPH_TYPES[metric]
+        except KeyError:
+            raise ValueError("Unknown daily metric: %s" % metric)
 
-class Client(object):
+    def _api2request_data(self,id,name=None,method=None,args=None):
+        # The POST form of the calls; the csrf token is added when it is sent, see _post_data
+        if name:
+            request= [{  "id":id,
+                        "name":name,
+                        "method":method,
+                        "args":args}]
+        else:
+            request = [{"id":r[0],
+                        "name":r[1],
+                        "method":r[2],
+                        "args":r[3]} for r in id]
+        c=json.dumps({"serviceCalls":request,"template":"activities/modules/models/ajax.response.json.jsp"},
+                separators=(',',':')
+                )
+
+        return {'request': c}
+
+    def _newgraph_params(self,graph_type,date,arg):
+        return dict(
+            userId=self.user_id,
+            type=graph_type,
+            dateFrom=str(date),
+            dateTo=str(date),
+            arg=arg,
+            apiFormat='json'
+        )
+
+    @staticmethod
+    def _activity_logs_call(date, end=None, offset=0, limit=10):
+        return ("GET /api/2/user/activities/logs","user","getActivitiesLogs",{"fromDate":str(date),"toDate":str(end or date),"period":"day","offset":offset,"limit":limit})
+
+    @staticmethod
+    def _decode_activity_logs(json_data, date):
+        values=map(lambda log:Client._marshall_activity_log(log),json_data)
+        # fitbit api getActivitiesLogs no longer filters by date so do it ourselves
+        values=filter(lambda log:log[1].date()==date,values)
+        return values
+
+    @staticmethod
+    def _add_activity_logs(logs, json_data, start, page_size):
+        # Add a page of activity_logs_range to {datetime.date: logs}, returns whether another page is needed
+        page = [Client._marshall_activity_log(log) for log in json_data or []]
+        for log in page:
+            if log[1].date() in logs:
+                logs[log[1].date()].append(log)
+        # getActivitiesLogs does not filter by date: stop at the last page or
+        # once the logs go back past the start of the range
+        return len(page) == page_size and min(log[1].date() for log in page) >= start
+
+class Client(_ClientBase):
     """A simple API client for the www.fitbit.com website.
     see README for more details
+
+    The intraday calls take a compact argument: with compact=True they return
+    a fitbit.series.IntradaySeries instead of a list of tuples
+
+    Failed requests are retried as retry_policy allows; the remaining HTTP
+    errors are raised (urllib's HTTPError, or fitbit.retry.SessionExpired
+    when the session cannot be renewed)
     """
     
     def __init__(self, user_id, opener, url_base="http://www.fitbit.com", csrfToken=''):
@@ -44,38 +211,59 @@ class Client(object):
         self.opener = opener
         self.csrfToken = csrfToken;
         self.url_base = url_base
+        # Optional fitbit.fetch.RateLimiter applied to every request
+        self.rate_limiter = None
+        # fitbit.transport.ConnectionPool of the opener, when it keeps connections alive
+        self.connection_pool = None
+        # Optional fitbit.cache.ResponseCache for the GET requests
+        self.cache = None
+        # Optional fitbit.cache.RequestMemo: in-memory responses of the GET requests,
+        # the identical requests made concurrently waiting for a single one
+        self.memo = None
+        # Maximum number of service calls posted together to /ajaxapi by batch()
+        self.ajaxapi_batch_size = 10
+        # fitbit.retry.RetryPolicy of the failed requests, None to raise the errors at once
+        self.retry_policy = RetryPolicy()
+        # Callable receiving a fitbit.metrics.RequestEvent after each request (e.g. fitbit.Metrics)
+        self.instrumentation = None
+        # Callable logging in again when the session expired, returning (user_id, csrfToken);
+        # set by login()
+        self.reauthenticate = None
+        # Decoder of the JSON response bodies, see fitbit.decoders
+        self.json_decoder = JSONDecoder()
+        self._login_lock = threading.Lock()
     
-    def intraday_calories_burned(self, date):
+    def intraday_calories_burned(self, date, compact=False):
         """Retrieve the calories burned every 5 minutes
         the format is: [(datetime.datetime, calories_burned), ...]
         """
-        return self._graphdata_intraday_request("intradayCaloriesBurned", date)
+        return self._graphdata_intraday_request("intradayCaloriesBurned", date, compact)
     
-    def intraday_active_score(self, date):
+    def intraday_active_score(self, date, compact=False):
         """Retrieve the active score for every 5 minutes
         the format is: [(datetime.datetime, active_score), ...]
         """
-        return self._graphdata_intraday_request("intradayActiveScore", date)
+        return self._graphdata_intraday_request("intradayActiveScore", date, compact)
 
-    def intraday_distance(self, date):
+    def intraday_distance(self, date, compact=False):
         """Retrieve the active score for every 5 minutes
         the format is: [(datetime.datetime, active_score), ...]
         """
-        return self._graphdata_intraday_request("intradayActiveScore", date)
+        return self._graphdata_intraday_request("intradayActiveScore", date, compact)
 
-    def intraday_floor_climbed(self, date):
+    def intraday_floor_climbed(self, date, compact=False):
         """Retrieve the active score for every 5 minutes
         the format is: [(datetime.datetime, active_score), ...]
         """
-        return self._graphdata_intraday_request("intradayFloors", date)
+        return self._graphdata_intraday_request("intradayFloors", date, compact)
 
-    def intraday_steps(self, date):
+    def intraday_steps(self, date, compact=False):
         """Retrieve the steps for every 5 minutes
         the format is: [(datetime.datetime, steps), ...]
         """
-        return self._graphdata_intraday_request("intradaySteps", date)
+        return self._graphdata_intraday_request("intradaySteps", date, compact)
     
-    def intraday_sleep(self, date, sleep_id=None):
+    def intraday_sleep(self, date, sleep_id=None, compact=False):
         """Retrieve the sleep status for every 1 minute interval
         the format is: [(datetime.datetime, sleep_value), ...]
         The statuses are:
@@ -86,17 +274,69 @@ class Client(object):
         For days with multiple sleeps, you need to provide the sleep_id
         or you will just get the first sleep of the day
         """
-        return self._graphdata_intraday_sleep_request("intradaySleep", date, sleep_id=sleep_id)
-    
+        return self._graphdata_intraday_sleep_request("intradaySleep", date, sleep_id=sleep_id, compact=compact)
+
+    def intraday(self, metric, date, compact=False):
+        """Retrieve the intraday data of a metric given by name:
+        steps, calories_burned, active_score, distance, floor_climbed or sleep
+        the format is the one of the matching intraday_* call
+        """
+        if metric == "sleep":
+            return self.intraday_sleep(date, compact=compact)
+        return self._graphdata_intraday_request(self._intraday_graph_type(metric), date, compact)
+
+    def intraday_range(self, metric, start, end, days_per_request=31, compact=False):
+        """Retrieve the intraday data of a metric (see intraday()) for every day
+        from start to end, both included, with as few requests as possible
+        Returns an IntradayRange yielding (datetime.date, data) for each day as the
+        responses arrive; its requests and elapsed attributes report the number of
+        requests made and the time spent on them
+        """
+        return IntradayRange(self, metric, start, end, days_per_request, compact)
+
+    def days_with_data(self, start, end, metric="steps", days_per_request=366):
+        """Find the days from start to end, both included, with data, without fetching them
+        The daily totals of the metric (see intraday()) are requested, a value per day,
+        days_per_request days at a time. Returns a fitbit.ranges.DataDays: the days
+        with data, the first and last of them and the total of each day
+        """
+        graph_type = self._daily_graph_type(metric)
+        totals = dict((day, 0) for day in date_span(start, end))
+        requests = 0
+        started = time.time()
+        for date_from, date_to in IntradayRange(self, metric, start, end, days_per_request).plan():
+            json_data = self._graphdata_intraday_xml_request_new(graph_type, date_to, dateFrom=str(date_from))
+            requests += 1
+            for day, total in daily_totals(json_data).items():
+                if day in totals:
+                    totals[day] = total
+        return DataDays(totals, requests, time.time() - started)
+
     def activity_logs(self,date):
         """Retrieve the available activity logs for the given date
         the format is: [(id,datetime.datetime,name,steps,distance,duration,calories), ...]
         """
-        json_data=self._api2request("GET /api/2/user/activities/logs","user","getActivitiesLogs",{"fromDate":str(date),"toDate":str(date),"period":"day","offset":0,"limit":10})
-        values=map(lambda log:Client._marshall_activity_log(log),json_data)
-        # fitbit api getActivitiesLogs no longer filters by date so do it ourselves
-        values=filter(lambda log:log[1].date()==date,values)
-        return values
+        json_data=self._api2request(*Client._activity_logs_call(date))
+        return Client._decode_activity_logs(json_data, date)
+
+    def activity_logs_range(self, start, end, page_size=100):
+        """Retrieve the activity logs of every day from start to end, both included
+        the format is: {datetime.date: [(id,datetime.datetime,name,steps,distance,duration,calories), ...], ...}
+        The logs of the whole range are requested together, page_size at a time
+        """
+        logs = dict((day, []) for day in date_span(start, end))
+        offset = 0
+        while True:
+            json_data=self._api2request(*Client._activity_logs_call(start,end,offset,page_size))
+            if not Client._add_activity_logs(logs, json_data, start, page_size):
+                return logs
+            offset += page_size
+
+    def batch(self, batch_size=None):
+        """Return a fitbit.batch.ServiceBatch to send several /ajaxapi service calls
+        in as few requests as possible, batch_size (default ajaxapi_batch_size) calls at most per request
+        """
+        return ServiceBatch(self, batch_size)
 
     def activity_log_data_calories(self,date,id):
         """Retrieve the calories burned data in 1 minute intervals for the given date and activity log
@@ -131,172 +371,330 @@ class Client(object):
         the format is: [(datetime.datetime,calories,steps,floors,pace), ...]
         You need to call activity_logs() first to find the ids for activity log entries
         """
-        calories=self.activity_log_data_calories(date,id)
-        steps=self.activity_log_data_steps(date,id)
-        floors=self.activity_log_data_floors(date,id)
-        pace=self.activity_log_data_pace(date,id)
-
-        # assumes len(calories)==len(steps) etc - which is probably reasonable
+        return list(self.activity_log_frame(date,id))
 
-        return zip(
-            [ l[0] for l in calories], 
-            [ l[1] for l in calories],
-            [ l[1] for l in steps],
-            [ l[1] for l in floors],
-            [ l[1] for l in pace])
-
-    def _request(self, path, parameters, request_body=""):
-        data=self._request_raw(path, parameters, request_body=request_body)
-        return ET.fromstring(data.strip().replace("&hellip;", "..."))
+    def activity_log_frame(self,date,id,columns=None):
+        """Retrieve the activity data of an activity log as a fitbit.series.SeriesFrame:
+        one column per type (calories, steps, floors, pace by default) aligned on the timestamps,
+        with None where a type has no value. The graphs are requested concurrently.
+        You need to call activity_logs() first to find the ids for activity log entries
+        """
+        if columns is None:
+            columns = [name for name, _ in ACTIVITY_RECORD_GRAPHS]
+        graph_types = dict(ACTIVITY_RECORD_GRAPHS)
+        series = run_parallel([lambda graph_type=graph_types[name]: self._activity_log_data(date,id,graph_type)
+                               for name in columns])
+        return SeriesFrame.align(zip(columns, series))
+
+    def day_details(self, dates, details=None):
+        """Retrieve the activity record graphs of whole days: calories, steps, floors and pace
+        by default (see activity_log_frame for the names)
+        Returns a fitbit.details.DayDetails yielding (datetime.date, {name: [(datetime.datetime, value), ...]})
+        for each of the dates. A temporary annotation is created then deleted for each day, one
+        /ajaxapi POST per day, and the graphs of a day are requested concurrently; the requests
+        and requests_per_day attributes report the number of requests made
+        """
+        if details is None:
+            details = [name for name, _ in ACTIVITY_RECORD_GRAPHS]
+        return DayDetails(self, dates, details)
 
     def _request_json(self, path, post_data, method, request_body=""):
-        data=self._request_raw(path, post_data, method, request_body)
-        return json.loads(data)
-
-    def _request_raw(self, path, parameters,method="GET", request_body=""):
-
-        if method == "POST":
-            request = Request("%s%s" % (self.url_base, path),parameters)
-        else:    
-            # Throw out parameters where the value is not None
-            parameters = dict([(k,v) for k,v in parameters.items() if v])
-            query_str = urlencode(parameters)
-            request = Request("%s%s?%s" % (self.url_base, path, query_str), request_body)
-        
-        _log.debug("requesting (%s): %s", method,request.get_full_url())
-        data = None
+        return self._request_decoded(self.json_decoder, path, post_data, method, request_body)
+
+    def _request_decoded(self, decode, path, parameters, method, request_body=""):
+        if self.instrumentation is None:
+            return decode(self._request_raw(path, parameters, method, request_body))
+        event = RequestEvent(method, path)
+        data=self._request_raw(path, parameters, method, request_body, event)
+        return self._report(event, decode, data)
+
+    def _report(self, event, decode, data):
+        # Decode the response of an instrumented request, then report the request
+        started = _clock()
         try:
-            response = self.opener.open(request)
-            data = response.read().replace("&hellip;", "...").replace("d'éveil", "d éveil")
-            response.close()
-        except HTTPError as httperror:
-            data = httperror.read()
-            httperror.close()
-        _log.debug("response: %s", data.strip())
-        return data.strip()
-
-    def _graphdata_intraday_xml_request(self, graph_type, date, data_version=2108, **kwargs):
-        params = dict(
-            userId=self.user_id,
-            type=graph_type,
-            version="amchart",
-            dataVersion=data_version,
-            chart_Type="column2d",
-            period="1d",
-            dateTo=str(date)
-        )
-        
-        if kwargs:
-            params.update(kwargs)
+            return decode(data)
+        except Exception as error:
+            event.error = "%s: %s" % (type(error).__name__, error)
+            raise
+        finally:
+            event.parse_time += _clock() - started
+            self.instrumentation(event)
+
+    def _request_raw(self, path, parameters,method="GET", request_body="", event=None):
+        # The body as received: the decoders apply the fix-ups they need
+        data = b"".join(self._request_chunks(path, parameters, method, request_body, event=event)).strip()
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("response: %s", data)
+        return data
 
-        return self._request("/graph/getGraphData", params)
+    def _request_chunks(self, path, parameters, method="GET", request_body="", chunk_size=16384, event=None):
+        """Yield the body of the response in chunks, as they are received
+        With instrumentation, the request is reported once its body is read,
+        unless an event is given: the caller reports it once it is decoded. A
+        request that fails, or whose body is not read to the end, is reported
+        with its error either way
+        """
+        report = event is None and self.instrumentation is not None
+        if report:
+            event = RequestEvent(method, path)
+        # Only GET requests are memoized and cached: the /ajaxapi POSTs can modify data
+        data = flight = None
+        if self.memo is not None and method != "POST":
+            if event is None:
+                data, flight = self.memo.begin(method, path, parameters)
+            else:
+                # The time spent waiting for an identical request in flight is a wait
+                started = _clock()
+                data, flight = self.memo.begin(method, path, parameters)
+                event.wait += _clock() - started
+                event.memoized = data is not None
+        if report:
+            requested = _clock()
+            waited = event.wait
+        read = False
+        try:
+            cacheable = self.cache is not None and method != "POST"
+            if data is None and cacheable:
+                data = self.cache.get(method, path, parameters)
+                if data is not None and event is not None:
+                    event.cached = True
+            if data is not None:
+                _log.debug("cached (%s): %s %s", method, path, parameters)
+                if event is not None:
+                    event.bytes = len(data)
+                if flight is not None:
+                    self.memo.finish(flight, data)
+                    flight = None
+                yield data
+            else:
+                if event is not None:
+                    # Only the rate limiter waits of _open are taken out of its latency
+                    started = _clock()
+                    wait = event.wait
+                response = self._open(method, path, parameters, request_body, event)
+                if event is not None:
+                    event.latency += _clock() - started - (event.wait - wait)
+                received = [] if cacheable or flight is not None else None
+                try:
+                    while True:
+                        if event is None:
+                            chunk = response.read(chunk_size)
+                        else:
+                            started = _clock()
+                            chunk = response.read(chunk_size)
+                            event.latency += _clock() - started
+                            event.bytes += len(chunk)
+                        if not chunk:
+                            break
+                        if received is not None:
+                            received.append(chunk)
+                        yield chunk
+                finally:
+                    response.close()
+                if received is not None:
+                    data = b"".join(received).strip()
+                    if cacheable:
+                        self.cache.put(method, path, parameters, data)
+                    if flight is not None:
+                        self.memo.finish(flight, data)
+                        flight = None
+            read = True
+        except Exception as error:
+            if event is not None:
+                event.error = "%s: %s" % (type(error).__name__, error)
+            raise
+        finally:
+            # The request failed, or its body was not read to the end: the
+            # identical requests waiting for it make their own
+            if flight is not None:
+                self.memo.finish(flight)
+            if event is not None and not read:
+                if event.error is None:
+                    # Closed by the caller, e.g. when the parser of the body failed
+                    event.error = "the response was not read to the end"
+                self.instrumentation(event)
+        if report:
+            # The response was parsed while it was streamed
+            event.parse_time = _clock() - requested - event.latency - (event.wait - waited)
+            self.instrumentation(event)
+
+    def _open(self, method, path, parameters, request_body="", event=None):
+        # Open the request, retrying it as retry_policy allows and logging in
+        # again (see reauthenticate) once if the session expired
+        attempt = 0
+        logged_in_again = False
+        while True:
+            csrfToken = self.csrfToken
+            # urllib wants bytes, and no data at all for a GET
+            if method == "POST":
+                # Encoded at each attempt: the token changes when logging in again
+                request = urllib_request.Request("%s%s" % (self.url_base, path), self._post_data(parameters))
+            else:
+                request = urllib_request.Request(self._request_url(path, parameters), request_body or None)
+
+            _log.debug("requesting (%s): %s", method,request.get_full_url())
+            if self.rate_limiter is not None:
+                waited = self.rate_limiter.acquire()
+                if event is not None:
+                    event.wait += waited
+            status = headers = None
+            expired = False
+            try:
+                response = self.opener.open(request)
+            except urllib_request.HTTPError as httperror:
+                error, status, headers = httperror, httperror.code, httperror.info()
+                if status in EXPIRED_STATUSES:
+                    expired, error = Client._login_page(httperror)
+            except connection_errors() as connection_error:
+                error = connection_error
+            else:
+                if not Client._session_expired(response.geturl()):
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.succeeded()
+                    if event is not None:
+                        event.status = getattr(response, "code", None)
+                    return response
+                response.close()
+                error, status = SessionExpired("%s was redirected to the login page" % path), 401
+                expired = True
+
+            if expired and not logged_in_again and self.reauthenticate is not None:
+                _log.info("session expired, logging in again")
+                self._log_in_again(csrfToken)
+                logged_in_again = True
+                continue
+            if event is not None:
+                event.status = status
+            policy = self.retry_policy
+            if policy is None or attempt >= policy.retries or not policy.retryable(status, method, error):
+                raise error
+            delay = policy.delay(attempt, retry_after(headers))
+            _log.info("retrying %s in %.1fs after: %s", path, delay, error)
+            if status is not None:
+                error.close()
+            if self.rate_limiter is not None:
+                if status in THROTTLE_STATUSES:
+                    self.rate_limiter.throttled()
+                # Hold back the other users of the limiter too
+                self.rate_limiter.hold(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+
+    def _log_in_again(self, csrfToken):
+        with self._login_lock:
+            # Another thread may have logged in since the request was sent
+            if self.csrfToken == csrfToken:
+                self.user_id, self.csrfToken = self.reauthenticate()
 
-    def _graphdata_intraday_xml_request_new(self, graph_type, date, **kwargs):
-        params = dict(
-            userId=self.user_id,
-            type=graph_type,
-            apiFormat="json",
-            dateTo=str(date),
-            dateFrom=str(date),
-            ts=time.time()*1000
-        )
+    @staticmethod
+    def _session_expired(url):
+        # fitbit.com redirects the requests of an expired session to the login page
+        return "/login" in url.split("?", 1)[0]
 
-        if kwargs:
-            params.update(kwargs)
+    @staticmethod
+    def _login_page(httperror):
+        # Whether a 401 or 403 response is the login page (the session expired) rather than
+        # a request that is not allowed. Returns (login page, error): the body is read to
+        # tell, so the error returned in place of the given one still has it.
+        body = httperror.read()
+        httperror.close()
+        login_page = Client._session_expired(httperror.geturl()) or b'name="_sourcePage"' in body
+        error = urllib_request.HTTPError(httperror.geturl(), httperror.code, httperror.msg,
+                                         httperror.info(), io.BytesIO(body))
+        return login_page, error
+
+    def _graphdata_intraday_values(self, graph_type, date, data_version=2108, **kwargs):
+        # The [(description, text), ...] of a getGraphData response, parsed as it is streamed
+        params = self._graphdata_intraday_params(graph_type, date, data_version, **kwargs)
+        return parse_graph_values(self._request_chunks("/graph/getGraphData", params))
 
-        return json.loads(self._request_raw("/graph/getNewGraphData", params))
+    def _graphdata_intraday_xml_request_new(self, graph_type, date, **kwargs):
+        params = self._graphdata_new_params(graph_type, date, **kwargs)
+        return self._request_json("/graph/getNewGraphData", params, "GET")
 
-    def _graphdata_intraday_request(self, graph_type, date):
+    def _graphdata_intraday_request(self, graph_type, date, compact=False):
         # This method used for the standard case for most intraday calls (data for each 5 minute range)
-        xml = self._graphdata_intraday_xml_request(graph_type, date)
-        
+        values = self._graphdata_intraday_values(graph_type, date)
+        return Client._decode_intraday(values, date, compact)
+
+    @staticmethod
+    def _decode_intraday(graph_values, date, compact=False):
         base_time = datetime.datetime.combine(date, datetime.time())
-        timestamps = [base_time + datetime.timedelta(minutes=m) for m in range(0, 288*5, 5)]
-        values = [int(float(v.text)) for v in xml.findall("data/chart/graphs/graph/value")]
-        return zip(timestamps, values)
-    
-    def _get_day_details(self,details,date,timeStart=["0","0"],timeEnd=["23","59"]):
-        activity=json.dumps({"isAnnotation":True,
-                        "date":str(date),
-                        "clock":"24",
-                        "create":"on",
-                        "apiFormat":"htmljson",
-                        "name":"test",
-                        "annotationStartTimeHours":timeStart[0],
-                        "annotationStartTimeMinutes":timeStart[1],
-                        "annotationEndTimeHours":timeEnd[0],
-                        "annotationEndTimeMinutes":timeEnd[1],
-                        "annotationEndTimeDay":"same",
-                        "note":"Virtual day activity",
-                        "manualCaloriesEnabled":False}, separators=(',',':'))
-        # We need two request to receives the details of the added annotation
-        requests=[("POST /api/2/user/activities/annotations", "user", "postActivitiesAnnotations", {"activity":activity}),
-("GET /api/2/user/activities/logs/summary", "user","getActivitiesLogsSummary",{"fromDate":str(date),"toDate":str(date),"period":"day","offset":0,"limit":10})]
-        json_data=self._api2request(requests)
-        if json_data[requests[0][0]]['status']!=200:
-            print json_data[requests[0][0]]['result']
-            return
-
-        activityId=json_data[requests[0][0]]['result']['id']
-        data={}
-        for graphtype in details:
-            graphData =self._graphdata_intraday_xml_request_new("activityRecord"+graphtype,json_data[requests[0][0]]['result']['date'],arg=activityId)
-            dataPoints=graphData["graph"]["dataSets"]["activity"]["dataPoints"]
-            if not data.has_key(graphtype):data[graphtype]=[]
-            data[graphtype].extend([(d["dateTime"],d["value"]) for d in dataPoints])
-            #print dataPoints
-        self._api2request("DELETE /api/2/user/activities/annotations/"+str(activityId), "user", "deleteActivitiesAnnotations", {"activityId":activityId})
-        return data
+        values = [int(float(text)) for _, text in graph_values]
+        if compact:
+            return IntradaySeries(base_time, FIVE_MINUTES, values)
+        return zip([base_time + offset for offset in _DAY_OFFSETS], values)
+
+    def _graphdata_range_request(self, graph_type, date_from, date_to, compact=False):
+        # A single getNewGraphData call covering several days, split back per day
+        json_data = self._graphdata_intraday_xml_request_new(graph_type, date_to, dateFrom=str(date_from))
+        return Client._decode_range(json_data, date_from, date_to, compact)
 
-    def _graphdata_intraday_sleep_request(self, graph_type, date, sleep_id=None):
+    @staticmethod
+    def _decode_range(json_data, date_from, date_to, compact=False):
+        if compact:
+            by_day = datapoint_days(json_data, FIVE_MINUTES, fill=0)
+            return [(day, by_day[day] if day in by_day
+                          else IntradaySeries(datetime.datetime.combine(day, datetime.time()), FIVE_MINUTES))
+                    for day in date_span(date_from, date_to)]
+        by_day = {}
+        for timestamp, value in _graph_datapoints(json_data):
+            by_day.setdefault(timestamp.date(), []).append((timestamp, value))
+        return [(day, by_day.get(day, [])) for day in date_span(date_from, date_to)]
+
+    def _graphdata_intraday_sleep_request(self, graph_type, date, sleep_id=None, compact=False):
         # Sleep data comes back a little differently
-        xml = self._graphdata_intraday_xml_request(graph_type, date, data_version=2112, arg=sleep_id)
-        
-        
-        elements = xml.findall("data/chart/graphs/graph/value")
-        try:
-            timestamps = [datetime.datetime.strptime(e.attrib['description'].split(' ')[-1], "%I:%M%p") for e in elements]
-        except ValueError:
-            timestamps = [datetime.datetime.strptime(e.attrib['description'].split(' ')[-1], "%H:%M") for e in elements]
-        
-        # TODO: better way to figure this out?
-        # Check if the timestamp cross two different days
-        last_stamp = None
-        datetimes = []
-        base_date = date
-        for timestamp in timestamps:
-            if last_stamp and last_stamp > timestamp:
-                base_date -= datetime.timedelta(days=1)
-            last_stamp = timestamp
-        
-        last_stamp = None
-        for timestamp in timestamps:
-            if last_stamp and last_stamp > timestamp:
-                base_date += datetime.timedelta(days=1)
-            datetimes.append(datetime.datetime.combine(base_date, timestamp.time()))
-            last_stamp = timestamp
+        values = self._graphdata_intraday_values(graph_type, date, data_version=2112, arg=sleep_id)
+        return Client._decode_sleep(values, date, compact)
+
+    @staticmethod
+    def _decode_sleep(graph_values, date, compact=False):
+        # One pass: count the days crossed, a day being added each time the
+        # time of day goes back (the sleep crosses midnight). The sleep ends on
+        # the given date, which dates the values once the count is known.
+        time_of_day = TimeOfDayDecoder()
+        days = []
+        times = []
+        values = []
+        day = 0
+        last = datetime.time.min
+        for description, text in graph_values:
+            timestamp = time_of_day(description.rpartition(' ')[2])
+            if timestamp < last:
+                day += 1
+            last = timestamp
+            days.append(day)
+            times.append(timestamp)
+            values.append(int(float(text)))
+        dates = [date - datetime.timedelta(days=day - index) for index in range(day + 1)]
+        combine = datetime.datetime.combine
         
-        values = [int(float(v.text)) for v in xml.findall("data/chart/graphs/graph/value")]
-        return zip(datetimes, values)
+        if compact:
+            if not values:
+                return IntradaySeries(combine(date, datetime.time()), ONE_MINUTE)
+            start = combine(dates[0], times[0])
+            if combine(dates[-1], times[-1]) - start == ONE_MINUTE * (len(values) - 1):
+                return IntradaySeries(start, ONE_MINUTE, values)
+            # missing minutes are "0: no sleep data"
+            return IntradaySeries.from_pairs(
+                [(combine(dates[day], timestamp), value) for day, timestamp, value in zip(days, times, values)],
+                ONE_MINUTE, fill=0)
+        return zip([combine(dates[day], timestamp) for day, timestamp in zip(days, times)], values)
     
     def _api2request(self,id,name=None,method=None,args=None):
-        if name:
-            request= [{  "id":id,
-                        "name":name,
-                        "method":method,
-                        "args":args}]
-        else:
-            request = [{"id":r[0],
-                        "name":r[1],
-                        "method":r[2],
-                        "args":r[3]} for r in id]
-        c=json.dumps({"serviceCalls":request,"template":"activities/modules/models/ajax.response.json.jsp"},
-                separators=(',',':')
-                )
-
-        api_data = urllib.urlencode(
-            {   'request' :  c, 'csrfToken': self.csrfToken})
+        api_data = self._api2request_data(id,name,method,args)
         json_data =  self._request_json('/ajaxapi', api_data,"POST")
+        return Client._decode_api2response(json_data)
+
+    def _api2request_all(self, calls):
+        # Like _api2request for a list of calls, always returning all the results keyed by call id
+        return self._request_json('/ajaxapi', self._api2request_data(calls), "POST")
+
+    @staticmethod
+    def _decode_api2response(json_data):
         if len(json_data)==1:
             for service,result in json_data.items():
                 status=result.get('status',None)
@@ -310,28 +708,24 @@ class Client(object):
 
     def _activity_log_data(self,date,id,chart_type):
         json_data=self._newgraph_json_request(chart_type,date,id)
+        return Client._decode_activity_log_data(json_data)
 
+    @staticmethod
+    def _decode_activity_log_data(json_data):
         values=[]
 
         if ('graph' in json_data):
             data_points=json_data['graph']['dataSets']['activity']['dataPoints']
 
             values=[(
-                dateutil.parser.parse(data_point['dateTime']),
+                parse_datetime(data_point['dateTime']),
                 int(data_point['value'])) 
                 for data_point in data_points]
 
         return values        
 
     def _newgraph_json_request(self,graph_type,date,arg):
-        params = dict(
-            userId=self.user_id,
-            type=graph_type,
-            dateFrom=str(date),
-            dateTo=str(date),
-            arg=arg,
-            apiFormat='json'
-        )
+        params = self._newgraph_params(graph_type,date,arg)
         json_data=self._request_json("/graph/getNewGraphData", params,"GET")
         return json_data                
 
@@ -340,7 +734,7 @@ class Client(object):
         
         #_log.debug("log json: %s", log)
 
-        timestamp=dateutil.parser.parse(log['dateTime'])
+        timestamp=parse_datetime(log['dateTime'], keep_tz=True)
         id=log['id']
         steps=int(log['steps']) if log['steps'] else 0
         calories=int(log['calories']) if log['calories'] else 0
@@ -360,11 +754,32 @@ class Client(object):
         return (id,timestamp,name,steps,distance,duration,calories)
 
     @staticmethod
-    def login(email, password, base_url="https://www.fitbit.com"):
-        cj = cookielib.CookieJar()
-        opener = build_opener(HTTPCookieProcessor(cj))
-        opener.addheaders = [("User-agent", "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36")]
+    def login(email, password, base_url="https://www.fitbit.com", pool_size=4, idle_timeout=30.0):
+        """Log in and return a Client
+        Connections are kept alive and reused, with at most pool_size idle connections
+        per host closed after idle_timeout seconds; pass pool_size=None to open a new
+        connection for every request
+        """
+        opener, pool = Client._build_opener(cookielib.CookieJar(), pool_size, idle_timeout)
+        user_id, csrfToken = Client._authenticate(opener, email, password, base_url)
+        client = Client(user_id, opener, base_url, csrfToken)
+        client.reauthenticate = lambda: Client._authenticate(opener, email, password, base_url)
+        client.connection_pool = pool
+        return client
+
+    @staticmethod
+    def _build_opener(cookie_jar, pool_size=4, idle_timeout=30.0):
+        # Returns the opener and its ConnectionPool (None without keep-alive)
+        from fitbit.transport import DecompressionHandler, keep_alive_handlers
+        handlers = keep_alive_handlers(pool_size, idle_timeout) if pool_size else ()
+        opener = urllib_request.build_opener(urllib_request.HTTPCookieProcessor(cookie_jar),
+                                             DecompressionHandler(), *handlers)
+        opener.addheaders = [("User-agent", USER_AGENT)]
+        return opener, handlers[0].pool if handlers else None
 
+    @staticmethod
+    def _authenticate(opener, email, password, base_url):
+        # Log in with the opener, returns (user_id, csrfToken)
         # fitbit.com wierdness - as of 2014-06-20 the /login page gives a 500: Internal Server Error
         # if there's no cookie
         # Workaround: open the https://www.fitbit.com/ page first to get a cookie
@@ -372,30 +787,38 @@ class Client(object):
 
         # Get the login page so we can load the magic values
         login_page = opener.open(base_url + "/login").read().decode("utf8")
+        data = Client._login_form(login_page, email, password)
 
+        logged_in = opener.open(base_url + "/login", data)
+
+        if not Client._logged_in(logged_in.geturl()):
+            raise ValueError("Incorrect username or password.")
+        return Client._parse_home_page(logged_in.read().decode("utf8"))
+
+    @staticmethod
+    def _login_form(login_page, email, password):
         source_page = re.search(r"""name="_sourcePage".*?value="([^"]+)["]""", login_page).group(1)
         fp = re.search(r"""name="__fp".*?value="([^"]+)["]""", login_page).group(1)
 
-        data = urlencode({
+        return urllib_parse.urlencode({
                 "email": email, "password": password,
                 "_sourcePage": source_page, "__fp": fp,
                 "login": "Log In", "includeWorkflow": "false",
                 "redirect": "", "rememberMe": "true"
             }).encode("utf8")
 
-        logged_in = opener.open(base_url + "/login", data)
+    @staticmethod
+    def _logged_in(url):
+        # a successful login redirects to the home page
+        return url in ("http://www.fitbit.com/", "https://www.fitbit.com/", "https://www.fitbit.com:443/")
 
-        if logged_in.geturl() == "http://www.fitbit.com/" or logged_in.geturl() == "https://www.fitbit.com/" \
-                or logged_in.geturl() == "https://www.fitbit.com:443/":
-            page = logged_in.read().decode("utf8")
-        
-            match = re.search(r"""userId=([a-zA-Z0-9]+)""", page)
-            if match is None:
-                match = re.search(r"""/user/([a-zA-Z0-9]+)" """, page)
-            user_id = match.group(1)
-            # Get CsrfToken '12345678-ABCD-ABCD-ABCD-0123456789AB'
-            match = re.search(r"""window.fitbitCsrfToken = '([0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12})';""", page)
-            csrfToken = match.group(1)
-            return Client(user_id, opener, base_url, csrfToken)
-        else:
-            raise ValueError("Incorrect username or password.")
+    @staticmethod
+    def _parse_home_page(page):
+        match = re.search(r"""userId=([a-zA-Z0-9]+)""", page)
+        if match is None:
+            match = re.search(r"""/user/([a-zA-Z0-9]+)" """, page)
+        user_id = match.group(1)
+        # Get CsrfToken '12345678-ABCD-ABCD-ABCD-0123456789AB'
+        match = re.search(r"""window.fitbitCsrfToken = '([0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12})';""", page)
+        csrfToken = match.group(1)
+        return user_id, csrfToken
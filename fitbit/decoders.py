@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Decoders of the JSON response bodies, see Client.json_decoder
+
+A decoder is any callable taking the body of a response as bytes and
+returning the decoded value. JSONDecoder parses the body as is, with the
+fastest JSON library installed; the XML responses are parsed as they are
+streamed by fitbit.graphxml, which applies the fix-ups of the malformed
+XML fitbit.com sends. datapoint_days() decodes the dataPoints of a
+getNewGraphData response into arrays without building a datetime per
+point, and daily_totals() into the total of each day.
+"""
+import datetime
+import importlib
+import json
+import sys
+from array import array
+
+from fitbit.series import IntradaySeries, _seconds
+
+# JSON libraries by order of preference; all of them parse bytes
+JSON_BACKENDS = ("orjson", "ujson", "simplejson", "json")
+
+
+def json_backend(name=None):
+    """Return (name, loads) of the JSON library, the first of JSON_BACKENDS installed by default"""
+    for backend in [name] if name else JSON_BACKENDS:
+        try:
+            module = importlib.import_module(backend)
+        except ImportError:
+            if name:
+                raise ValueError("JSON backend %s is not installed" % name)
+            continue
+        if backend == "json" and (3, 0) <= sys.version_info < (3, 6):
+            # json only parses bytes from Python 3.6
+            return backend, lambda data: json.loads(data.decode("utf8"))
+        return backend, module.loads
+    raise ValueError("Unknown JSON backend: %s" % name)
+
+
+class JSONDecoder(object):
+    """Parses JSON bodies with the given backend (see JSON_BACKENDS)
+    The default backend is chosen on first use.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._loads = None
+
+    def __call__(self, data):
+        if self._loads is None:
+            self.backend, self._loads = json_backend(self.backend)
+        return self._loads(data)
+
+    def __repr__(self):
+        return "<JSONDecoder %s>" % (self.backend or "auto")
+
+
+def data_points(json_data):
+    """Return the dataPoints of the first data set of a getNewGraphData response"""
+    if 'graph' not in json_data:
+        return []
+    for data_set in json_data['graph']['dataSets'].values():
+        return data_set['dataPoints']
+    return []
+
+
+def datapoint_days(json_data, interval, fill=0, typecode="i"):
+    """Decode the dataPoints of a getNewGraphData response into {datetime.date: IntradaySeries}
+
+    The values of each day go straight into an array: the dateTime strings
+    are only sliced, and a datetime is only built for the first point of each day.
+    Missing points are set to fill, or raise a ValueError if fill is None.
+    The points must be on the interval grid and in time order.
+    """
+    step = int(_seconds(interval))
+    days = {}
+    # Index in the day of each time of day, the same times recur every day
+    indexes = {}
+    day = values = None
+    for point in data_points(json_data):
+        text = point['dateTime']
+        if text[:10] != day:
+            day = text[:10]
+            if day in days:
+                raise ValueError("%s is not after the previous point" % text)
+            days[day] = values = [None, array(typecode)]
+        index = indexes.get(text[11:19])
+        if index is None:
+            try:
+                seconds = int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19] or 0)
+            except ValueError:
+                raise ValueError("time data %r is not an ISO date time" % text)
+            index, remainder = divmod(seconds, step)
+            if remainder:
+                raise ValueError("%s is not on the %s grid" % (text, interval))
+            indexes[text[11:19]] = index
+        if values[0] is None:
+            values[0] = index
+        index -= values[0]
+        series = values[1]
+        if index != len(series):
+            if index < len(series):
+                raise ValueError("%s is not after the previous point" % text)
+            if fill is None:
+                raise ValueError("missing data before %s" % text)
+            series.extend([fill] * (index - len(series)))
+        series.append(int(float(point['value'])))
+
+    result = {}
+    for day, (first, series) in days.items():
+        date = datetime.date(int(day[0:4]), int(day[5:7]), int(day[8:10]))
+        start = datetime.datetime.combine(date, datetime.time()) + interval * first
+        result[date] = IntradaySeries(start, interval, series)
+    return result
+
+
+def daily_totals(json_data):
+    """Return {datetime.date: total} of the dataPoints of a getNewGraphData response
+    Only the date of the dateTime strings is read.
+    """
+    totals = {}
+    for point in data_points(json_data):
+        day = point['dateTime'][:10]
+        totals[day] = totals.get(day, 0) + int(float(point['value']))
+    return dict((datetime.date(int(day[0:4]), int(day[5:7]), int(day[8:10])), total)
+                for day, total in totals.items())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Activity record graphs of whole days, see Client.day_details
+
+fitbit.com only draws the calories, steps, floors and pace graphs of an
+activity record. DayDetails creates a temporary annotation covering the
+day, requests the graphs of its activity record concurrently, and deletes
+it: the deletion travels in the same /ajaxapi POST as the creation of the
+annotation of the next day, so a range of days costs one POST per day
+(plus one for the last deletion) and one request per graph. A deletion
+that fails is sent again with the next POST; the annotations left are
+deleted once the iteration ends, even if a request failed or the
+iteration stopped early, and a ValueError is raised if that fails too.
+"""
+import json
+import logging
+import time
+
+from fitbit._util import _clock
+from fitbit.fetch import run_parallel
+
+_log = logging.getLogger("fitbit")
+
+# Times the annotations left at the end are deleted before giving up
+DELETE_ATTEMPTS = 3
+
+
+class DayDetails(object):
+    """Iterable of (datetime.date, {name: [(datetime.datetime, value), ...]})
+    for each date, with details the names of Client.activity_log_frame columns
+
+    requests and elapsed report the number of requests made and the time
+    spent on them, requests_per_day their average per day
+    """
+
+    def __init__(self, client, dates, details):
+        self.client = client
+        self.dates = list(dates)
+        self.details = list(details)
+        self.requests = 0
+        self.elapsed = 0.0
+        self.days = 0
+
+    @property
+    def requests_per_day(self):
+        return float(self.requests) / self.days if self.days else None
+
+    def __iter__(self):
+        from fitbit.client import ACTIVITY_RECORD_GRAPHS
+        graph_types = dict(ACTIVITY_RECORD_GRAPHS)
+        self.requests = 0
+        self.elapsed = 0.0
+        self.days = 0
+        # Ids of the annotations created and not deleted yet
+        annotations = []
+        failed = False
+        try:
+            for date in self.dates:
+                started = _clock()
+                batch = self.client.batch()
+                deleted = [batch.add(*_delete_annotation_call(annotation)) for annotation in annotations]
+                created = batch.add(*_create_annotation_call(date))
+                self.requests += batch.send()
+                annotations = _undeleted(annotations, deleted)
+                result = created.result()
+                if result is None:
+                    raise ValueError("could not create an annotation on %s: %s" % (date, created.status))
+                annotation = result["id"]
+                annotations.append(annotation)
+                graphs = run_parallel([
+                    lambda graph_type=graph_types[name], day=result["date"], id=annotation:
+                        self.client._activity_log_data(day, id, graph_type)
+                    for name in self.details])
+                self.requests += len(graphs)
+                self.days += 1
+                self.elapsed += _clock() - started
+                yield date, dict(zip(self.details, graphs))
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if annotations:
+                self._delete(annotations, failed)
+
+    def _delete(self, annotations, failed):
+        # Deleting an annotation again is harmless: the deletions that failed are retried
+        started = _clock()
+        policy = self.client.retry_policy
+        for attempt in range(DELETE_ATTEMPTS):
+            if attempt and policy is not None:
+                time.sleep(policy.delay(attempt - 1))
+            batch = self.client.batch()
+            deleted = [batch.add(*_delete_annotation_call(annotation)) for annotation in annotations]
+            try:
+                self.requests += batch.send()
+            except Exception:
+                _log.warning("could not delete the annotations %s", annotations, exc_info=True)
+                continue
+            annotations = _undeleted(annotations, deleted)
+            if not annotations:
+                break
+        self.elapsed += _clock() - started
+        _not_deleted(annotations, failed)
+
+    def __repr__(self):
+        return "<%s %d days, %s>" % (type(self).__name__, len(self.dates), ", ".join(self.details))
+
+
+def _undeleted(annotations, deleted):
+    # The annotations whose deletion call failed
+    undeleted = []
+    for annotation, call in zip(annotations, deleted):
+        if call.status != 200:
+            _log.warning("could not delete the annotation %s: %s", annotation, call.status)
+            undeleted.append(annotation)
+    return undeleted
+
+
+def _not_deleted(annotations, failed):
+    # Report the annotations that could not be deleted at all
+    if annotations:
+        message = "could not delete the annotations %s" % ", ".join(str(a) for a in annotations)
+        if failed:
+            # Do not hide the error that stopped the iteration
+            _log.error(message)
+        else:
+            raise ValueError(message)
+
+
+def _create_annotation_call(date):
+    activity = json.dumps({"isAnnotation": True,
+                           "date": str(date),
+                           "clock": "24",
+                           "create": "on",
+                           "apiFormat": "htmljson",
+                           "name": "test",
+                           "annotationStartTimeHours": "0",
+                           "annotationStartTimeMinutes": "0",
+                           "annotationEndTimeHours": "23",
+                           "annotationEndTimeMinutes": "59",
+                           "annotationEndTimeDay": "same",
+                           "note": "Virtual day activity",
+                           "manualCaloriesEnabled": False}, separators=(',', ':'))
+    return ("POST /api/2/user/activities/annotations", "user", "postActivitiesAnnotations", {"activity": activity})
+
+
+def _delete_annotation_call(annotation):
+    return ("DELETE /api/2/user/activities/annotations/" + str(annotation), "user",
+            "deleteActivitiesAnnotations", {"activityId": annotation})
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from fitbit._util import _clock
+from fitbit.ranges import date_span
+
+
+
+class RateLimiter(object):
+    """Token bucket limiting the requests of every client it is attached to
+
+    rate is the number of requests allowed per second (None for no limit) and
+    burst the number of requests that can be made at once after a quiet
+    period. The bucket is shared by all threads: attach the same limiter to
+    several clients to enforce one budget across accounts.
+
+    With max_rate, the rate adapts to the server: it grows by increase
+    requests per second after each successful request, up to max_rate, and
+    is multiplied by decrease (down to min_rate) each time the server asks
+    to slow down.
+    """
+
+    def __init__(self, rate=1.0, burst=1, max_rate=None, min_rate=0.1, increase=0.05, decrease=0.5):
+        self.rate = float(rate) if rate else None
+        self.burst = max(1, burst)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = float(self.burst)
+        self._last = _clock()
+        self._held_until = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until it is available
+        Returns the number of seconds waited
+        """
+        if self.rate is None and self._held_until is None:
+            return 0.0
+        with self._lock:
+            now = _clock()
+            wait = 0.0
+            if self._held_until is not None:
+                wait = self._held_until - now
+                if wait <= 0:
+                    self._held_until = None
+                    wait = 0.0
+            if self.rate is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                # Tokens can go negative: later callers queue up behind earlier ones
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def hold(self, seconds):
+        """Let no request through for the given number of seconds (e.g. a Retry-After)"""
+        with self._lock:
+            until = _clock() + seconds
+            if self._held_until is None or until > self._held_until:
+                self._held_until = until
+
+    def succeeded(self):
+        """Report a successful request: an adaptive rate grows"""
+        if self.max_rate is not None and self.rate is not None and self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self):
+        """Report that the server asked to slow down: an adaptive rate shrinks"""
+        if self.max_rate is not None and self.rate is not None:
+            with self._lock:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+def run_parallel(functions):
+    """Call the functions on one thread each, returns their results in order
+    The first error raised by a function is raised again once all are done
+    """
+    results = [None] * len(functions)
+    errors = [None] * len(functions)
+
+    def call(index, function):
+        try:
+            results[index] = function()
+        except Exception as error:
+            errors[index] = error
+
+    threads = [threading.Thread(target=call, args=(index, function), name="fitbit-fetch")
+               for index, function in enumerate(functions)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
+
+
+class FetchJob(collections.namedtuple("FetchJob", "client metric date")):
+    """One day of one metric for one client
+    metric is either an intraday metric name (see Client.intraday) or a
+    callable(client, date)
+    """
+
+    def fetch(self):
+        if callable(self.metric):
+            return self.metric(self.client, self.date)
+        return self.client.intraday(self.metric, self.date)
+
+
+FetchResult = collections.namedtuple("FetchResult", "job data error")
+
+
+class Fetcher(object):
+    """Runs FetchJobs on a bounded pool of worker threads
+
+    All the clients of the jobs share the fetcher's rate limiter; each client
+    keeps its own cookie jar and csrf token, shared by the workers.
+    """
+
+    def __init__(self, workers=4, rate=1.0, burst=1, rate_limiter=None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.rate_limiter = rate_limiter or RateLimiter(rate, burst)
+
+    @staticmethod
+    def jobs(clients, metrics, start, end):
+        """Return the jobs for every client x metric x day from start to end"""
+        return [FetchJob(client, metric, date)
+                for client in clients
+                for date in date_span(start, end)
+                for metric in metrics]
+
+    def run(self, jobs):
+        """Fetch the jobs, yielding a FetchResult for each as soon as it completes
+        Errors are not raised but returned in the error field of the result
+        """
+        jobs = list(jobs)
+        for client in set(job.client for job in jobs):
+            client.rate_limiter = self.rate_limiter
+
+        pending = queue.Queue()
+        for job in jobs:
+            pending.put(job)
+        done = queue.Queue()
+        stopped = threading.Event()
+
+        def work():
+            while not stopped.is_set():
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    done.put(FetchResult(job, job.fetch(), None))
+                except Exception as error:
+                    done.put(FetchResult(job, None, error))
+
+        for _ in range(min(self.workers, len(jobs))):
+            worker = threading.Thread(target=work, name="fitbit-fetch")
+            worker.daemon = True
+            worker.start()
+        try:
+            for _ in range(len(jobs)):
+                yield done.get()
+        finally:
+            # Let the workers drop the remaining jobs if the caller stops early
+            stopped.set()
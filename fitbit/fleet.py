@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Synchronisation of many accounts by worker processes sharing a work queue
+
+    queue = WorkQueue("~/fitbit/queue.sqlite")
+    for account in accounts:
+        queue.add(account, "steps", datetime.date(2014, 1, 1), datetime.date.today())
+    FleetRunner("~/fitbit/queue.sqlite", client_factory, sink_factory, processes=8).run()
+
+The work is split into jobs of one metric of one account over a range of
+days, kept in a SQLite database. A worker leases a job for lease_time seconds,
+renews the lease as it goes, and marks the job done once the sink has its
+days; the jobs of a worker that died go back to the queue when their lease
+expires. A job is only leased while no other job of its account is, so an
+account is fetched by one worker at a time (at most rate requests per
+second, see FleetRunner) and a slow account only holds one worker.
+
+Workers on other hosts can share the queue through a file system with
+working locks: run FleetRunner there too, or call its work() method.
+"""
+import collections
+import datetime
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from fitbit._util import _date, _flush
+from fitbit.fetch import RateLimiter
+from fitbit.ranges import date_span
+
+SCHEMA = """
+create table if not exists jobs (
+    id integer primary key,
+    account text not null,
+    metric text not null,
+    start text not null,
+    end text not null,
+    state text not null default 'pending',
+    owner text,
+    lease_until real,
+    not_before real not null default 0,
+    attempts integer not null default 0,
+    error text,
+    unique (account, metric, start, end)
+);
+create index if not exists jobs_state on jobs (state, not_before);
+create index if not exists jobs_account on jobs (account, state);
+"""
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job(collections.namedtuple("Job", "id account metric start end attempts owner")):
+    """A leased job: the days from start to end (both included) of one metric of one account"""
+
+
+class WorkQueue(object):
+    """Jobs of a fleet synchronisation in a SQLite database, see the module docstring
+
+    A failed job is retried after retry_delay seconds, doubled at each
+    attempt, until it failed max_attempts times. A job whose lease expired
+    counts as failed too once it used up its attempts.
+    """
+
+    def __init__(self, path, lease_time=300.0, max_attempts=5, retry_delay=60.0):
+        self.path = os.path.expanduser(path)
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Transactions are managed explicitly: leases are taken in BEGIN IMMEDIATE ones
+        self.db = sqlite3.connect(self.path, isolation_level=None, timeout=60.0)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, account, metric, start, end, days_per_job=31, requeue=False):
+        """Queue the days from start to end of a metric of an account, days_per_job per job
+        Jobs already queued are left as they are, unless requeue is true: they are then
+        pending again, even if done. Returns the number of jobs added or requeued
+        """
+        added = 0
+        days = list(date_span(start, end))
+        self._begin()
+        try:
+            for i in range(0, len(days), days_per_job):
+                key = (account, metric, str(days[i]), str(days[min(i + days_per_job, len(days)) - 1]))
+                cursor = self.db.execute("insert or ignore into jobs (account, metric, start, end) values (?, ?, ?, ?)", key)
+                if not cursor.rowcount and requeue:
+                    cursor = self.db.execute(
+                        "update jobs set state = ?, owner = null, lease_until = null, not_before = 0, "
+                        "attempts = 0, error = null "
+                        "where account = ? and metric = ? and start = ? and end = ? and state != ?",
+                        (PENDING,) + key + (LEASED,))
+                added += cursor.rowcount
+            self.db.execute("commit")
+        except BaseException:
+            self.db.execute("rollback")
+            raise
+        return added
+
+    def lease(self, owner, now=None):
+        """Lease the next pending job of an account without a leased job, returns a Job or None"""
+        now = time.time() if now is None else now
+        self._begin()
+        try:
+            # The jobs of the workers that stopped renewing their lease are pending again,
+            # or failed if they used up their attempts (e.g. each one killed its worker)
+            self.db.execute("update jobs set state = ?, owner = null, lease_until = null, error = ? "
+                            "where state = ? and lease_until < ? and attempts >= ?",
+                            (FAILED, "lease expired", LEASED, now, self.max_attempts))
+            self.db.execute("update jobs set state = ?, owner = null where state = ? and lease_until < ?",
+                            (PENDING, LEASED, now))
+            row = self.db.execute(
+                "select id, account, metric, start, end, attempts from jobs "
+                "where state = ? and not_before <= ? "
+                "and account not in (select account from jobs where state = ?) "
+                "order by not_before, id limit 1", (PENDING, now, LEASED)).fetchone()
+            if row is not None:
+                self.db.execute("update jobs set state = ?, owner = ?, lease_until = ?, attempts = attempts + 1 "
+                                "where id = ?", (LEASED, owner, now + self.lease_time, row[0]))
+            self.db.execute("commit")
+        except BaseException:
+            self.db.execute("rollback")
+            raise
+        if row is None:
+            return None
+        id, account, metric, start, end, attempts = row
+        return Job(id, account, metric, _date(start), _date(end), attempts + 1, owner)
+
+    def renew(self, job, now=None):
+        """Extend the lease of the job, returns False if the worker no longer holds it"""
+        now = time.time() if now is None else now
+        cursor = self.db.execute("update jobs set lease_until = ? where id = ? and owner = ? and state = ?",
+                                 (now + self.lease_time, job.id, job.owner, LEASED))
+        return cursor.rowcount == 1
+
+    def complete(self, job):
+        """Mark the job done, returns False if the worker no longer held it"""
+        cursor = self.db.execute("update jobs set state = ?, owner = null, lease_until = null, error = null "
+                                 "where id = ? and owner = ? and state = ?", (DONE, job.id, job.owner, LEASED))
+        return cursor.rowcount == 1
+
+    def fail(self, job, error, now=None):
+        """Put the job back in the queue for a later attempt, or mark it failed after max_attempts"""
+        now = time.time() if now is None else now
+        if job.attempts >= self.max_attempts:
+            state, not_before = FAILED, 0
+        else:
+            state, not_before = PENDING, now + self.retry_delay * 2 ** (job.attempts - 1)
+        cursor = self.db.execute("update jobs set state = ?, owner = null, lease_until = null, not_before = ?, "
+                                 "error = ? where id = ? and owner = ? and state = ?",
+                                 (state, not_before, str(error), job.id, job.owner, LEASED))
+        return cursor.rowcount == 1
+
+    def counts(self):
+        """Return {state: number of jobs}"""
+        counts = dict((state, 0) for state in (PENDING, LEASED, DONE, FAILED))
+        counts.update(self.db.execute("select state, count(*) from jobs group by state"))
+        return counts
+
+    def unfinished(self):
+        """Number of jobs pending or leased"""
+        return self.db.execute("select count(*) from jobs where state in (?, ?)", (PENDING, LEASED)).fetchone()[0]
+
+    def failures(self):
+        """Return [(account, metric, start, end, error), ...] of the failed jobs"""
+        rows = self.db.execute("select account, metric, start, end, error from jobs where state = ? order by id",
+                               (FAILED,))
+        return [(account, metric, _date(start), _date(end), error) for account, metric, start, end, error in rows]
+
+    def last_done(self, account, metric):
+        """Return the last day of the done jobs of a metric of an account, or None"""
+        end = self.db.execute("select max(end) from jobs where account = ? and metric = ? and state = ?",
+                              (account, metric, DONE)).fetchone()[0]
+        return _date(end) if end else None
+
+    def _begin(self):
+        # BEGIN IMMEDIATE takes the write lock at once: two workers cannot lease the same job
+        self.db.execute("begin immediate")
+
+
+class FleetRunner(object):
+    """Runs the jobs of a WorkQueue in worker processes
+
+    client_factory(account) returns the logged in Client of an account (e.g.
+    fitbit.SessionManager.client) and sink_factory() the sink(account, metric,
+    date, data) of a worker, like the sinks of SyncEngine. Both are called in
+    the worker processes, so they must be picklable where processes are not
+    forked: module level functions, or instances of module level classes.
+    The days of an account are written by one worker at a time, so the sink
+    can be a SeriesArchive or a SQLiteStorage shared by the workers.
+
+    Each account is fetched at most rate requests per second. day_fetchers
+    maps metrics that intraday_range does not fetch to a callable(client, date),
+    as in SyncEngine.
+    """
+
+    def __init__(self, path, client_factory, sink_factory, processes=4, lease_time=300.0, rate=1.0,
+                 day_fetchers=None, compact=True, poll_interval=5.0, max_attempts=5, retry_delay=60.0):
+        self.path = path
+        self.client_factory = client_factory
+        self.sink_factory = sink_factory
+        self.processes = processes
+        self.lease_time = lease_time
+        self.rate = rate
+        self.day_fetchers = day_fetchers or {}
+        self.compact = compact
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def queue(self):
+        return WorkQueue(self.path, self.lease_time, self.max_attempts, self.retry_delay)
+
+    def run(self):
+        """Run the jobs in processes worker processes (in this one if processes is 1)
+        until none is pending nor leased, returns WorkQueue.counts()
+        """
+        if self.processes <= 1:
+            self.work()
+        else:
+            workers = [multiprocessing.Process(target=self.work, name="fitbit-fleet-%d" % i)
+                       for i in range(self.processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        queue = self.queue()
+        try:
+            return queue.counts()
+        finally:
+            queue.close()
+
+    def work(self, owner=None):
+        """Lease and run jobs until none is pending nor leased, returns the number of jobs done"""
+        owner = owner or "%s:%d:%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        queue = self.queue()
+        clients = {}
+        sink = self.sink_factory()
+        done = 0
+        try:
+            while True:
+                job = queue.lease(owner)
+                if job is None:
+                    if not queue.unfinished():
+                        return done
+                    # The other jobs are leased, or waiting to be retried
+                    time.sleep(self.poll_interval)
+                    continue
+                try:
+                    client = clients.get(job.account)
+                    if client is None:
+                        client = clients[job.account] = self.client_factory(job.account)
+                        client.rate_limiter = RateLimiter(self.rate)
+                    self._run_job(queue, client, sink, job)
+                except Exception as error:
+                    queue.fail(job, "%s: %s" % (type(error).__name__, error))
+                else:
+                    if queue.complete(job):
+                        done += 1
+        finally:
+            queue.close()
+
+    def _run_job(self, queue, client, sink, job):
+        if job.metric in self.day_fetchers:
+            fetch = self.day_fetchers[job.metric]
+            days = ((date, fetch(client, date)) for date in date_span(job.start, job.end))
+        else:
+            days = client.intraday_range(job.metric, job.start, job.end, compact=self.compact)
+        renewed = time.time()
+        try:
+            for date, data in days:
+                sink(job.account, job.metric, date, data)
+                if time.time() - renewed > self.lease_time / 3:
+                    if not queue.renew(job):
+                        raise ValueError("the lease of job %d expired" % job.id)
+                    renewed = time.time()
+        finally:
+            _flush(sink)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Incremental parsing of the getGraphData (amchart XML) responses
+
+parse_graph_values() feeds the response to an XMLParser as the chunks
+arrive and only keeps the data/chart/graphs/graph/value elements: no tree
+is built. The &hellip; entity fitbit.com uses without declaring it is
+declared in an injected DOCTYPE instead of being replaced in the body.
+"""
+VALUE_PATH = ("data", "chart", "graphs", "graph", "value")
+
+# Declarations of the entities the responses use, fed before the root element
+ENTITY_DECLARATIONS = b'<!DOCTYPE graph [<!ENTITY hellip "...">]>'
+
+# Byte level fix-ups of the body, applied as it is streamed (see fix_chunks)
+STREAM_FIXUPS = ((u"d'éveil".encode("utf8"), u"d éveil".encode("utf8")),)
+
+
+class _GraphValues(object):
+    """XMLParser target collecting (description, text) of the value elements"""
+
+    def __init__(self):
+        self.values = []
+        self._path = []
+        self._description = None
+        self._text = None
+
+    def start(self, tag, attrib):
+        self._path.append(tag)
+        if tuple(self._path[1:]) == VALUE_PATH:
+            self._description = attrib.get("description")
+            self._text = []
+
+    def data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def end(self, tag):
+        if self._text is not None:
+            self.values.append((self._description, "".join(self._text)))
+            self._text = None
+        self._path.pop()
+
+    def close(self):
+        return self.values
+
+
+def fix_chunks(chunks, fixups=STREAM_FIXUPS):
+    """Apply the (old, new) byte replacements to a stream of chunks
+    The end of each chunk is held back so that matches across two chunks are replaced too
+    """
+    keep = max(len(old) for old, _ in fixups) - 1
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        for old, new in fixups:
+            pending = pending.replace(old, new)
+        if len(pending) > keep:
+            yield pending[:len(pending) - keep]
+            pending = pending[len(pending) - keep:]
+    if pending:
+        yield pending
+
+
+def parse_graph_values(chunks):
+    """Return the [(description, text), ...] of the graph value elements of a response
+    chunks is any iterable of bytes, e.g. the pieces of the body as they are received
+    """
+    return _parse(chunks).values
+
+
+def _parse(chunks):
+    import xml.etree.ElementTree as ET
+    target = _GraphValues()
+    parser = ET.XMLParser(target=target)
+    head = b""
+    for chunk in fix_chunks(chunks):
+        if head is None:
+            parser.feed(chunk)
+            continue
+        # The entity declarations go after the XML declaration, before the root element
+        head = (head + chunk).lstrip()
+        if head.startswith(b"<?xml"):
+            end = head.find(b"?>")
+            if end < 0:
+                continue
+            parser.feed(head[:end + 2])
+            head = head[end + 2:].lstrip()
+        if len(head) < 5 and b"<?xml".startswith(head):
+            continue
+        parser.feed(ENTITY_DECLARATIONS)
+        parser.feed(head)
+        head = None
+    if head is not None:
+        parser.feed(ENTITY_DECLARATIONS)
+        parser.feed(head)
+    parser.close()
+    return target
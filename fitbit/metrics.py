@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Instrumentation of the requests of Client
+
+Set client.instrumentation to a callable to receive a RequestEvent after
+each request; it is None by default, and no timing is done then. Metrics
+is such a callable, aggregating the events per endpoint:
+
+    metrics = fitbit.Metrics()
+    client.instrumentation = metrics
+    ...
+    print(metrics.prometheus())
+"""
+import json
+import threading
+
+
+# Upper bounds (seconds) of the buckets of the latency histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestEvent(object):
+    """What happened to one request
+
+    latency is the time spent opening the request (retries included) and
+    reading the response, wait the time the rate limiter (or an identical
+    request in flight, see fitbit.cache.RequestMemo) held it back and
+    parse_time the time spent decoding the response, either while it was
+    streamed or once it was read. cached is true for a response read from
+    the fitbit.cache.ResponseCache, memoized for one from the RequestMemo.
+    """
+
+    __slots__ = ("method", "path", "status", "bytes", "latency", "wait", "parse_time",
+                 "retries", "cached", "memoized", "error")
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.status = None
+        self.bytes = 0
+        self.latency = 0.0
+        self.wait = 0.0
+        self.parse_time = 0.0
+        self.retries = 0
+        self.cached = False
+        self.memoized = False
+        self.error = None
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return "<RequestEvent %s %s %s, %d bytes in %.3fs>" % (
+            self.method, self.path, self.error or self.status, self.bytes, self.latency)
+
+
+class _EndpointStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.wait = 0.0
+        self.parse_time = 0.0
+        self.retries = 0
+        self.cache_hits = 0
+        self.memo_hits = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, event):
+        self.requests += 1
+        self.errors += event.error is not None
+        self.bytes += event.bytes
+        self.latency += event.latency
+        self.wait += event.wait
+        self.parse_time += event.parse_time
+        self.retries += event.retries
+        self.cache_hits += event.cached
+        self.memo_hits += event.memoized
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if event.latency <= bound:
+                self.buckets[index] += 1
+                break
+
+    def as_dict(self):
+        return dict(requests=self.requests, errors=self.errors, bytes=self.bytes,
+                    latency_seconds=self.latency, wait_seconds=self.wait,
+                    parse_seconds=self.parse_time, retries=self.retries, cache_hits=self.cache_hits,
+                    memo_hits=self.memo_hits)
+
+
+class Metrics(object):
+    """Counters and timings per endpoint (method and path) of the RequestEvents
+
+    Share one Metrics between clients to aggregate their requests. callbacks
+    are called with each event too.
+    """
+
+    def __init__(self, callbacks=()):
+        self.callbacks = list(callbacks)
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        key = (event.method, event.path)
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = _EndpointStats()
+            stats.add(event)
+        for callback in self.callbacks:
+            callback(event)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+    def snapshot(self):
+        """Return {"METHOD path": {"requests": ..., "bytes": ..., ...}, ...}"""
+        with self._lock:
+            return dict(("%s %s" % key, stats.as_dict()) for key, stats in self.endpoints.items())
+
+    def json(self, **kwargs):
+        return json.dumps(self.snapshot(), sort_keys=True, **kwargs)
+
+    def prometheus(self, prefix="fitbit_"):
+        """Return the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            endpoints = sorted((key, stats.as_dict(), list(stats.buckets))
+                               for key, stats in self.endpoints.items())
+        lines = []
+        for name, field, kind, help in _PROMETHEUS_METRICS:
+            lines.append("# HELP %s%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s%s %s" % (prefix, name, kind))
+            for key, stats, _ in endpoints:
+                lines.append("%s%s{%s} %s" % (prefix, name, _labels(key), stats[field]))
+        name = prefix + "request_latency_seconds"
+        lines.append("# HELP %s Time to open the request and read the response" % name)
+        lines.append("# TYPE %s histogram" % name)
+        for key, stats, buckets in endpoints:
+            labels = _labels(key)
+            count = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                count += bucket
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, count))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, stats["requests"]))
+            lines.append("%s_sum{%s} %s" % (name, labels, stats["latency_seconds"]))
+            lines.append("%s_count{%s} %d" % (name, labels, stats["requests"]))
+        return "\n".join(lines) + "\n"
+
+
+_PROMETHEUS_METRICS = (
+    ("requests_total", "requests", "counter", "Requests made"),
+    ("request_errors_total", "errors", "counter", "Requests that failed"),
+    ("response_bytes_total", "bytes", "counter", "Bytes of the responses"),
+    ("retries_total", "retries", "counter", "Attempts made again after a failure"),
+    ("cache_hits_total", "cache_hits", "counter", "Responses read from the cache"),
+    ("memo_hits_total", "memo_hits", "counter", "Responses shared by the in-memory request memo"),
+    ("rate_limit_wait_seconds_total", "wait_seconds", "counter",
+     "Time held back by the rate limiter or waiting for an identical request in flight"),
+    ("parse_seconds_total", "parse_seconds", "counter", "Time spent decoding the responses"),
+)
+
+
+def _labels(key):
+    method, path = key
+    return 'method="%s",endpoint="%s"' % (method, path.replace("\\", "\\\\").replace('"', '\\"'))
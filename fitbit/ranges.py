@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import datetime
+import time
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def date_span(start, end):
+    """Return the list of dates from start to end (inclusive)"""
+    days = []
+    day = start
+    while day <= end:
+        days.append(day)
+        day += ONE_DAY
+    return days
+
+
+class IntradayRange(object):
+    """Intraday data of a date range, see Client.intraday_range
+
+    The range is split in as few graph requests as possible: one
+    getNewGraphData call per days_per_request days for the 5 minute metrics,
+    one getGraphData call per night for sleep (the sleep graph only covers one
+    night). Iterating yields (datetime.date, data) tuples in date order as the
+    responses arrive.
+
+    After (or during) an iteration, requests holds the number of requests made
+    and elapsed the seconds spent waiting for and decoding them.
+    """
+
+    def __init__(self, client, metric, start, end, days_per_request=31, compact=False):
+        if end < start:
+            raise ValueError("end date %s is before start date %s" % (end, start))
+        if days_per_request < 1:
+            raise ValueError("days_per_request must be at least 1")
+        self.client = client
+        self.metric = metric
+        self.start = start
+        self.end = end
+        self.days_per_request = days_per_request
+        self.compact = compact
+        self.requests = 0
+        self.elapsed = 0.0
+
+    def plan(self):
+        """Return the list of (date_from, date_to) spans that will be requested"""
+        step = 1 if self.metric == "sleep" else self.days_per_request
+        spans = []
+        span_start = self.start
+        while span_start <= self.end:
+            span_end = min(span_start + datetime.timedelta(days=step - 1), self.end)
+            spans.append((span_start, span_end))
+            span_start = span_end + ONE_DAY
+        return spans
+
+    def __iter__(self):
+        self.requests = 0
+        self.elapsed = 0.0
+        for date_from, date_to in self.plan():
+            started = time.time()
+            days = self._fetch(date_from, date_to)
+            self.requests += 1
+            self.elapsed += time.time() - started
+            for day in days:
+                yield day
+
+    def _fetch(self, date_from, date_to):
+        if self.metric == "sleep":
+            return [(date_from, self.client.intraday_sleep(date_from, compact=self.compact))]
+        graph_type = self.client._intraday_graph_type(self.metric)
+        return self.client._graphdata_range_request(graph_type, date_from, date_to, self.compact)
+
+    def __repr__(self):
+        return "<%s %s %s..%s: %d requests in %.3fs>" % (
+            type(self).__name__, self.metric, self.start, self.end, self.requests, self.elapsed)
+
+
+class DataDays(object):
+    """The days of a date range with data, see Client.days_with_data
+
+    totals maps every day of the range to the total of its values; days are
+    the sorted days with a total other than 0, first and last the first and
+    last of them (None if there are none). requests and elapsed are as in
+    IntradayRange.
+    """
+
+    def __init__(self, totals, requests=0, elapsed=0.0):
+        self.totals = totals
+        self.days = sorted(day for day, total in totals.items() if total)
+        self.first = self.days[0] if self.days else None
+        self.last = self.days[-1] if self.days else None
+        self.requests = requests
+        self.elapsed = elapsed
+
+    def __contains__(self, date):
+        return bool(self.totals.get(date))
+
+    def __iter__(self):
+        return iter(self.days)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __repr__(self):
+        return "<%s %d of %d days, %s..%s: %d requests in %.3fs>" % (
+            type(self).__name__, len(self.days), len(self.totals), self.first, self.last,
+            self.requests, self.elapsed)
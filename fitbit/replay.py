@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""Openers to run a Client without fitbit.com: record, replay or synthesize the responses
+
+    client = fitbit.Client.login(email, password)
+    client.opener = RecordingOpener(client.opener, "fixtures")
+    client.intraday_steps(datetime.date(2014, 5, 16))  # saved in fixtures
+
+    client = fitbit.Client(user_id, ReplayOpener("fixtures"))
+    client.intraday_steps(datetime.date(2014, 5, 16))  # read from fixtures
+
+The fixtures are keyed like the ResponseCache entries: by method, path and
+parameters, without the ts cache buster and the csrfToken. They hold the
+data of the account, but no password nor session cookie. Only successful
+responses are recorded.
+
+SyntheticOpener makes up plausible responses for any day (see
+benchmarks/bench_client.py), so that fixtures covering years can be
+recorded without an account.
+"""
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
+
+from fitbit._lazy import LazyModule
+from fitbit._util import _date
+from fitbit.cache import ResponseCache
+
+# urlparse and parse_qsl: the urllib module of Python 2 has neither
+urlparse = LazyModule("urllib.parse", "urlparse")
+
+# Index of the annotations in the ids made up by SyntheticOpener
+ANNOTATION_INDEX = 99
+
+# The 5 minute graph types summed by the daily graph types, see fitbit.client.DAILY_GRAPH_TYPES
+_DAILY_INTRADAY_TYPES = {
+    "caloriesBurned": "intradayCaloriesBurned",
+    "activeScore": "intradayActiveScore",
+    "distanceFromSteps": "intradayActiveScore",
+    "floorsClimbed": "intradayFloors",
+    "stepsTaken": "intradaySteps",
+}
+
+
+class ReplayResponse(object):
+    """Response returned by the openers of this module, like the ones of urllib"""
+
+    def __init__(self, body, url, code=200, headers=None):
+        self.code = code
+        self.url = url
+        self.headers = headers or {}
+        self._body = io.BytesIO(body)
+
+    def read(self, size=-1):
+        return self._body.read(size)
+
+    def close(self):
+        pass
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+
+def request_key(request):
+    """Return the fixture key of a urllib Request, see ResponseCache.key"""
+    url = urlparse.urlparse(request.get_full_url())
+    parameters = dict(urlparse.parse_qsl(url.query))
+    data = request.data
+    if data:
+        parameters.update(urlparse.parse_qsl(data.decode("utf8") if isinstance(data, bytes) else data))
+    return ResponseCache.key("POST" if data else "GET", url.path, parameters)
+
+
+class _Fixtures(object):
+    """Directory of fixture files: a JSON header line, then the body"""
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+
+    def filename(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf8")).hexdigest() + ".fixture")
+
+    def load(self, key):
+        """Return (meta, body) of the fixture, or None if there is none"""
+        try:
+            with open(self.filename(key), "rb") as f:
+                meta = json.loads(f.readline().decode("utf8"))
+                body = f.read()
+        except (IOError, OSError):
+            return None
+        if meta.get("key") != key:
+            return None
+        return meta, body
+
+    def save(self, key, url, code, body):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        meta = json.dumps({"key": key, "url": url, "code": code}).encode("utf8")
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(meta + b"\n" + body)
+        os.rename(tmp, self.filename(key))
+
+
+class RecordingOpener(object):
+    """Opener passing the requests to opener and saving the responses in directory"""
+
+    def __init__(self, opener, directory):
+        self.opener = opener
+        self.fixtures = _Fixtures(directory)
+        self.recorded = 0
+
+    def open(self, request, *args, **kwargs):
+        response = self.opener.open(request, *args, **kwargs)
+        try:
+            body = response.read()
+            url = response.geturl()
+            code = getattr(response, "code", 200)
+        finally:
+            response.close()
+        self.fixtures.save(request_key(request), url, code, body)
+        self.recorded += 1
+        return ReplayResponse(body, url, code)
+
+
+class ReplayOpener(object):
+    """Opener answering the requests with the fixtures of directory
+    A request without fixture raises a ValueError.
+    """
+
+    def __init__(self, directory):
+        self.fixtures = _Fixtures(directory)
+        self.replayed = 0
+
+    def open(self, request, *args, **kwargs):
+        key = request_key(request)
+        fixture = self.fixtures.load(key)
+        if fixture is None:
+            raise ValueError("No fixture for %s" % key)
+        meta, body = fixture
+        self.replayed += 1
+        return ReplayResponse(body, meta["url"], meta["code"])
+
+
+class SyntheticOpener(object):
+    """Opener making up the responses of the intraday, sleep and activity log calls
+
+    The data only depends on the seed and the request: every day has its
+    5 minute intraday values, a night of sleep ending on it and
+    logs_per_day activity logs with their minute graphs.
+    """
+
+    def __init__(self, seed=0, logs_per_day=2):
+        self.seed = seed
+        self.logs_per_day = logs_per_day
+
+    def open(self, request, *args, **kwargs):
+        url = urlparse.urlparse(request.get_full_url())
+        parameters = dict(urlparse.parse_qsl(url.query))
+        if url.path == "/graph/getGraphData":
+            body = self._graph_data(parameters)
+        elif url.path == "/graph/getNewGraphData":
+            body = self._new_graph_data(parameters)
+        elif url.path == "/ajaxapi":
+            data = request.data
+            body = self._ajaxapi(dict(urlparse.parse_qsl(data.decode("utf8") if isinstance(data, bytes) else data)))
+        else:
+            raise ValueError("No synthetic response for %s" % url.path)
+        return ReplayResponse(body, request.get_full_url())
+
+    def _random(self, *key):
+        return random.Random("%s %s" % (self.seed, " ".join(str(k) for k in key)))
+
+    def _graph_data(self, parameters):
+        graph_type = parameters["type"]
+        date = _date(parameters["dateTo"])
+        if graph_type == "intradaySleep":
+            values = self._sleep(date, parameters.get("arg"))
+        else:
+            rnd = self._random(graph_type, date)
+            values = [("", "%d.0" % (rnd.randint(0, 120) if 7 * 12 <= i < 22 * 12 else 0)) for i in range(288)]
+        return _amchart(values)
+
+    def _sleep(self, date, sleep_id):
+        rnd = self._random("sleep", date, sleep_id)
+        start = datetime.datetime.combine(date, datetime.time()) - datetime.timedelta(minutes=rnd.randint(0, 120))
+        return [("Sleep %s" % (start + datetime.timedelta(minutes=i)).strftime("%I:%M%p"),
+                 str(rnd.choice((1, 1, 1, 1, 2, 3))))
+                for i in range(rnd.randint(360, 540))]
+
+    def _new_graph_data(self, parameters):
+        graph_type = parameters["type"]
+        if graph_type.startswith("activityRecord"):
+            start, minutes = self._activity(parameters["arg"])
+            interval = datetime.timedelta(minutes=1)
+            rnd = self._random(graph_type, parameters["arg"])
+            points = [(start + interval * i, rnd.randint(0, 180)) for i in range(minutes)]
+        elif graph_type in _DAILY_INTRADAY_TYPES:
+            # The totals of the days of the 5 minute graph below
+            intraday_type = _DAILY_INTRADAY_TYPES[graph_type]
+            points = []
+            day = _date(parameters["dateFrom"])
+            while day <= _date(parameters["dateTo"]):
+                rnd = self._random(intraday_type, day)
+                points.append((datetime.datetime.combine(day, datetime.time()),
+                               sum(rnd.randint(0, 120) if 7 * 12 <= i < 22 * 12 else 0 for i in range(288))))
+                day += datetime.timedelta(days=1)
+        else:
+            interval = datetime.timedelta(minutes=5)
+            points = []
+            day = _date(parameters["dateFrom"])
+            while day <= _date(parameters["dateTo"]):
+                rnd = self._random(graph_type, day)
+                start = datetime.datetime.combine(day, datetime.time())
+                points.extend((start + interval * i, rnd.randint(0, 120) if 7 * 12 <= i < 22 * 12 else 0)
+                              for i in range(288))
+                day += datetime.timedelta(days=1)
+        data_points = [{"dateTime": timestamp.strftime("%Y-%m-%d %H:%M:%S"), "value": value}
+                       for timestamp, value in points]
+        return json.dumps({"graph": {"dataSets": {"activity": {"dataPoints": data_points}}}}).encode("utf8")
+
+    def _activity(self, log_id):
+        # The ids of the logs encode their day and index, see _activity_logs;
+        # the annotations of Client.day_details cover their whole day
+        log_id = int(log_id)
+        day = datetime.date.fromordinal(log_id // 100)
+        if log_id % 100 == ANNOTATION_INDEX:
+            return datetime.datetime.combine(day, datetime.time()), 24 * 60
+        rnd = self._random("log", log_id)
+        start = datetime.datetime.combine(day, datetime.time(7 + 12 * (log_id % 100) // self.logs_per_day))
+        return start + datetime.timedelta(minutes=rnd.randint(0, 240)), rnd.randint(15, 90)
+
+    def _ajaxapi(self, form):
+        results = {}
+        for call in json.loads(form["request"])["serviceCalls"]:
+            args = call["args"]
+            if call["method"] == "getActivitiesLogs":
+                result = self._activity_logs(_date(args["fromDate"]), _date(args["toDate"]),
+                                             args["offset"], args["limit"])
+            elif call["method"] == "postActivitiesAnnotations":
+                activity = json.loads(args["activity"])
+                result = {"id": _date(activity["date"]).toordinal() * 100 + ANNOTATION_INDEX,
+                          "date": activity["date"]}
+            else:
+                result = {}
+            results[call["id"]] = {"status": 200, "result": result}
+        return json.dumps(results).encode("utf8")
+
+    def _activity_logs(self, start, end, offset, limit):
+        # Most recent days first, like fitbit.com
+        logs = []
+        day = end
+        while day >= start and len(logs) < offset + limit:
+            for index in range(self.logs_per_day):
+                log_id = day.toordinal() * 100 + index
+                timestamp, minutes = self._activity(log_id)
+                steps = self._random("steps", log_id).randint(1000, 9000)
+                logs.append({"id": log_id,
+                             "dateTime": timestamp.strftime("%Y-%m-%dT%H:%M:%S.000-07:00"),
+                             "name": "Walk", "defaultName": "Walk",
+                             "steps": steps, "calories": steps // 20,
+                             "formattedDistance": "%.2f km" % (steps * 0.0008),
+                             "formattedDuration": "%d:%02d:00" % divmod(minutes, 60)})
+            day -= datetime.timedelta(days=1)
+        return logs[offset:offset + limit]
+
+
+def _amchart(values):
+    # A getGraphData response with one graph of (description, text) values
+    from xml.sax.saxutils import quoteattr
+    graph = "".join("<value description=%s>%s</value>" % (quoteattr(description), text)
+                    for description, text in values)
+    return ('<?xml version="1.0" encoding="UTF-8"?><settings><data><chart><graphs>'
+            '<graph gid="0">%s</graph></graphs></chart></data></settings>' % graph).encode("utf8")
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Retry of the failed requests, see Client.retry_policy
+
+A RetryPolicy tells which failures are worth another attempt and how long
+to wait before it: the delay the server asks for in Retry-After, or an
+exponential backoff with full jitter. Other HTTP errors are fatal and
+raised at once.
+"""
+import random
+import time
+
+from fitbit._lazy import LazyModule
+
+httplib = LazyModule("http.client", "httplib")
+urllib_error = LazyModule("urllib.error", "urllib2")
+
+# Too many requests, and the server errors that usually go away
+RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Statuses telling the client to slow down
+THROTTLE_STATUSES = frozenset([429, 503])
+
+# Statuses of a request made without a valid session, when the response is the login page
+EXPIRED_STATUSES = frozenset([401, 403])
+
+
+class SessionExpired(Exception):
+    """The fitbit.com session ended and the client could not log in again"""
+
+
+class RetryPolicy(object):
+    """How many times, and after how long, a failed request is attempted again
+
+    The n-th retry waits a random delay between 0 and backoff * 2 ** n seconds,
+    or the delay of the Retry-After header of the response, capped at max_delay.
+    statuses are the HTTP statuses retried; connection errors are always retried.
+
+    POSTs (the /ajaxapi calls, which can create data) are only retried when
+    the server asked to slow down (THROTTLE_STATUSES), or when the request
+    cannot have reached it (see not_sent).
+    """
+
+    def __init__(self, retries=4, backoff=0.5, max_delay=60.0, statuses=RETRYABLE_STATUSES):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.statuses = frozenset(statuses)
+
+    def retryable(self, status, method="GET", error=None):
+        """Whether a response with this status of a request of this method is retried
+        status is None for a connection error, given as error
+        """
+        if method == "POST":
+            if status is None:
+                return error is not None and not_sent(error)
+            return status in self.statuses and status in THROTTLE_STATUSES
+        return status is None or status in self.statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before the retry following the given attempt (0 for the first)"""
+        if retry_after is not None:
+            # A large Retry-After would hold back every user of a shared RateLimiter
+            return min(self.max_delay, max(0.0, retry_after))
+        return random.uniform(0, min(self.max_delay, self.backoff * 2 ** attempt))
+
+
+_connection_errors = None
+
+
+def connection_errors():
+    """The connection level failures, retried as RetryPolicy.retryable allows: a tuple of exception classes"""
+    global _connection_errors
+    if _connection_errors is None:
+        import socket
+        _connection_errors = (urllib_error.URLError, socket.error, httplib.HTTPException)
+    return _connection_errors
+
+
+def not_sent(error):
+    """Whether a connection error happened before the request reached the server:
+    the connection was refused, the host not found or the request not written
+    """
+    import errno
+    import socket
+    error = getattr(error, "reason", error)
+    if isinstance(error, (socket.gaierror, httplib.CannotSendRequest)):
+        return True
+    return isinstance(error, socket.error) and getattr(error, "errno", None) == errno.ECONNREFUSED
+
+
+def retry_after(headers, now=None):
+    """Seconds to wait given by the Retry-After header (seconds or HTTP date), or None"""
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import mktime_tz, parsedate_tz
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - (time.time() if now is None else now))
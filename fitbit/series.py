@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import collections
+import datetime
+from array import array
+
+
+class IntradaySeries(object):
+    """Values at a fixed interval from a start time, stored in an array
+
+    This is the compact form of the [(datetime.datetime, value), ...] lists
+    returned by the intraday calls (pass compact=True): iterating still yields
+    (datetime.datetime, value) tuples, built on the fly, but only the start
+    time, the interval and the array of values are kept in memory.
+
+    values is an array.array (typecode 'i' by default) and supports the
+    buffer protocol: memoryview(series.values) or series.to_numpy() give
+    access to the values without copying them.
+    """
+
+    def __init__(self, start, interval, values=(), typecode="i"):
+        self.start = start
+        self.interval = interval
+        self.values = values if isinstance(values, array) else array(typecode, values)
+
+    @classmethod
+    def from_pairs(cls, pairs, interval=None, fill=None, typecode="i"):
+        """Build a series from (datetime.datetime, value) pairs in time order
+        The interval is the one between the first two pairs if not given. Missing
+        points are set to fill, or raise a ValueError if fill is None.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            raise ValueError("cannot build a series from no data without a start time")
+        start = pairs[0][0]
+        if interval is None:
+            interval = pairs[1][0] - start if len(pairs) > 1 else datetime.timedelta(minutes=1)
+        step = _seconds(interval)
+        values = array(typecode)
+        for timestamp, value in pairs:
+            index = _seconds(timestamp - start) / step
+            if index != int(index) or index < len(values):
+                raise ValueError("%s is not on the %s grid of the series" % (timestamp, interval))
+            if index > len(values):
+                if fill is None:
+                    raise ValueError("missing data before %s" % timestamp)
+                values.extend([fill] * (int(index) - len(values)))
+            values.append(value)
+        return cls(start, interval, values)
+
+    @classmethod
+    def concat(cls, series):
+        """Join consecutive series (e.g. days of a range) into one"""
+        series = [s for s in series if len(s)]
+        if not series:
+            raise ValueError("nothing to concatenate")
+        first = series[0]
+        values = array(first.values.typecode, first.values)
+        end = first.end
+        for s in series[1:]:
+            if s.interval != first.interval or s.start != end:
+                raise ValueError("series starting at %s does not follow the one ending at %s" % (s.start, end))
+            values.extend(s.values)
+            end = s.end
+        return cls(first.start, first.interval, values)
+
+    @property
+    def end(self):
+        """Time following the last value"""
+        return self.start + self.interval * len(self.values)
+
+    def timestamp(self, index):
+        if index < 0:
+            index += len(self.values)
+        return self.start + self.interval * index
+
+    def timestamps(self):
+        timestamp = self.start
+        for _ in range(len(self.values)):
+            yield timestamp
+            timestamp += self.interval
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        timestamp = self.start
+        interval = self.interval
+        for value in self.values:
+            yield (timestamp, value)
+            timestamp += interval
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.values))
+            if step != 1:
+                raise ValueError("series slices cannot have a step")
+            return IntradaySeries(self.timestamp(start), self.interval, self.values[start:stop])
+        return (self.timestamp(index), self.values[index])
+
+    def __eq__(self, other):
+        if isinstance(other, IntradaySeries):
+            return (self.start, self.interval, self.values) == (other.start, other.interval, other.values)
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __buffer__(self, flags):
+        return memoryview(self.values)
+
+    def to_numpy(self):
+        """Return the values as a numpy array sharing the memory of the series"""
+        import numpy
+        return numpy.frombuffer(self.values, dtype=self.values.typecode)
+
+    def sum(self):
+        return sum(self.values)
+
+    def mean(self):
+        return float(sum(self.values)) / len(self.values) if self.values else None
+
+    def __repr__(self):
+        return "<IntradaySeries %s every %s, %d values>" % (self.start, self.interval, len(self.values))
+
+
+def _seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+class SeriesFrame(object):
+    """Several series aligned on their timestamps
+
+    timestamps is the sorted union of the timestamps of the series and
+    columns maps each series name to its list of values, None where the
+    series has no value for a timestamp. Iterating yields
+    (timestamp, value1, value2, ...) rows.
+    """
+
+    def __init__(self, timestamps, columns):
+        self.timestamps = timestamps
+        self.columns = columns
+
+    @classmethod
+    def align(cls, named_series):
+        """Build a frame from [(name, [(timestamp, value), ...]), ...]"""
+        named_series = [(name, dict(series)) for name, series in named_series]
+        timestamps = sorted(set().union(*[series.keys() for _, series in named_series]))
+        columns = collections.OrderedDict(
+            (name, [series.get(timestamp) for timestamp in timestamps]) for name, series in named_series)
+        return cls(timestamps, columns)
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        return iter(zip(self.timestamps, *self.columns.values()))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return "<SeriesFrame %s, %d rows>" % (", ".join(self.columns), len(self.timestamps))
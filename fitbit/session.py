@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Logged in Clients of many accounts, with their sessions kept on disk
+
+    sessions = SessionManager("~/.fitbit_sessions", {"me@example.com": "password"})
+    client = sessions.client("me@example.com")
+    ...
+    sessions.save()
+
+The cookies, user id and csrf token of each account are saved in the
+directory (readable by the owner only) and reused by the next runs: a
+saved session is not checked, and the account only logs in again when a
+request finds the session expired (see Client.reauthenticate), or when
+there is no saved session yet.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from fitbit._util import _name
+from fitbit.client import Client, cookielib
+
+
+class SessionManager(object):
+    """Clients of the accounts of credentials ({email: password}), created on first use"""
+
+    def __init__(self, directory, credentials=None, base_url="https://www.fitbit.com",
+                 pool_size=4, idle_timeout=30.0):
+        self.directory = os.path.expanduser(directory)
+        self.credentials = dict(credentials or {})
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.logins = 0
+        self._clients = {}
+        self._jars = {}
+        self._lock = threading.RLock()
+
+    def add(self, email, password):
+        self.credentials[email] = password
+
+    @property
+    def accounts(self):
+        return sorted(self.credentials)
+
+    def client(self, email):
+        """Return the Client of the account, from its saved session if there is one"""
+        with self._lock:
+            client = self._clients.get(email)
+            if client is None:
+                client = self._clients[email] = self._restore(email)
+            return client
+
+    def clients(self):
+        """Return [(email, Client), ...] for every account"""
+        return [(email, self.client(email)) for email in self.accounts]
+
+    def save(self, email=None):
+        """Save the session of the account, or of every account with a Client"""
+        with self._lock:
+            for account in [email] if email is not None else list(self._clients):
+                client = self._clients.get(account)
+                if client is not None:
+                    self._save(account, client)
+
+    def forget(self, email):
+        """Drop the Client and the saved session of the account"""
+        with self._lock:
+            self._clients.pop(email, None)
+            self._jars.pop(email, None)
+            for path in self._paths(email):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+
+    def _restore(self, email):
+        cookies_path, session_path = self._paths(email)
+        jar = cookielib.LWPCookieJar()
+        session = None
+        if os.path.exists(session_path) and os.path.exists(cookies_path):
+            try:
+                with open(session_path) as f:
+                    session = json.load(f)
+                jar.load(cookies_path, ignore_discard=True, ignore_expires=True)
+            except (ValueError, IOError, cookielib.LoadError):
+                session = None
+                jar.clear()
+            if session is not None and session.get("base_url") != self.base_url:
+                session = None
+                jar.clear()
+        self._jars[email] = jar
+
+        opener, pool = Client._build_opener(jar, self.pool_size, self.idle_timeout)
+        if session is None:
+            user_id, csrfToken = self._log_in(email, opener)
+        else:
+            user_id, csrfToken = session["user_id"], session["csrfToken"]
+        client = Client(user_id, opener, self.base_url, csrfToken)
+        client.connection_pool = pool
+        if email in self.credentials:
+            client.reauthenticate = lambda: self._log_in(email, opener)
+        if session is None:
+            self._save(email, client)
+        return client
+
+    def _log_in(self, email, opener):
+        password = self.credentials.get(email)
+        if password is None:
+            raise ValueError("No password for %s" % email)
+        user_id, csrfToken = Client._authenticate(opener, email, password, self.base_url)
+        with self._lock:
+            self.logins += 1
+            client = self._clients.get(email)
+            if client is not None:
+                # Called as client.reauthenticate: save the new session
+                client.user_id, client.csrfToken = user_id, csrfToken
+                self._save(email, client)
+        return user_id, csrfToken
+
+    def _save(self, email, client):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+        cookies_path, session_path = self._paths(email)
+        # mkstemp creates the files readable by the owner only; the renames
+        # replace the saved session atomically
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        os.close(fd)
+        self._jars[email].save(tmp, ignore_discard=True, ignore_expires=True)
+        os.rename(tmp, cookies_path)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"email": email, "user_id": client.user_id, "csrfToken": client.csrfToken,
+                       "base_url": client.url_base, "saved": time.time()}, f)
+        os.rename(tmp, session_path)
+
+    def _paths(self, email):
+        name = _name(email)
+        return (os.path.join(self.directory, name + ".cookies"),
+                os.path.join(self.directory, name + ".json"))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""SQLite storage of intraday data
+
+    storage = SQLiteStorage("~/fitbit.sqlite")
+    with storage.transaction():
+        for date, data in client.intraday_steps_range(start, end, compact=True):
+            storage.write(account, "steps", data)
+        storage.rollup(account, "steps", start, end)
+
+Samples are kept in one table keyed by (account, metric, timestamp), with
+the timestamp in seconds since the epoch of the naive (local) datetime, and
+the daily totals in a daily table computed in SQL. The database is in WAL
+mode so that readers are not blocked while a sync writes.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from itertools import repeat
+
+from fitbit._util import _EPOCH, _epoch
+from fitbit.series import IntradaySeries, _seconds
+
+SCHEMA = """
+create table if not exists samples (
+    account text not null,
+    metric text not null,
+    timestamp integer not null,
+    value integer,
+    primary key (account, metric, timestamp)
+) without rowid;
+create table if not exists daily (
+    account text not null,
+    metric text not null,
+    date text not null,
+    total integer,
+    primary key (account, metric, date)
+) without rowid;
+"""
+
+
+class SQLiteStorage(object):
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        # Transactions are managed explicitly, see transaction()
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("pragma synchronous=normal")
+        self.db.executescript(SCHEMA)
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def close(self):
+        self.db.close()
+
+    @contextmanager
+    def transaction(self):
+        """Group the writes in one transaction; nested calls join the outer one"""
+        with self._lock:
+            if self._depth == 0:
+                self.db.execute("begin")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.db.execute("rollback")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.db.execute("commit")
+
+    def write(self, account, metric, data):
+        """Insert or replace the samples of an IntradaySeries or of a [(datetime, value), ...] list
+        Returns the number of samples written
+        """
+        if isinstance(data, IntradaySeries):
+            start = _epoch(data.start)
+            step = int(_seconds(data.interval))
+            timestamps = range(start, start + step * len(data.values), step)
+            rows = zip(repeat(account), repeat(metric), timestamps, data.values)
+            count = len(data.values)
+        else:
+            data = list(data)
+            rows = ((account, metric, _epoch(timestamp), value) for timestamp, value in data)
+            count = len(data)
+        with self.transaction():
+            self.db.executemany("insert or replace into samples values (?, ?, ?, ?)", rows)
+        return count
+
+    def rollup(self, account, metric, start, end):
+        """Compute the daily totals of the days from start to end, both included"""
+        with self.transaction():
+            self.db.execute(
+                "insert or replace into daily "
+                "select account, metric, date(timestamp, 'unixepoch'), sum(value) from samples "
+                "where account = ? and metric = ? and timestamp >= ? and timestamp < ? "
+                "group by account, metric, date(timestamp, 'unixepoch')",
+                (account, metric, _epoch(start), _epoch(end + datetime.timedelta(days=1))))
+
+    def sink(self):
+        """Return a SyncEngine sink writing to this storage, one transaction per request"""
+        return StorageSink(self)
+
+    def samples(self, account, metric, start, end):
+        """Return the [(datetime.datetime, value), ...] of the days from start to end"""
+        rows = self.db.execute(
+            "select timestamp, value from samples "
+            "where account = ? and metric = ? and timestamp >= ? and timestamp < ? order by timestamp",
+            (account, metric, _epoch(start), _epoch(end + datetime.timedelta(days=1))))
+        return [(_EPOCH + datetime.timedelta(seconds=timestamp), value) for timestamp, value in rows]
+
+    def daily(self, account, metric, start, end):
+        """Return the [(datetime.date, total), ...] of the days from start to end"""
+        rows = self.db.execute(
+            "select date, total from daily where account = ? and metric = ? and date >= ? and date <= ? order by date",
+            (account, metric, str(start), str(end)))
+        return [(datetime.datetime.strptime(date, "%Y-%m-%d").date(), total) for date, total in rows]
+
+
+class StorageSink(object):
+    """SyncEngine sink: buffers the days in an open transaction until the
+    engine saves its state (flush), then rolls up the days and commits
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._days = {}
+        self._transaction = None
+
+    def __call__(self, account, metric, date, data):
+        if data is None:
+            return
+        if self._transaction is None:
+            self._transaction = self.storage.transaction()
+            self._transaction.__enter__()
+        self.storage.write(account, metric, data)
+        self._days.setdefault((account, metric), []).append(date)
+
+    def flush(self):
+        if self._transaction is None:
+            return
+        try:
+            for (account, metric), dates in self._days.items():
+                self.storage.rollup(account, metric, min(dates), max(dates))
+        finally:
+            self._days = {}
+            transaction, self._transaction = self._transaction, None
+            transaction.__exit__(None, None, None)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Incremental synchronisation of intraday data
+
+SyncState records, per account and metric, which days were fetched and
+whether they were fetched after the day was over (complete). SyncEngine
+uses it to fetch only the missing, incomplete or still mutable days, and
+saves it as it goes so that an interrupted sync resumes where it stopped.
+
+    state = SyncState("~/fitbit/sync_state.json")
+    engine = SyncEngine(client, state, sink, metrics=("steps", "sleep"))
+    engine.run(datetime.date(2014, 1, 1), datetime.date.today())
+
+where sink(account, metric, date, data) stores the data of one day.
+"""
+import datetime
+import json
+import os
+import tempfile
+import threading
+
+from fitbit._util import _flush
+from fitbit.fetch import FetchJob
+from fitbit.ranges import ONE_DAY, date_span
+from fitbit.series import IntradaySeries
+
+_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class SyncState(object):
+    """Per account, per metric record of the days fetched, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self._accounts = json.load(f)
+        else:
+            self._accounts = {}
+
+    def day(self, account, metric, date):
+        """Return {"fetched": ..., "complete": bool} for a day, or None if never fetched"""
+        return self._accounts.get(account, {}).get(metric, {}).get(str(date))
+
+    def record(self, account, metric, date, fetched_at=None):
+        """Record that the data of the day was fetched at fetched_at (now by default)"""
+        if fetched_at is None:
+            fetched_at = datetime.datetime.now()
+        complete = fetched_at >= datetime.datetime.combine(date + ONE_DAY, datetime.time())
+        with self._lock:
+            days = self._accounts.setdefault(account, {}).setdefault(metric, {})
+            days[str(date)] = {"fetched": fetched_at.strftime(_DATETIME_FORMAT), "complete": complete}
+
+    def forget(self, account, metric=None):
+        """Drop the records of an account, or of one metric of an account"""
+        with self._lock:
+            if metric is None:
+                self._accounts.pop(account, None)
+            else:
+                self._accounts.get(account, {}).pop(metric, None)
+
+    def high_water(self, account, metric):
+        """Most recent day fetched complete, or None"""
+        days = self._accounts.get(account, {}).get(metric, {})
+        complete = [day for day, record in days.items() if record["complete"]]
+        if not complete:
+            return None
+        return datetime.datetime.strptime(max(complete), "%Y-%m-%d").date()
+
+    def save(self):
+        """Write the state, atomically: a crash leaves the previous state"""
+        directory = os.path.dirname(self.path) or "."
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._lock:
+            data = json.dumps(self._accounts, sort_keys=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.rename(tmp, self.path)
+
+
+class SyncEngine(object):
+    """Fetches the days of a range that the SyncState does not have complete
+
+    metrics are intraday metric names (see Client.intraday), fetched with
+    Client.intraday_range; day_fetchers maps other names to a
+    callable(client, date) fetching one day. Days newer than mutable_days ago
+    (today and yesterday by default) are always fetched again, as are the
+    days fetched before they were over. sink(account, metric, date, data) is
+    called with the data of each day, in the order of the metrics then of the
+    dates; the state is saved after every request, after calling the flush()
+    method of the sink if it has one.
+
+    range_fetchers maps names to a callable(client, dates) fetching the
+    given days together and yielding their (date, data), e.g. for
+    Client.day_details whose requests are shared by consecutive days; it is
+    called once per run with all the planned days.
+
+    With a fitbit.fetch.Fetcher, the metrics fetched one day per request
+    (sleep and the day_fetchers) are fetched concurrently; their days then
+    reach the sink in the order they complete.
+
+    With skip_empty, the days without steps are skipped: steps are fetched
+    first and their totals tell which days have data; the other planned
+    days are looked up with Client.days_with_data. The other intraday
+    metrics then skip the days before the first one with steps, and sleep,
+    the day_fetchers and the range_fetchers only fetch the days with steps
+    (the mutable days are always fetched). The days skipped are recorded in
+    the state like fetched ones, without reaching the sink.
+    """
+
+    def __init__(self, client, state, sink, metrics=("steps",), day_fetchers=None,
+                 account=None, mutable_days=2, days_per_request=31, compact=False, fetcher=None,
+                 skip_empty=False, range_fetchers=None):
+        self.client = client
+        self.state = state
+        self.sink = sink
+        self.metrics = list(metrics)
+        self.day_fetchers = day_fetchers or {}
+        self.range_fetchers = range_fetchers or {}
+        self.account = account or client.user_id
+        self.mutable_days = mutable_days
+        self.days_per_request = days_per_request
+        self.compact = compact
+        self.fetcher = fetcher
+        self.skip_empty = skip_empty
+
+    def needs_fetch(self, metric, date, today=None):
+        if today is None:
+            today = datetime.date.today()
+        if (today - date).days < self.mutable_days:
+            return True
+        record = self.state.day(self.account, metric, date)
+        return record is None or not record["complete"]
+
+    def plan(self, start, end, force=False):
+        """Return {metric: [dates to fetch], ...}"""
+        today = datetime.date.today()
+        end = min(end, today)
+        return dict((metric, [date for date in date_span(start, end)
+                              if force or self.needs_fetch(metric, date, today)])
+                    for metric in self._names())
+
+    def run(self, start, end, force=False):
+        """Fetch what plan() returns (less the empty days with skip_empty),
+        returns the number of days fetched per metric
+        """
+        plan = self.plan(start, end, force)
+        names = self._names()
+        # With skip_empty, the steps are fetched first: {date: total steps}
+        totals = None
+        if self.skip_empty:
+            totals = {}
+            if "steps" in names:
+                names = ["steps"] + [name for name in names if name != "steps"]
+        fetched = {}
+        for metric in names:
+            dates = plan[metric]
+            if totals is not None and metric != "steps":
+                with_data = set(self._with_data(metric, dates, totals))
+                self._skip(metric, [date for date in dates if date not in with_data])
+                dates = [date for date in dates if date in with_data]
+            fetched[metric] = self._run_metric(metric, dates, totals if metric == "steps" else None)
+        return fetched
+
+    def _run_metric(self, metric, dates, totals=None):
+        if metric in self.range_fetchers:
+            return self._run_range(metric, dates)
+        fetched = 0
+        for span_start, span_end in _spans(dates):
+            if self.fetcher is not None and (metric in self.day_fetchers or metric == "sleep"):
+                fetched += self._run_concurrently(metric, span_start, span_end)
+                continue
+            if metric in self.day_fetchers:
+                last_of_request = set(date_span(span_start, span_end))
+                days = ((date, self.day_fetchers[metric](self.client, date))
+                        for date in date_span(span_start, span_end))
+            else:
+                days = self.client.intraday_range(metric, span_start, span_end,
+                                                  self.days_per_request, self.compact)
+                last_of_request = set(date_to for _, date_to in days.plan())
+            for date, data in days:
+                if totals is not None:
+                    totals[date] = _total(data)
+                self.sink(self.account, metric, date, data)
+                self.state.record(self.account, metric, date)
+                fetched += 1
+                # Save once the days of a request are stored, to resume after them
+                if date in last_of_request:
+                    self._save()
+        return fetched
+
+    def _with_data(self, metric, dates, totals):
+        # The dates worth fetching, given the {date: total steps} known so far;
+        # the days the steps fetch did not cover are probed
+        unknown = [date for date in dates if date not in totals]
+        if unknown:
+            data_days = self.client.days_with_data(min(unknown), max(unknown))
+            for date, total in data_days.totals.items():
+                totals.setdefault(date, total)
+        today = datetime.date.today()
+        if metric in self.day_fetchers or metric in self.range_fetchers or metric == "sleep":
+            keep = lambda date: totals.get(date)
+        else:
+            first = min([date for date, total in totals.items() if total] or [None])
+            keep = lambda date: first is not None and date >= first
+        return [date for date in dates if (today - date).days < self.mutable_days or keep(date)]
+
+    def _skip(self, metric, dates):
+        # The empty days are recorded like fetched ones, so that the next runs do not plan them again
+        for date in dates:
+            self.state.record(self.account, metric, date)
+        if dates:
+            self.state.save()
+
+    def _names(self):
+        return self.metrics + list(self.day_fetchers) + list(self.range_fetchers)
+
+    def _run_range(self, metric, dates):
+        if not dates:
+            return 0
+        fetched = 0
+        for date, data in self.range_fetchers[metric](self.client, dates):
+            self.sink(self.account, metric, date, data)
+            self.state.record(self.account, metric, date)
+            fetched += 1
+            self._save()
+        return fetched
+
+    def _run_concurrently(self, metric, start, end):
+        if metric in self.day_fetchers:
+            fetch = self.day_fetchers[metric]
+        else:
+            fetch = lambda client, date: client.intraday(metric, date, compact=self.compact)
+        fetched = 0
+        try:
+            for result in self.fetcher.run(FetchJob(self.client, fetch, date) for date in date_span(start, end)):
+                if result.error is not None:
+                    raise result.error
+                self.sink(self.account, metric, result.job.date, result.data)
+                self.state.record(self.account, metric, result.job.date)
+                fetched += 1
+        finally:
+            self._save()
+        return fetched
+
+    def _save(self):
+        _flush(self.sink)
+        self.state.save()
+
+
+def _total(data):
+    # Total of the values of a day, an IntradaySeries or a [(datetime, value), ...] list
+    values = data.values if isinstance(data, IntradaySeries) else [value for _, value in data]
+    return sum(values)
+
+
+def _spans(dates):
+    # Group sorted dates into runs of consecutive days: [(first, last), ...]
+    spans = []
+    for date in dates:
+        if spans and spans[-1][1] + ONE_DAY == date:
+            spans[-1][1] = date
+        else:
+            spans.append([date, date])
+    return [tuple(span) for span in spans]
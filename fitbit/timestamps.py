@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Decoding of the few timestamp formats fitbit.com sends
+
+- ISO date times of the getNewGraphData data points and of the activity
+  logs: "2014-05-16 10:16:00", "2014-05-16T10:16:00.000-07:00", ...
+- times of day at the end of the getGraphData sleep descriptions:
+  "11:05PM" or "23:05"
+
+The fields are sliced at fixed positions instead of going through strptime
+or dateutil, and the times of day, which repeat across nights, are cached.
+"""
+import datetime
+
+_ZERO = datetime.timedelta(0)
+
+
+class FixedOffset(datetime.tzinfo):
+    """Time zone at a fixed offset from UTC, as given in the ISO date times"""
+
+    def __init__(self, minutes):
+        self._offset = datetime.timedelta(minutes=minutes)
+        self._name = "%s%02d:%02d" % ("-" if minutes < 0 else "+", abs(minutes) // 60, abs(minutes) % 60)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return _ZERO
+
+    def tzname(self, dt):
+        return self._name
+
+    def __reduce__(self):
+        return (FixedOffset, (self._offset.days * 1440 + self._offset.seconds // 60,))
+
+    def __repr__(self):
+        return "FixedOffset(%s)" % self._name
+
+
+_UTC = FixedOffset(0)
+_offsets = {}
+
+
+def _timezone(text):
+    if text == "Z":
+        return _UTC
+    tz = _offsets.get(text)
+    if tz is None:
+        digits = text[1:].replace(":", "")
+        minutes = int(digits[:2]) * 60 + int(digits[2:4] or 0)
+        tz = _offsets[text] = FixedOffset(-minutes if text[0] == "-" else minutes)
+    return tz
+
+
+def parse_datetime(value, keep_tz=False):
+    """Parse an ISO date time: YYYY-MM-DD[T ]HH:MM[:SS[.fff]][Z|+HH:MM|-HH:MM]
+
+    The result is naive, in the local time of the data, unless keep_tz is
+    true and the value has an offset.
+    """
+    tz = None
+    if keep_tz and len(value) > 19:
+        rest = value[19:] if value[16:17] == ":" else value[16:]
+        if rest[0] == ".":
+            rest = rest.lstrip(".0123456789")
+        if rest:
+            tz = _timezone(rest)
+    try:
+        return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                 int(value[11:13]), int(value[14:16]),
+                                 int(value[17:19]) if value[16:17] == ":" else 0, 0, tz)
+    except ValueError:
+        raise ValueError("time data %r is not an ISO date time" % value)
+
+
+def _parse_12h(text):
+    hours, minutes = text[:-2].split(":")
+    hours = int(hours) % 12
+    if text[-2:].upper() == "PM":
+        hours += 12
+    return datetime.time(hours, int(minutes))
+
+
+def _parse_24h(text):
+    hours, minutes = text.split(":")
+    return datetime.time(int(hours), int(minutes))
+
+
+class TimeOfDayDecoder(object):
+    """Parses "11:05PM" or "23:05" into datetime.time
+
+    The format is detected on the first value; a value in the other format
+    switches the decoder to it. Use one decoder per response (or more): the
+    decoded strings are cached.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._parse = None
+
+    def __call__(self, text):
+        time = self._cache.get(text)
+        if time is not None:
+            return time
+        twelve_hours = text[-2:].upper() in ("AM", "PM")
+        if self._parse is None or (self._parse is _parse_12h) != twelve_hours:
+            self._parse = _parse_12h if twelve_hours else _parse_24h
+        try:
+            time = self._parse(text)
+        except ValueError:
+            raise ValueError("time data %r is not a time of day" % text)
+        self._cache[text] = time
+        return time
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""Persistent (keep-alive) HTTP connections for the urllib opener of Client
+
+KeepAliveHandler and KeepAliveHTTPSHandler replace the default urllib
+handlers: connections are kept per host in a ConnectionPool and reused
+for the following requests. Response bodies are streamed: the connection
+goes back to the pool once the body has been read to the end.
+
+DecompressionHandler accepts gzip/deflate encoded responses and decodes
+them as they are read, whichever handler opened the connection.
+"""
+import socket
+import threading
+import zlib
+
+from fitbit._lazy import LazyModule
+from fitbit._util import _clock
+
+httplib = LazyModule("http.client", "httplib")
+urllib_request = LazyModule("urllib.request", "urllib2")
+urllib_error = LazyModule("urllib.error", "urllib2")
+urllib_response = LazyModule("urllib.response", "urllib")
+
+
+# Errors of a reused connection meaning the server closed it while it was idle, see _stale()
+_NOT_SENT_ERRORS = (httplib.CannotSendRequest, socket.error)
+_NO_RESPONSE_ERRORS = (httplib.BadStatusLine,)
+
+
+class ConnectionPool(object):
+    """Idle HTTP connections kept per (scheme, host)
+
+    At most maxsize idle connections are kept per host, and connections idle
+    for more than idle_timeout seconds are closed instead of reused. The
+    opened and reused counters tell how many connections had to be set up
+    and how many requests went over an existing one.
+    """
+
+    def __init__(self, maxsize=4, idle_timeout=30.0):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self.reused = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return an idle connection to the host key, or None"""
+        now = _clock()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, released = idle.pop()
+                if now - released <= self.idle_timeout:
+                    self.reused += 1
+                    return connection
+                connection.close()
+        return None
+
+    def connect(self, factory):
+        """Return a new connection made by factory()"""
+        with self._lock:
+            self.opened += 1
+        return factory()
+
+    def put(self, key, connection):
+        """Give back a connection after its response has been read entirely"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((connection, _clock()))
+                return
+        connection.close()
+
+    def clear(self):
+        """Close all the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def stats(self):
+        return {"opened": self.opened, "reused": self.reused,
+                "idle": sum(len(c) for c in self._idle.values())}
+
+
+class _StreamedBody(object):
+    """File-like body of a response, read in the chunks that _fill() returns"""
+
+    _buffer = b""
+    _done = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [self._buffer]
+            while not self._done:
+                chunks.append(self._fill())
+            self._buffer = b""
+            return b"".join(chunks)
+        while len(self._buffer) < size and not self._done:
+            self._buffer += self._fill(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while b"\n" not in self._buffer and not self._done:
+            self._buffer += self._fill()
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def _fill(self, size=16384):
+        raise NotImplementedError
+
+
+class _PooledBody(_StreamedBody):
+    """Body of a response read from a pooled connection
+
+    The connection goes back to the pool once the body is read entirely, and
+    is closed if the body is closed (or fails) before that.
+    """
+
+    def __init__(self, response, connection, release):
+        self._response = response
+        self._connection = connection
+        self._release = release
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        self._done = True
+        if connection is not None:
+            # The rest of the response is still on the way: the connection cannot be reused
+            connection.close()
+
+    def _fill(self, size=16384):
+        try:
+            data = self._response.read(size)
+        except Exception:
+            self.close()
+            raise
+        if not data:
+            self._done = True
+            connection, self._connection = self._connection, None
+            if connection is not None:
+                self._release(connection)
+        return data
+
+
+class _DecodedBody(_StreamedBody):
+    """Body of a gzip or deflate encoded response, decoded as it is read"""
+
+    def __init__(self, body, encoding):
+        self._body = body
+        self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+
+    def close(self):
+        self._done = True
+        self._body.close()
+
+    def _fill(self, size=16384):
+        data = self._body.read(size)
+        if not data:
+            self._done = True
+            return self._decoder.flush() if self._decoder is not None else b""
+        if self._decoder is None:
+            # some servers send raw deflate data without the zlib header
+            self._decoder = zlib.decompressobj(zlib.MAX_WBITS if data[:1] == b"\x78" else -zlib.MAX_WBITS)
+        return self._decoder.decompress(data)
+
+
+def _stale(error, sent):
+    # True if the server closed the idle connection before it got the request:
+    # the request could not be written, or no byte of response was received
+    if not sent:
+        return isinstance(error, _NOT_SENT_ERRORS)
+    return isinstance(error, _NO_RESPONSE_ERRORS) and getattr(error, "line", "") in ("", "''", None) \
+        or type(error).__name__ == "RemoteDisconnected"
+
+
+class _KeepAliveMixin(object):
+
+    def _open(self, req, connection_class, scheme, **connection_args):
+        host = req.host if hasattr(req, "host") else req.get_host()
+        if not host:
+            raise urllib_error.URLError("no host given")
+        key = (scheme, host)
+        timeout = getattr(req, "timeout", None) or socket.getdefaulttimeout()
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
+        headers["Connection"] = "keep-alive"
+        headers = dict((name.title(), value) for name, value in headers.items())
+
+        selector = req.selector if hasattr(req, "selector") else req.get_selector()
+        data = req.data if hasattr(req, "data") else req.get_data()
+
+        factory = lambda: connection_class(host, timeout=timeout, **connection_args)
+        method = req.get_method()
+        connection = self.pool.get(key)
+        response = None
+        if connection is not None:
+            sent = False
+            try:
+                connection.request(method, selector, data, headers)
+                sent = True
+                response = connection.getresponse()
+            except Exception as error:
+                connection.close()
+                # Only a request the server cannot have received is sent again, and
+                # never a POST: the /ajaxapi calls are not idempotent
+                if method == "POST" or not _stale(error, sent):
+                    if isinstance(error, socket.error):
+                        raise urllib_error.URLError(error)
+                    raise
+        if response is None:
+            connection = self.pool.connect(factory)
+            try:
+                connection.request(method, selector, data, headers)
+                response = connection.getresponse()
+            except socket.error as error:
+                connection.close()
+                raise urllib_error.URLError(error)
+
+        def release(connection):
+            if response.will_close:
+                connection.close()
+            else:
+                self.pool.put(key, connection)
+
+        # The body is streamed: the caller reads it as it arrives
+        body = _PooledBody(response, connection, release)
+        result = urllib_response.addinfourl(body, response.msg, req.get_full_url(), response.status)
+        result.msg = response.reason
+        return result
+
+
+class DecompressionHandler(urllib_request.BaseHandler):
+    """Asks for gzip/deflate encoded responses and decodes them as they are read"""
+
+    def http_request(self, req):
+        if not req.has_header("Accept-encoding"):
+            req.add_unredirected_header("Accept-encoding", "gzip, deflate")
+        return req
+
+    def http_response(self, req, response):
+        info = response.info()
+        encoding = info.get("Content-Encoding", "").lower()
+        if encoding not in ("gzip", "deflate"):
+            return response
+        del info["Content-Encoding"]
+        if "Content-Length" in info:
+            del info["Content-Length"]
+        result = urllib_response.addinfourl(_DecodedBody(response, encoding), info, response.geturl(), response.getcode())
+        result.msg = getattr(response, "msg", "")
+        return result
+
+    https_request = http_request
+    https_response = http_response
+
+
+class KeepAliveHandler(_KeepAliveMixin, urllib_request.HTTPHandler):
+
+    def __init__(self, pool=None):
+        urllib_request.HTTPHandler.__init__(self)
+        self.pool = pool if pool is not None else ConnectionPool()
+
+    def http_open(self, req):
+        return self._open(req, httplib.HTTPConnection, "http")
+
+
+class KeepAliveHTTPSHandler(_KeepAliveMixin, urllib_request.HTTPSHandler):
+
+    def __init__(self, pool=None, context=None):
+        urllib_request.HTTPSHandler.__init__(self)
+        self.pool = pool if pool is not None else ConnectionPool()
+        self.context = context
+
+    def https_open(self, req):
+        if self.context is not None:
+            return self._open(req, httplib.HTTPSConnection, "https", context=self.context)
+        return self._open(req, httplib.HTTPSConnection, "https")
+
+
+def keep_alive_handlers(pool_size=4, idle_timeout=30.0):
+    """Return the HTTP and HTTPS handlers sharing a new ConnectionPool, to give to build_opener"""
+    pool = ConnectionPool(pool_size, idle_timeout)
+    return KeepAliveHandler(pool), KeepAliveHTTPSHandler(pool)
@@ -7,7 +7,7 @@ setup(name="fitbit",
       author="Wade Simmons",
       author_email="wade@wades.im",
       url="http://github.com/wadey/python-fitbit",
-      packages = find_packages(),
+      packages = find_packages(exclude=["tests"]),
       license = "MIT License",
       keywords="fitbit",
       zip_safe = True)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""SeriesArchive round-trips and the conversion of the CSV dumps"""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import fitbit
+from fitbit.archive import convert_csv_dump
+
+DAY = datetime.date(2014, 5, 16)
+
+
+def day_of(values, date=DAY, minutes=5):
+    start = datetime.datetime.combine(date, datetime.time())
+    return [(start + datetime.timedelta(minutes=minutes * i), value) for i, value in enumerate(values)]
+
+
+class SeriesArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def archive(self, **kwargs):
+        return fitbit.SeriesArchive(os.path.join(self.directory, "archive"), **kwargs)
+
+    def test_round_trip(self):
+        steps = day_of([i * 7 % 113 for i in range(288)])
+        pace = day_of([12.25 + i for i in range(10)], minutes=1)
+        for compress in (True, False):
+            archive = self.archive(compress=compress)
+            archive.write("a@b.c", "steps", DAY, steps)
+            archive.write("a@b.c", "pace", DAY, pace)
+            archive.write("a@b.c", "steps", DAY + datetime.timedelta(days=1), [])
+            self.assertEqual(archive.read("a@b.c", "steps", DAY), steps)
+            self.assertEqual(archive.read("a@b.c", "pace", DAY), pace)
+            self.assertEqual(archive.read("a@b.c", "steps", DAY + datetime.timedelta(days=1)), [])
+            self.assertIsNone(archive.read("a@b.c", "steps", DAY - datetime.timedelta(days=1)))
+            self.assertEqual(list(archive.arrays("a@b.c", "pace", DAY)[1]), [value for _, value in pace])
+            archive.close()
+            shutil.rmtree(os.path.join(self.directory, "archive"))
+
+    def test_reopened(self):
+        steps = day_of(range(288))
+        archive = self.archive()
+        archive.write("a", "steps", DAY, steps)
+        archive.close()
+        archive = self.archive()
+        self.assertEqual(archive.read("a", "steps", DAY), steps)
+        self.assertEqual(archive.days("a", "steps", 2014), [DAY])
+
+    def test_rewritten_day_and_compact(self):
+        archive = self.archive()
+        archive.write("a", "steps", DAY, day_of([1, 2, 3]))
+        archive.write("a", "steps", DAY + datetime.timedelta(days=1), day_of([4], DAY + datetime.timedelta(days=1)))
+        archive.write("a", "steps", DAY, day_of([5, 6]))
+        self.assertEqual(archive.read("a", "steps", DAY), day_of([5, 6]))
+        archive.compact("a", "steps", 2014)
+        self.assertEqual(archive.read("a", "steps", DAY), day_of([5, 6]))
+        self.assertEqual(archive.samples("a", "steps", DAY, DAY + datetime.timedelta(days=1)),
+                         day_of([5, 6]) + day_of([4], DAY + datetime.timedelta(days=1)))
+
+    def test_convert_csv_dump(self):
+        dump = os.path.join(self.directory, "dump")
+        day_directory = os.path.join(dump, "2014", str(DAY))
+        os.makedirs(day_directory)
+        steps = day_of([3, 0, 5])
+        pace = day_of([10.5, 11.0], minutes=1)
+        for name, data in (("steps", steps), ("Pace", pace)):
+            with open(os.path.join(day_directory, name + ".csv"), "w") as f:
+                f.write("\n".join("%s,%s" % sample for sample in data))
+        with open(os.path.join(day_directory, "sleep.csv"), "w") as f:
+            f.write("2014-05-16 00:00:00,None")
+        archive = self.archive()
+        skipped = []
+        self.assertEqual(convert_csv_dump(dump, archive, "a", skipped), 1)
+        self.assertEqual(archive.read("a", "steps", DAY), steps)
+        self.assertEqual(archive.read("a", "Pace", DAY), pace)
+        self.assertEqual([os.path.basename(path) for path, _ in skipped], ["sleep.csv"])
+        self.assertFalse(archive.has("a", "sleep", DAY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""ResponseCache and RequestMemo, and how their responses are accounted for"""
+import datetime
+import shutil
+import tempfile
+import time
+import unittest
+
+import fitbit
+from fitbit.fetch import run_parallel
+from fitbit.replay import SyntheticOpener
+
+DAY = datetime.date(2014, 5, 16)
+PATH = "/graph/getGraphData"
+
+
+class CountingOpener(SyntheticOpener):
+    """Counts the requests, and makes each one last delay seconds; the first failures ones fail"""
+
+    def __init__(self, delay=0.0, failures=0):
+        SyntheticOpener.__init__(self)
+        self.delay = delay
+        self.failures = failures
+        self.requests = 0
+
+    def open(self, request, *args, **kwargs):
+        self.requests += 1
+        time.sleep(self.delay)
+        if self.requests <= self.failures:
+            raise IOError("connection reset")
+        return SyntheticOpener.open(self, request, *args, **kwargs)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key_ignores_cache_busters(self):
+        key = fitbit.ResponseCache.key
+        self.assertEqual(key("GET", PATH, {"date": "2014-05-16", "ts": 1, "csrfToken": "a"}),
+                         key("GET", PATH, {"date": "2014-05-16", "ts": 2}))
+
+    def test_past_days_never_expire(self):
+        cache = fitbit.ResponseCache(self.directory, ttl=0)
+        past = {"date": str(DAY)}
+        today = {"date": str(datetime.date.today())}
+        cache.put("GET", PATH, past, b"past")
+        cache.put("GET", PATH, today, b"today")
+        self.assertEqual(cache.get("GET", PATH, past), b"past")
+        self.assertIsNone(cache.get("GET", PATH, today))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction(self):
+        cache = fitbit.ResponseCache(self.directory, max_bytes=2048)
+        for day in range(1, 11):
+            cache.put("GET", PATH, {"date": "2014-05-%02d" % day}, b"x" * 500)
+        self.assertLessEqual(cache.size(), 2048)
+        self.assertEqual(cache.get("GET", PATH, {"date": "2014-05-10"}), b"x" * 500)
+
+
+class AccountingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.metrics = fitbit.Metrics()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def client(self, opener):
+        client = fitbit.Client("user", opener)
+        client.retry_policy = None
+        client.instrumentation = self.metrics
+        self.events = []
+        self.metrics.callbacks = [self.events.append]
+        return client
+
+    def test_memoized_response(self):
+        opener = CountingOpener()
+        client = self.client(opener)
+        client.memo = fitbit.RequestMemo()
+        first = list(client.intraday_steps(DAY))
+        self.assertEqual(list(client.intraday_steps(DAY)), first)
+        self.assertEqual(opener.requests, 1)
+        self.assertEqual(client.memo.hits, 1)
+        self.assertEqual([(event.memoized, event.cached) for event in self.events], [(False, False), (True, False)])
+        stats = self.metrics.snapshot()["GET " + PATH]
+        self.assertEqual((stats["requests"], stats["memo_hits"], stats["cache_hits"]), (2, 1, 0))
+
+    def test_cached_response(self):
+        opener = CountingOpener()
+        client = self.client(opener)
+        client.cache = fitbit.ResponseCache(self.directory)
+        first = list(client.intraday_steps(DAY))
+        # A new memo, as in a new process: the response comes from the cache
+        client.memo = fitbit.RequestMemo()
+        self.assertEqual(list(client.intraday_steps(DAY)), first)
+        self.assertEqual(list(client.intraday_steps(DAY)), first)
+        self.assertEqual(opener.requests, 1)
+        self.assertEqual([(event.memoized, event.cached) for event in self.events],
+                         [(False, False), (False, True), (True, False)])
+        stats = self.metrics.snapshot()["GET " + PATH]
+        self.assertEqual((stats["memo_hits"], stats["cache_hits"]), (1, 1))
+
+    def test_identical_requests_share_one(self):
+        opener = CountingOpener(delay=0.2)
+        client = self.client(opener)
+        client.memo = fitbit.RequestMemo()
+        results = run_parallel([lambda: list(client.intraday_steps(DAY))] * 4)
+        self.assertEqual(opener.requests, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(client.memo.coalesced, 3)
+        # The requests that waited for the shared one did not open a connection
+        memoized = [event for event in self.events if event.memoized]
+        self.assertEqual(len(memoized), 3)
+        for event in memoized:
+            self.assertGreater(event.wait, 0.1)
+            self.assertLess(event.latency, 0.1)
+
+    def test_failed_shared_request(self):
+        opener = CountingOpener(delay=0.2, failures=1)
+        client = self.client(opener)
+        client.memo = fitbit.RequestMemo()
+
+        def fetch():
+            try:
+                return list(client.intraday_steps(DAY))
+            except IOError:
+                return None
+
+        results = run_parallel([fetch, fetch])
+        self.assertEqual(opener.requests, 2)
+        self.assertEqual(sorted(result is None for result in results), [False, True])
+        failed, = [event for event in self.events if event.error is not None]
+        self.assertIn("connection reset", failed.error)
+        # The request made after the failed one counts its wait apart from its own latency
+        retried, = [event for event in self.events if event.error is None]
+        self.assertFalse(retried.memoized)
+        self.assertGreater(retried.wait, 0.1)
+        self.assertLess(retried.latency, 0.35)
+        stats = self.metrics.snapshot()["GET " + PATH]
+        self.assertEqual((stats["requests"], stats["errors"], stats["memo_hits"]), (2, 1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Client requests against the synthetic and replayed responses of fitbit.replay"""
+import datetime
+import io
+import json
+import shutil
+import tempfile
+import unittest
+
+import fitbit
+from fitbit._lazy import LazyModule
+from fitbit.replay import RecordingOpener, ReplayOpener, ReplayResponse, SyntheticOpener
+from fitbit.retry import SessionExpired
+
+urllib_request = LazyModule("urllib.request", "urllib2")
+urllib_parse = LazyModule("urllib.parse", "urlparse")
+
+DAY = datetime.date(2014, 5, 16)
+
+LOGIN_PAGE = b'<form action="/login"><input type="hidden" name="_sourcePage" value="x"></form>'
+
+
+class ExpiringOpener(SyntheticOpener):
+    """Answers the POSTs made with another csrfToken than token with a 403 showing page"""
+
+    def __init__(self, token, page=LOGIN_PAGE):
+        SyntheticOpener.__init__(self)
+        self.token = token
+        self.page = page
+        self.posts = []
+
+    def open(self, request, *args, **kwargs):
+        if request.data:
+            form = dict(urllib_parse.parse_qsl(request.data.decode("utf8")))
+            self.posts.append(form)
+            if form["csrfToken"] != self.token:
+                raise urllib_request.HTTPError(request.get_full_url(), 403, "Forbidden", {}, io.BytesIO(self.page))
+        return SyntheticOpener.open(self, request, *args, **kwargs)
+
+
+class RedirectingOpener(SyntheticOpener):
+    """Answers the GETs with the login page, as fitbit.com does once the session expired"""
+
+    def open(self, request, *args, **kwargs):
+        if request.data:
+            return SyntheticOpener.open(self, request, *args, **kwargs)
+        return ReplayResponse(LOGIN_PAGE, "https://www.fitbit.com/login?redirect=%2Fgraph")
+
+
+class FailingOpener(SyntheticOpener):
+    """Answers the first failures requests with a 503"""
+
+    def __init__(self, failures):
+        SyntheticOpener.__init__(self)
+        self.failures = failures
+        self.requests = 0
+
+    def open(self, request, *args, **kwargs):
+        self.requests += 1
+        if self.requests <= self.failures:
+            raise urllib_request.HTTPError(request.get_full_url(), 503, "Unavailable", {}, io.BytesIO(b""))
+        return SyntheticOpener.open(self, request, *args, **kwargs)
+
+
+class ReloginTest(unittest.TestCase):
+
+    def test_expired_session_logs_in_again(self):
+        opener = ExpiringOpener("new")
+        client = fitbit.Client("user", opener, csrfToken="old")
+        client.reauthenticate = lambda: ("user", "new")
+        self.assertEqual(len(list(client.activity_logs(DAY))), 2)
+        # The form is posted again with the csrfToken of the new session
+        self.assertEqual([form["csrfToken"] for form in opener.posts], ["old", "new"])
+        self.assertEqual(client.csrfToken, "new")
+        json.loads(opener.posts[-1]["request"])
+
+    def test_forbidden_without_login_page_is_raised(self):
+        opener = ExpiringOpener("new", page=b'{"error": "forbidden"}')
+        client = fitbit.Client("user", opener, csrfToken="old")
+        logins = []
+        client.reauthenticate = lambda: logins.append(1) or ("user", "new")
+        with self.assertRaises(urllib_request.HTTPError) as raised:
+            client.activity_logs(DAY)
+        self.assertEqual(raised.exception.code, 403)
+        # The body is still readable by the caller
+        self.assertEqual(raised.exception.read(), b'{"error": "forbidden"}')
+        self.assertEqual(logins, [])
+
+    def test_logs_in_again_once(self):
+        client = fitbit.Client("user", ExpiringOpener("new"), csrfToken="old")
+        logins = []
+        client.reauthenticate = lambda: logins.append(1) or ("user", "still old")
+        with self.assertRaises(urllib_request.HTTPError) as raised:
+            client.activity_logs(DAY)
+        self.assertEqual(raised.exception.code, 403)
+        self.assertEqual(logins, [1])
+
+    def test_redirect_to_login_page_without_reauthenticate(self):
+        client = fitbit.Client("user", RedirectingOpener())
+        self.assertRaises(SessionExpired, client.intraday_steps, DAY)
+
+
+class RetryTest(unittest.TestCase):
+
+    def test_unavailable_is_retried(self):
+        opener = FailingOpener(2)
+        client = fitbit.Client("user", opener)
+        client.retry_policy = fitbit.RetryPolicy(retries=2, backoff=0)
+        events = []
+        client.instrumentation = events.append
+        self.assertEqual(len(list(client.intraday_steps(DAY))), 288)
+        self.assertEqual(opener.requests, 3)
+        self.assertEqual([event.retries for event in events], [2])
+
+    def test_gives_up_after_the_retries(self):
+        client = fitbit.Client("user", FailingOpener(3))
+        client.retry_policy = fitbit.RetryPolicy(retries=2, backoff=0)
+        with self.assertRaises(urllib_request.HTTPError) as raised:
+            client.intraday_steps(DAY)
+        self.assertEqual(raised.exception.code, 503)
+
+    def test_post_is_not_retried_on_server_error(self):
+        policy = fitbit.RetryPolicy()
+        self.assertTrue(policy.retryable(500, "GET"))
+        self.assertFalse(policy.retryable(500, "POST"))
+        self.assertTrue(policy.retryable(503, "POST"))
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_recorded_responses_are_replayed(self):
+        recording = RecordingOpener(SyntheticOpener(seed=3), self.directory)
+        client = fitbit.Client("user", recording)
+        steps = list(client.intraday_steps(DAY))
+        logs = list(client.activity_logs(DAY))
+        self.assertEqual(recording.recorded, 2)
+
+        replay = ReplayOpener(self.directory)
+        client = fitbit.Client("user", replay)
+        self.assertEqual(list(client.intraday_steps(DAY)), steps)
+        self.assertEqual(list(client.activity_logs(DAY)), logs)
+        self.assertEqual(replay.replayed, 2)
+        self.assertRaises(ValueError, client.intraday_steps, DAY + datetime.timedelta(days=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Leases, retries and failures of the fleet WorkQueue"""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from fitbit.fleet import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+START = datetime.date(2014, 1, 1)
+END = datetime.date(2014, 1, 31)
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = WorkQueue(os.path.join(self.directory, "queue.db"), lease_time=60.0, max_attempts=2,
+                               retry_delay=10.0)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def test_jobs(self):
+        self.assertEqual(self.queue.add("a", "steps", START, END, days_per_job=10), 4)
+        self.assertEqual(self.queue.add("a", "steps", START, END, days_per_job=10), 0)
+        job = self.queue.lease("worker", now=0)
+        self.assertEqual((job.start, job.end, job.attempts), (START, datetime.date(2014, 1, 10), 1))
+        # One job per account at a time
+        self.assertIsNone(self.queue.lease("other", now=0))
+        self.assertTrue(self.queue.complete(job))
+        self.assertEqual(self.queue.last_done("a", "steps"), datetime.date(2014, 1, 10))
+        self.assertEqual(self.queue.counts(), {PENDING: 3, LEASED: 0, DONE: 1, FAILED: 0})
+
+    def test_expired_lease(self):
+        self.queue.add("a", "steps", START, END)
+        job = self.queue.lease("worker", now=0)
+        self.assertTrue(self.queue.renew(job, now=50))
+        # Still held: renewed until 110
+        self.assertIsNone(self.queue.lease("other", now=100))
+        retried = self.queue.lease("other", now=111)
+        self.assertEqual((retried.id, retried.owner, retried.attempts), (job.id, "other", 2))
+        # The worker that lost the lease can no longer renew nor complete the job
+        self.assertFalse(self.queue.renew(job, now=112))
+        self.assertFalse(self.queue.complete(job))
+        # The second lease expires too: the job used up its attempts
+        self.assertIsNone(self.queue.lease("third", now=200))
+        self.assertEqual(self.queue.failures(), [("a", "steps", START, END, "lease expired")])
+        self.assertEqual(self.queue.unfinished(), 0)
+
+    def test_failed_job_waits_before_retry(self):
+        self.queue.add("a", "steps", START, END)
+        job = self.queue.lease("worker", now=0)
+        self.assertTrue(self.queue.fail(job, ValueError("boom"), now=0))
+        self.assertIsNone(self.queue.lease("worker", now=5))
+        job = self.queue.lease("worker", now=10)
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(self.queue.fail(job, ValueError("boom again"), now=10))
+        self.assertEqual(self.queue.failures(), [("a", "steps", START, END, "boom again")])
+
+    def test_requeue(self):
+        self.queue.add("a", "steps", START, END)
+        self.queue.complete(self.queue.lease("worker", now=0))
+        self.assertEqual(self.queue.add("a", "steps", START, END, requeue=True), 1)
+        self.assertEqual(self.queue.lease("worker", now=0).attempts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""SyncEngine planning, resuming and skipping of the empty days"""
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import fitbit
+from fitbit.ranges import date_span
+from fitbit.replay import ReplayResponse, SyntheticOpener
+
+START = datetime.date(2014, 3, 1)
+END = datetime.date(2014, 3, 31)
+# The first day with data of SparseOpener
+FIRST = datetime.date(2014, 3, 20)
+
+
+class SparseOpener(SyntheticOpener):
+    """Counts the requests; the daily totals are 0 before FIRST"""
+
+    def __init__(self):
+        SyntheticOpener.__init__(self)
+        self.requests = 0
+
+    def open(self, request, *args, **kwargs):
+        self.requests += 1
+        response = SyntheticOpener.open(self, request, *args, **kwargs)
+        if "/graph/getNewGraphData" not in request.get_full_url():
+            return response
+        data = json.loads(response.read().decode("utf8"))
+        for point in data["graph"]["dataSets"]["activity"]["dataPoints"]:
+            if point["dateTime"][:10] < str(FIRST):
+                point["value"] = 0
+        return ReplayResponse(json.dumps(data).encode("utf8"), response.geturl())
+
+
+class Sink(object):
+
+    def __init__(self):
+        self.days = []
+        self.flushed = 0
+
+    def __call__(self, account, metric, date, data):
+        self.days.append((metric, date))
+
+    def flush(self):
+        self.flushed += 1
+
+
+class SyncEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def engine(self, opener, sink, **kwargs):
+        client = fitbit.Client("user", opener)
+        return fitbit.SyncEngine(client, fitbit.SyncState(self.path), sink, **kwargs)
+
+    def test_second_run_fetches_nothing(self):
+        sink = Sink()
+        engine = self.engine(SyntheticOpener(), sink, metrics=["steps"], days_per_request=10)
+        self.assertEqual(engine.run(START, END), {"steps": 31})
+        self.assertEqual(sink.days, [("steps", date) for date in date_span(START, END)])
+        # The state was flushed then saved after each request
+        self.assertEqual(sink.flushed, 4)
+
+        opener = SparseOpener()
+        engine = self.engine(opener, Sink(), metrics=["steps"])
+        self.assertEqual(engine.plan(START, END), {"steps": []})
+        self.assertEqual(engine.run(START, END), {"steps": 0})
+        self.assertEqual(opener.requests, 0)
+        self.assertEqual(engine.state.high_water("user", "steps"), END)
+
+    def test_mutable_days_are_fetched_again(self):
+        today = datetime.date.today()
+        ago = lambda days: today - datetime.timedelta(days=days)
+        engine = self.engine(SyntheticOpener(), Sink(), metrics=["steps"])
+        # Fetched after it was over, but still mutable
+        engine.state.record("user", "steps", ago(1), fetched_at=datetime.datetime.combine(today, datetime.time(1)))
+        # Fetched before it was over
+        engine.state.record("user", "steps", ago(5), fetched_at=datetime.datetime.combine(ago(5), datetime.time(12)))
+        engine.state.record("user", "steps", ago(6))
+        self.assertEqual(engine.plan(ago(6), today), {"steps": [ago(5), ago(4), ago(3), ago(2), ago(1), today]})
+
+    def test_skip_empty(self):
+        sink = Sink()
+        opener = SparseOpener()
+        engine = self.engine(opener, sink, metrics=["sleep"], skip_empty=True)
+        self.assertEqual(engine.run(START, END), {"sleep": (END - FIRST).days + 1})
+        self.assertEqual([date for _, date in sink.days], list(date_span(FIRST, END)))
+        # The empty days are recorded: the next run does not look them up again
+        opener = SparseOpener()
+        engine = self.engine(opener, Sink(), metrics=["sleep"], skip_empty=True)
+        self.assertEqual(engine.plan(START, END), {"sleep": []})
+        self.assertEqual(engine.run(START, END), {"sleep": 0})
+        self.assertEqual(opener.requests, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()